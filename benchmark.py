@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the short truth table solver and the server's rendering of it.
+
+    python benchmark.py run --output before.json
+    python benchmark.py run --output after.json
+    python benchmark.py compare before.json after.json
+
+Each case is a generator of arguments that grow with a size, so that how the time, steps, peak memory and
+number of nodes scale can be tracked, not just how fast one argument is.
+"""
+
+from __future__ import unicode_literals
+import argparse
+import gc
+import io
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from forseti.formula import Symbol, Not, And, Or, If, Iff
+import shorttruthtables
+
+
+def balanced(connective, formulas):
+    """
+    Join the formulas with the binary connective as a balanced tree, so that wide formulas aren't also deep
+    :param connective:
+    :param formulas:
+    :return:
+    """
+    while len(formulas) > 1:
+        joined = []
+        for i in range(0, len(formulas) - 1, 2):
+            joined.append(connective(formulas[i], formulas[i + 1]))
+        if len(formulas) % 2 == 1:
+            joined.append(formulas[-1])
+        formulas = joined
+    return formulas[0]
+
+
+def if_chain(size):
+    """
+    Modus ponens ladder, A0, if(A0, A1), ..., if(An-1, An) |- An
+    :param size:
+    :return:
+    """
+    atoms = [Symbol("A" + str(i)) for i in range(size + 1)]
+    formulas = [atoms[0]]
+    for i in range(size):
+        formulas.append(If(atoms[i], atoms[i + 1]))
+    return formulas, atoms[-1]
+
+
+def wide_and(size):
+    """
+    One conjunction of every atom, and(and(A0, A1), ...) |- A0
+    :param size:
+    :return:
+    """
+    atoms = [Symbol("A" + str(i)) for i in range(size)]
+    return [balanced(And, atoms)], atoms[0]
+
+
+def wide_or(size):
+    """
+    Disjunctive syllogism over every atom, or(or(A0, A1), ...), not(A0), ..., not(An-1) |- An
+    :param size:
+    :return:
+    """
+    atoms = [Symbol("A" + str(i)) for i in range(size)]
+    return [balanced(Or, atoms)] + [Not(atom) for atom in atoms[:-1]], atoms[-1]
+
+
+def pigeonhole(size):
+    """
+    size + 1 pigeons can't each have their own hole out of size holes, so the premises prove anything. Only
+    solvable by searching, as no premise is forced by the others
+    :param size:
+    :return:
+    """
+    pigeons = [[Symbol("P" + str(i) + "H" + str(j)) for j in range(size)] for i in range(size + 1)]
+    formulas = [balanced(Or, holes) for holes in pigeons]
+    for j in range(size):
+        for i in range(size + 1):
+            for k in range(i + 1, size + 1):
+                formulas.append(Not(And(pigeons[i][j], pigeons[k][j])))
+    return formulas, Symbol("Z")
+
+
+def random_cnf(size, ratio=4.26, seed=0):
+    """
+    Random 3-CNF over size atoms near the satisfiability phase transition, valid for a fresh goal exactly when
+    the clauses are unsatisfiable
+    :param size:
+    :param ratio: clauses per atom
+    :param seed:
+    :return:
+    """
+    generator = random.Random(seed + size)
+    atoms = [Symbol("A" + str(i)) for i in range(size)]
+    formulas = []
+    for _ in range(int(round(size * ratio))):
+        literals = []
+        for atom in generator.sample(atoms, 3):
+            literals.append(Not(atom) if generator.random() < 0.5 else atom)
+        formulas.append(balanced(Or, literals))
+    return formulas, Symbol("Z")
+
+
+def nested_iff(size):
+    """
+    A0, ..., An |- iff(A0, iff(A1, ... iff(An-1, An)))
+    :param size:
+    :return:
+    """
+    atoms = [Symbol("A" + str(i)) for i in range(size + 1)]
+    goal = atoms[-1]
+    for atom in reversed(atoms[:-1]):
+        goal = Iff(atom, goal)
+    return atoms, goal
+
+
+def many_premises(size):
+    """
+    and(A0, B0), ..., and(An-1, Bn-1) |- or(A0, B0), many short premises each parsed (and cached) on their own
+    :param size:
+    :return:
+    """
+    formulas = [And(Symbol("A" + str(i)), Symbol("B" + str(i))) for i in range(size)]
+    return formulas, Or(Symbol("A0"), Symbol("B0"))
+
+
+# case name: (generator, default sizes, solver options the case needs)
+CASES = OrderedDict([
+    ("if_chain", (if_chain, [100, 1000, 10000], {})),
+    ("wide_and", (wide_and, [100, 1000, 10000], {})),
+    ("wide_or", (wide_or, [100, 1000, 10000], {})),
+    ("pigeonhole", (pigeonhole, [3, 4, 5], {"search": True})),
+    ("random_cnf", (random_cnf, [20, 40, 60], {"search": True})),
+    ("nested_iff", (nested_iff, [100, 1000, 10000], {})),
+    ("many_premises", (many_premises, [100, 1000, 10000], {})),
+])
+# fraction of parsing an argument from scratch that parsing it again may take, when it takes longer the parse
+# cache didn't hold on to the argument's formulas
+CACHED_PARSE_FRACTION = 0.5
+
+
+def count_nodes(table):
+    if hasattr(table, "nodes"):
+        return len(table.nodes)
+    return len(table.tag)
+
+
+def measure_solve(formulas, goal, repeat, options):
+    """
+    Solve the argument repeat times, taking the fastest time, and once more under tracemalloc for the peak memory
+    :param formulas:
+    :param goal:
+    :param repeat:
+    :param options: see shorttruthtables.runner
+    :return:
+    """
+    best = None
+    table = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        table = shorttruthtables.solve(formulas, goal, **options)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    gc.collect()
+    tracemalloc.start()
+    shorttruthtables.solve(formulas, goal, **options)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    counters = table.get_counters()
+    result = OrderedDict()
+    result["time"] = best
+    result["steps"] = table.count
+    result["nodes"] = count_nodes(table)
+    result["peak_memory"] = peak
+    result["contradiction"] = table.contradiction
+    # atoms matched to their symbol by text, and by identity as they were interned
+    result["symbol_lookups"] = counters["symbol_lookups"]
+    result["interned_lookups"] = counters["interned_lookups"]
+    return result
+
+
+def measure_parse(formulas, goal, repeat):
+    """
+    Time parsing the argument from the functional format, first with the parse cache emptied and then again with
+    every formula in it
+    :param formulas:
+    :param goal:
+    :param repeat:
+    :return:
+    """
+    texts = [shorttruthtables.functional_string(formula) for formula in formulas]
+    goal = shorttruthtables.functional_string(goal)
+    cold = None
+    warm = None
+    for _ in range(repeat):
+        shorttruthtables.PARSE_CACHE.clear()
+        gc.collect()
+        start = time.perf_counter()
+        shorttruthtables.parse_argument(texts, goal)
+        elapsed = time.perf_counter() - start
+        if cold is None or elapsed < cold:
+            cold = elapsed
+        start = time.perf_counter()
+        shorttruthtables.parse_argument(texts, goal)
+        elapsed = time.perf_counter() - start
+        if warm is None or elapsed < warm:
+            warm = elapsed
+
+    result = OrderedDict()
+    result["parse_time"] = cold
+    result["cached_parse_time"] = warm
+    return result
+
+
+def measure_render(client, formulas, goal, repeat):
+    """
+    Time posting the argument to the server's /submit, which solves and renders it
+    :param client: flask test client
+    :param formulas:
+    :param goal:
+    :param repeat:
+    :return:
+    """
+    data = {"formula[]": [shorttruthtables.functional_string(formula) for formula in formulas],
+            "goal": shorttruthtables.functional_string(goal)}
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        response = client.post("/submit", data=data)
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError("/submit failed with " + str(response.status_code))
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run(cases, sizes=None, repeat=3, options=None, render=False):
+    """
+    Run the benchmarks, yielding a result for each case and size as it finishes
+    :param cases: names of cases in CASES
+    :param sizes: sizes to use instead of each case's defaults
+    :param repeat: how many times to time each argument
+    :param options: extra options for shorttruthtables.runner
+    :param render: also time the server rendering each argument
+    :return:
+    """
+    client = None
+    if render:
+        import server
+        # measure the rendering, not the cache
+        server.FLASK_APP.config["RESULT_CACHE_SIZE"] = 0
+        client = server.FLASK_APP.test_client()
+
+    for name in cases:
+        generator, default_sizes, case_options = CASES[name]
+        case_options = dict(case_options, **(options or {}))
+        if case_options.get("compact"):
+            # compact tables only propagate, so the searching cases are measured getting stuck
+            case_options.pop("search", None)
+        if render:
+            server.FLASK_APP.config["SOLVER_OPTIONS"] = case_options
+        for size in sizes or default_sizes:
+            formulas, goal = generator(size)
+            result = OrderedDict()
+            result["case"] = name
+            result["size"] = size
+            result["options"] = case_options
+            result.update(measure_solve(formulas, goal, repeat, case_options))
+            result.update(measure_parse(formulas, goal, repeat))
+            if render:
+                result["render_time"] = measure_render(client, formulas, goal, repeat)
+            yield result
+
+
+def check_parse_cache(results, fraction=CACHED_PARSE_FRACTION, minimum=0.001):
+    """
+    Find the arguments that parsing again, with the parse cache warm, didn't speed up
+    :param results: results of a run
+    :param fraction: see CACHED_PARSE_FRACTION
+    :param minimum: seconds below which parse times are put down to noise
+    :return: list of (case, size, "cached_parse_time", parse time, cached parse time)
+    """
+    misses = []
+    for result in results:
+        if result["parse_time"] >= minimum and result["cached_parse_time"] > result["parse_time"] * fraction:
+            misses.append((result["case"], result["size"], "cached_parse_time", result["parse_time"],
+                           result["cached_parse_time"]))
+    return misses
+
+
+def compare(old, new, threshold=0.2, minimum=0.001):
+    """
+    Compare two runs, finding where the new run is slower or uses more memory by more than the threshold, takes
+    a different number of steps or nodes for the same argument, or wasn't sped up by the parse cache (see
+    check_parse_cache)
+    :param old: results of the earlier run
+    :param new: results of the later run
+    :param threshold: fraction a measurement may grow by before it is a regression
+    :param minimum: seconds below which differences in time are put down to noise
+    :return: list of (case, size, measurement, old value, new value)
+    """
+    def key(result):
+        return result["case"], result["size"], json.dumps(result["options"], sort_keys=True)
+
+    earlier = dict((key(result), result) for result in old)
+    regressions = []
+    for result in new:
+        if key(result) not in earlier:
+            continue
+        before = earlier[key(result)]
+        for measurement in ("time", "parse_time", "cached_parse_time", "render_time", "peak_memory"):
+            if measurement not in result or measurement not in before:
+                continue
+            if measurement != "peak_memory" and result[measurement] < minimum:
+                continue
+            if result[measurement] > before[measurement] * (1 + threshold):
+                regressions.append((result["case"], result["size"], measurement, before[measurement],
+                                    result[measurement]))
+        for measurement in ("steps", "nodes", "contradiction"):
+            if result[measurement] != before[measurement]:
+                regressions.append((result["case"], result["size"], measurement, before[measurement],
+                                    result[measurement]))
+    regressions.extend(check_parse_cache(new, minimum=minimum))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the short truth table solver")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    run_parser.add_argument("--sizes", nargs="+", type=int, help="Sizes to use instead of each case's defaults")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Times to solve each argument, keeping the best")
+    run_parser.add_argument("--engine", choices=shorttruthtables.ENGINES)
+    run_parser.add_argument("--share", action="store_true", help="Solve repeated subformulas only once")
+    run_parser.add_argument("--compact", action="store_true", help="Store the tables in flat arrays")
+    run_parser.add_argument("--render", action="store_true", help="Also time rendering through server.py")
+    run_parser.add_argument("--output", help="JSON file to write the results to")
+
+    compare_parser = commands.add_parser("compare", help="Flag regressions between two runs")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.2,
+                                help="Fraction a measurement may grow by before it is flagged")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with io.open(args.old, encoding="utf-8") as old, io.open(args.new, encoding="utf-8") as new:
+            regressions = compare(json.load(old)["results"], json.load(new)["results"], args.threshold)
+        for case, size, measurement, before, after in regressions:
+            print("%s %d: %s went from %s to %s" % (case, size, measurement, before, after))
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("No regressions")
+        return
+
+    options = {}
+    if args.engine is not None:
+        options["engine"] = args.engine
+    if args.share:
+        options["share_subformulas"] = True
+    if args.compact:
+        options["compact"] = True
+    # building and rendering the largest formulas still recurses in places (forseti, jinja)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+
+    results = []
+    for result in run(args.cases, args.sizes, args.repeat, options, args.render):
+        line = "%-13s %6d  %9.4fs  %7d steps  %7d nodes  %10d bytes  %9.4fs parse (%.4fs cached)" % (
+            result["case"], result["size"], result["time"], result["steps"], result["nodes"], result["peak_memory"],
+            result["parse_time"], result["cached_parse_time"])
+        if "render_time" in result:
+            line += "  %9.4fs render" % result["render_time"]
+        print(line)
+        results.append(result)
+    for case, size, _, parse_time, cached_parse_time in check_parse_cache(results):
+        print("%s %d: parsing again took %.4fs of %.4fs, the parse cache didn't hold the argument" % (
+            case, size, cached_parse_time, parse_time))
+
+    if args.output is not None:
+        report = OrderedDict()
+        report["python"] = platform.python_version()
+        report["platform"] = platform.platform()
+        report["date"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        report["results"] = results
+        with io.open(args.output, "w", encoding="utf-8") as output:
+            output.write(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,644 @@
+# -*- coding: utf-8 -*-
+"""
+Short Truth Tables stored in flat typed arrays with one slot per formula, instead of a ShortTruthTableFormula
+object per formula. It is solved the same way as ShortTruthTable (same steps, same contradictions) and exposes
+the same attributes through light views so that server.py and the command line can use either one
+"""
+
+from __future__ import unicode_literals
+from array import array
+from collections import OrderedDict
+import heapq
+import time
+from forseti.formula import Not, And, Or, If, Iff
+from shorttruthtables import is_atomic, symbol_key, BudgetExceeded, flatten as flatten_formula
+
+ATOM = 0
+NOT = 1
+AND = 2
+OR = 3
+IF = 4
+IFF = 5
+
+UNKNOWN = -1
+
+
+def get_tag(formula):
+    """
+    Get the connective tag stored for the formula
+    :param formula:
+    :return:
+    """
+    if is_atomic(formula):
+        return ATOM
+    elif isinstance(formula, Not):
+        return NOT
+    elif isinstance(formula, And):
+        return AND
+    elif isinstance(formula, Or):
+        return OR
+    elif isinstance(formula, If):
+        return IF
+    elif isinstance(formula, Iff):
+        return IFF
+    raise TypeError("Invalid Formula Type: " + str(type(formula)))
+
+
+def to_truth_value(value):
+    return None if value == UNKNOWN else value == 1
+
+
+class CompactFormulaException(Exception):
+    def __init__(self, index):
+        super(CompactFormulaException, self).__init__("Already set truth value")
+        self.index = index
+
+
+class CompactFormulaView(object):
+    def __init__(self, table, index, formula=None):
+        """
+        A ShortTruthTableFormula like view onto one slot of a CompactShortTruthTable
+        :param table:
+        :type table: CompactShortTruthTable
+        :param index:
+        :type index: int
+        :param formula: the forseti formula at the slot, worked out from the table if not given
+        """
+        self.table = table
+        self.index = index
+        self._formula = formula
+
+    @property
+    def formula(self):
+        if self._formula is None:
+            self._formula = self.table.get_formula(self.index)
+        return self._formula
+
+    @property
+    def parent(self):
+        parent = self.table.parent[self.index]
+        return None if parent < 0 else CompactFormulaView(self.table, parent)
+
+    @property
+    def children(self):
+        children = []
+        for position, child in enumerate(self.table.get_children(self.index)):
+            children.append(CompactFormulaView(self.table, child, self.formula.args[position]))
+        return children
+
+    @property
+    def truth_value(self):
+        return to_truth_value(self.table.value[self.index])
+
+    @property
+    def number(self):
+        number = self.table.step[self.index]
+        return None if number == 0 else number
+
+    def get_connective_values(self):
+        """
+        See ShortTruthTableFormula.get_connective_values
+        :return:
+        """
+        table = self.table
+        values = []
+        stack = [(self.index, False)]
+        while len(stack) > 0:
+            index, visited = stack.pop()
+            if visited or table.left[index] < 0:
+                number = table.step[index]
+                values.append([to_truth_value(table.value[index]), None if number == 0 else number])
+                continue
+            children = table.get_children(index)
+            for i in range(len(children) - 1, 0, -1):
+                stack.append((children[i], False))
+                stack.append((index, True))
+            if len(children) == 1:
+                stack.append((children[0], False))
+                stack.append((index, True))
+            else:
+                stack.append((children[0], False))
+        return values
+
+
+class CompactSymbolView(object):
+    def __init__(self, table, symbol):
+        """
+        A ShortTruthTableSymbol like view onto one symbol of a CompactShortTruthTable
+        :param table:
+        :type table: CompactShortTruthTable
+        :param symbol:
+        :type symbol: int
+        """
+        self.table = table
+        self.id = symbol
+        self.symbol = table.symbol_formulas[symbol]
+
+    @property
+    def formula(self):
+        source = self.table.symbol_source[self.id]
+        return None if source < 0 else CompactFormulaView(self.table, source)
+
+    @property
+    def truth_value(self):
+        return to_truth_value(self.table.symbol_value[self.id])
+
+    @property
+    def number(self):
+        number = self.table.symbol_step[self.id]
+        return None if number == 0 else number
+
+
+class CompactShortTruthTable(object):
+    def __init__(self, formulas, goal, hooks=None, budget=None, flatten=True):
+        """
+        Build and solve the table, see ShortTruthTable
+        :param formulas:
+        :type formulas: List[Formula]
+        :param goal:
+        :type goal: Formula
+        :param hooks:
+        :type hooks: shorttruthtables.SolverHooks
+        :param budget:
+        :type budget: shorttruthtables.Budget
+        :param flatten:
+        :type flatten: bool
+        """
+        self.basic_formulas = formulas
+        self.goal = goal
+        self.count = 1
+        self.hooks = hooks
+        self.symbol_lookups = 0
+        self.interned_lookups = 0
+        self.passes = 0
+        self.meter = None if budget is None else budget.start()
+        self.budget_exceeded = None
+        self.partial_assignment = None
+        self.built = False
+        # views onto the roots and symbols, made the first time they are asked for, see formulas and symbols
+        self.formula_views = None
+        self.symbol_views = None
+
+        if hooks is not None:
+            start = time.perf_counter()
+
+        # one slot per formula, numbered depth first (left to right) across every formula tree. Children are
+        # linked from the first (left) through each one's next sibling
+        self.tag = array('b')
+        self.left = array('i')
+        self.sibling = array('i')
+        self.arity = array('i')
+        self.parent = array('i')
+        self.atom = array('i')
+        self.roots = array('i')
+        if flatten:
+            self.root_formulas = [flatten_formula(formula) for formula in formulas] + [Not(flatten_formula(goal))]
+        else:
+            self.root_formulas = list(formulas) + [Not(goal)]
+
+        # one slot per symbol, with the slots of each symbol's occurrences in occurrences[start[i]:start[i + 1]]
+        self.symbol_formulas = []
+        self.symbol_map = {}
+        try:
+            self.break_apart_formulas()
+            self.built = True
+        except BudgetExceeded as e:
+            self.budget_exceeded = e.reason
+            self.symbol_order = list(range(len(self.symbol_formulas)))
+
+        size = len(self.tag)
+        self.value = array('b', [UNKNOWN]) * size
+        self.step = array('i', [0]) * size
+        # how many children of each slot are set to 1 and to 0
+        self.trues = array('i', [0]) * size
+        self.falses = array('i', [0]) * size
+        self.queued = bytearray(size)
+        self.symbol_value = array('b', [UNKNOWN]) * len(self.symbol_formulas)
+        self.symbol_step = array('i', [0]) * len(self.symbol_formulas)
+        self.symbol_source = array('i', [-1]) * len(self.symbol_formulas)
+        if hooks is not None:
+            hooks.phase("build", time.perf_counter() - start)
+            start = time.perf_counter()
+
+        self.queue = []
+        self.next_queue = []
+        self.cursor = None
+
+        self.countermodel = None
+        self.contradiction = False
+        self.contradiction_formula = None
+        self.contradiction_parent = None
+
+        try:
+            if self.built:
+                for root in self.roots:
+                    self.set_truth_value(root, 1)
+
+                self.evaluate_table()
+        except BudgetExceeded as e:
+            self.budget_exceeded = e.reason
+        except CompactFormulaException as e:
+            self.contradiction = True
+            self.contradiction_formula = CompactFormulaView(self, e.index)
+            root = e.index
+            while self.parent[root] >= 0:
+                root = self.parent[root]
+            self.contradiction_parent = CompactFormulaView(self, root)
+        if hooks is not None:
+            hooks.phase("propagate", time.perf_counter() - start)
+
+        self.unfulled_symbols = []
+        if not self.contradiction:
+            for symbol in self.symbol_order:
+                if self.symbol_value[symbol] == UNKNOWN:
+                    self.unfulled_symbols.append(CompactSymbolView(self, symbol))
+        if self.budget_exceeded is not None:
+            self.partial_assignment = OrderedDict()
+            for symbol in self.symbol_order:
+                if self.symbol_value[symbol] != UNKNOWN:
+                    self.partial_assignment[str(self.symbol_formulas[symbol])] = self.symbol_value[symbol] == 1
+        if hooks is not None:
+            hooks.finished(self, self.get_counters())
+
+    @property
+    def formulas(self):
+        # the roots don't change once the table is built and the views read their values from the table, so the
+        # same list is handed out every time, as the formulas of a ShortTruthTable are
+        if self.formula_views is None:
+            self.formula_views = []
+            for i in range(len(self.roots)):
+                self.formula_views.append(CompactFormulaView(self, self.roots[i], self.root_formulas[i]))
+        return self.formula_views
+
+    @property
+    def symbols(self):
+        if self.symbol_views is None:
+            self.symbol_views = [CompactSymbolView(self, symbol) for symbol in self.symbol_order]
+        return self.symbol_views
+
+    def get_counters(self):
+        """
+        See ShortTruthTable.get_counters
+        :return:
+        """
+        counters = OrderedDict()
+        counters["nodes"] = len(self.tag)
+        counters["steps"] = self.count - 1
+        counters["symbol_lookups"] = self.symbol_lookups
+        counters["interned_lookups"] = self.interned_lookups
+        counters["passes"] = self.passes
+        counters["contradictions"] = int(self.contradiction)
+        return counters
+
+    def break_apart_formulas(self):
+        """
+        Fill in the slots for every formula tree, and the occurrences of every symbol
+        :return:
+        """
+        # the child of each slot added most recently, to link the next one to
+        last = array('i')
+        # symbol of each atom object seen, by id, see ShortTruthTable.get_symbol. The root formulas keep the
+        # atoms alive, so their ids aren't reused
+        interned = {}
+        for root in self.root_formulas:
+            self.roots.append(len(self.tag))
+            stack = [(root, -1, 0)]
+            while len(stack) > 0:
+                formula, parent, position = stack.pop()
+                index = len(self.tag)
+                if parent >= 0:
+                    if position == 0:
+                        self.left[parent] = index
+                    else:
+                        self.sibling[last[parent]] = index
+                    last[parent] = index
+                tag = get_tag(formula)
+                self.tag.append(tag)
+                self.left.append(-1)
+                self.sibling.append(-1)
+                self.arity.append(0 if tag == ATOM else len(formula.args))
+                self.parent.append(parent)
+                last.append(-1)
+                if self.meter is not None:
+                    self.meter.node(len(self.tag))
+                if tag == ATOM:
+                    symbol = interned.get(id(formula))
+                    if symbol is not None:
+                        self.interned_lookups += 1
+                    else:
+                        key = symbol_key(formula)
+                        self.symbol_lookups += 1
+                        symbol = self.symbol_map.get(key)
+                        if symbol is None:
+                            symbol = len(self.symbol_formulas)
+                            self.symbol_map[key] = symbol
+                            self.symbol_formulas.append(formula)
+                        interned[id(formula)] = symbol
+                    self.atom.append(symbol)
+                else:
+                    self.atom.append(-1)
+                    for i in range(len(formula.args) - 1, -1, -1):
+                        stack.append((formula.args[i], index, i))
+
+        self.occurrence_start = array('i', [0]) * (len(self.symbol_formulas) + 1)
+        for symbol in self.atom:
+            if symbol >= 0:
+                self.occurrence_start[symbol + 1] += 1
+        for i in range(len(self.symbol_formulas)):
+            self.occurrence_start[i + 1] += self.occurrence_start[i]
+        self.occurrences = array('i', [0]) * self.occurrence_start[-1]
+        filled = array('i', self.occurrence_start[:-1])
+        for index in range(len(self.atom)):
+            symbol = self.atom[index]
+            if symbol >= 0:
+                self.occurrences[filled[symbol]] = index
+                filled[symbol] += 1
+
+        # ShortTruthTable lists its symbols breadth first per formula
+        self.symbol_order = []
+        seen = bytearray(len(self.symbol_formulas))
+        for root in self.roots:
+            broken_formula = [root]
+            i = 0
+            while i < len(broken_formula):
+                index = broken_formula[i]
+                i += 1
+                symbol = self.atom[index]
+                if symbol >= 0:
+                    if not seen[symbol]:
+                        seen[symbol] = 1
+                        self.symbol_order.append(symbol)
+                else:
+                    broken_formula.extend(self.get_children(index))
+
+    def get_children(self, index):
+        children = []
+        child = self.left[index]
+        while child >= 0:
+            children.append(child)
+            child = self.sibling[child]
+        return children
+
+    def get_unset_child(self, index):
+        child = self.left[index]
+        while child >= 0 and self.value[child] != UNKNOWN:
+            child = self.sibling[child]
+        return child
+
+    def get_formula(self, index):
+        """
+        Work out the forseti formula at a slot by walking down to it from the root of its tree
+        :param index:
+        :return:
+        """
+        path = []
+        while self.parent[index] >= 0:
+            parent = self.parent[index]
+            position = 0
+            child = self.left[parent]
+            while child != index:
+                child = self.sibling[child]
+                position += 1
+            path.append(position)
+            index = parent
+        formula = self.root_formulas[list(self.roots).index(index)]
+        for position in reversed(path):
+            formula = formula.args[position]
+        return formula
+
+    def set_truth_value(self, index, boolean):
+        """
+        See ShortTruthTable.set_truth_value, with 1 and 0 for True and False
+        :param index:
+        :param boolean:
+        :return:
+        """
+        value = self.value
+        if value[index] == boolean:
+            return False
+
+        # (slot, value, -1) to set a slot, (parent, -1, child) to update a parent for the child just set
+        pending = [(index, boolean, -1)]
+        while len(pending) > 0:
+            index, boolean, child = pending.pop()
+            if child >= 0:
+                boolean = self.update_parent(index, child)
+                if boolean != UNKNOWN:
+                    pending.append((index, boolean, -1))
+                continue
+            if value[index] == boolean:
+                continue
+            if value[index] != UNKNOWN:
+                raise CompactFormulaException(index)
+
+            value[index] = boolean
+            self.step[index] = self.count
+            parent = self.parent[index]
+            self.queue_formula(index)
+            if parent >= 0:
+                if boolean == 1:
+                    self.trues[parent] += 1
+                else:
+                    self.falses[parent] += 1
+                self.queue_formula(parent)
+            update_symbol = -1
+            symbol = self.atom[index]
+            if symbol >= 0 and self.symbol_value[symbol] != boolean:
+                self.symbol_lookups += 1
+                if self.symbol_value[symbol] != UNKNOWN:
+                    # like ShortTruthTableSymbol, the occurrence keeps the value it was just set to
+                    raise CompactFormulaException(index)
+                self.symbol_value[symbol] = boolean
+                self.symbol_step[symbol] = self.count
+                self.symbol_source[symbol] = index
+                update_symbol = symbol
+            self.count += 1
+            if self.meter is not None:
+                self.meter.step()
+
+            if parent >= 0:
+                pending.append((parent, UNKNOWN, index))
+            if update_symbol >= 0:
+                for i in range(self.occurrence_start[symbol + 1] - 1, self.occurrence_start[symbol] - 1, -1):
+                    pending.append((self.occurrences[i], boolean, -1))
+
+        return True
+
+    def update_parent(self, index, child):
+        """
+        See ShortTruthTable.update_parent
+        :param index:
+        :param child:
+        :return: the value the parent is forced to, UNKNOWN if it is not
+        """
+        tag = self.tag[index]
+        value = self.value
+        child_value = value[child]
+        if tag == NOT:
+            return 1 - child_value
+        elif tag == AND:
+            if self.falses[index] > 0:
+                return 0
+            elif self.trues[index] == self.arity[index]:
+                return 1
+            return UNKNOWN
+        elif tag == OR:
+            if self.trues[index] > 0:
+                return 1
+            elif self.falses[index] == self.arity[index]:
+                return 0
+            return UNKNOWN
+        left = self.left[index]
+        right = self.sibling[left]
+        first = left == child
+        other_value = value[right] if first else value[left]
+        if tag == IF:
+            antecedent, consequent = (child_value, other_value) if first else (other_value, child_value)
+            if antecedent == 0 or consequent == 1:
+                return 1
+            elif antecedent == 1 and consequent == 0:
+                return 0
+        elif tag == IFF:
+            if other_value != UNKNOWN:
+                return 1 if child_value == other_value else 0
+        return UNKNOWN
+
+    def queue_formula(self, index):
+        if self.queued[index] or self.cursor is None:
+            return
+        self.queued[index] = 1
+        if index > self.cursor:
+            heapq.heappush(self.queue, index)
+        else:
+            heapq.heappush(self.next_queue, index)
+
+    def evaluate_table(self):
+        """
+        See ShortTruthTable.evaluate_worklist
+        :return:
+        """
+        for index in range(len(self.queued)):
+            self.queued[index] = 1
+        self.queue = list(range(len(self.queued)))
+        self.next_queue = []
+        self.cursor = -1
+        self.passes += 1
+        can_evaluate = False
+        try:
+            while True:
+                if len(self.queue) == 0:
+                    if not can_evaluate or len(self.next_queue) == 0:
+                        break
+                    self.queue, self.next_queue = self.next_queue, []
+                    self.cursor = -1
+                    self.passes += 1
+                    can_evaluate = False
+                self.cursor = heapq.heappop(self.queue)
+                self.queued[self.cursor] = 0
+                evaluate = self.evaluate_node(self.cursor)
+                can_evaluate = evaluate or can_evaluate
+        finally:
+            self.cursor = None
+
+    def evaluate_node(self, index):
+        """
+        See ShortTruthTable.evaluate_node
+        :param index:
+        :return: whether anything was set
+        """
+        tag = self.tag[index]
+        value = self.value
+        node = value[index]
+        if tag == ATOM:
+            symbol_value = self.symbol_value[self.atom[index]]
+            if node == UNKNOWN and symbol_value != UNKNOWN:
+                self.set_truth_value(index, symbol_value)
+                return True
+            return False
+
+        left = self.left[index]
+        right = self.sibling[left]
+        first = value[left]
+        second = UNKNOWN if right < 0 else value[right]
+        change = False
+
+        if node == UNKNOWN:
+            if tag == NOT:
+                if first != UNKNOWN:
+                    self.set_truth_value(index, 1 - first)
+                    change = True
+            elif tag == AND:
+                if self.falses[index] > 0:
+                    self.set_truth_value(index, 0)
+                    change = True
+                elif self.trues[index] == self.arity[index]:
+                    self.set_truth_value(index, 1)
+                    change = True
+            elif tag == OR:
+                if self.trues[index] > 0:
+                    self.set_truth_value(index, 1)
+                    change = True
+                elif self.falses[index] == self.arity[index]:
+                    self.set_truth_value(index, 0)
+                    change = True
+            elif tag == IF:
+                if first == 1 and second == 0:
+                    self.set_truth_value(index, 0)
+                    change = True
+                elif first == 0 or second == 1:
+                    self.set_truth_value(index, 1)
+                    change = True
+            elif tag == IFF:
+                if first != UNKNOWN and first == second:
+                    self.set_truth_value(index, 1)
+                    change = True
+                elif first != UNKNOWN and second != UNKNOWN:
+                    self.set_truth_value(index, 0)
+                    change = True
+
+        node = value[index]
+        if node == UNKNOWN or self.trues[index] + self.falses[index] == self.arity[index]:
+            return change
+        first = value[left]
+        second = UNKNOWN if right < 0 else value[right]
+
+        if tag == NOT:
+            self.set_truth_value(left, 1 - node)
+        elif tag == AND:
+            if node == 1:
+                child = left
+                while child >= 0:
+                    self.set_truth_value(child, 1)
+                    child = self.sibling[child]
+            elif self.trues[index] == self.arity[index] - 1:
+                self.set_truth_value(self.get_unset_child(index), 0)
+            else:
+                return change
+        elif tag == OR:
+            if node == 0:
+                child = left
+                while child >= 0:
+                    self.set_truth_value(child, 0)
+                    child = self.sibling[child]
+            elif self.falses[index] == self.arity[index] - 1:
+                self.set_truth_value(self.get_unset_child(index), 1)
+            else:
+                return change
+        elif tag == IF:
+            if node == 0:
+                self.set_truth_value(left, 1)
+                self.set_truth_value(right, 0)
+            elif first == 1:
+                self.set_truth_value(right, 1)
+            elif second == 0:
+                self.set_truth_value(left, 0)
+            else:
+                return change
+        elif tag == IFF:
+            if first != UNKNOWN:
+                self.set_truth_value(right, first if node == 1 else 1 - first)
+            elif second != UNKNOWN:
+                self.set_truth_value(left, second if node == 1 else 1 - second)
+            else:
+                return change
+        return True
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn settings for serving server.py in production:
+
+    gunicorn -c gunicorn.conf.py server:FLASK_APP
+
+The app (with forseti and shorttruthtables) is imported and warmed up once in the master, and the workers forked
+from it share that. Each worker handles requests on a few threads and solves API requests on its own bounded
+pool (see SOLVE_THREADS in server.py). Settings can be changed through the STT_* environment variables
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("STT_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("STT_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+# threads handling requests in each worker, which mostly wait on the solve pool or send responses
+threads = int(os.environ.get("STT_THREADS", 8))
+preload_app = True
+# seconds a worker can go without answering before it is restarted, above the server's solve budget
+timeout = int(os.environ.get("STT_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+# restart workers now and then, so memory they've grown to doesn't stay with them
+max_requests = 10000
+max_requests_jitter = 1000
+# caps on the request line and headers, the body is capped by MAX_CONTENT_LENGTH in server.py
+limit_request_line = 8190
+limit_request_fields = 100
+limit_request_field_size = 8190
+accesslog = os.environ.get("STT_ACCESS_LOG")
+
+
+def when_ready(arbiter):
+    """
+    Warm up the preloaded app before the first workers are forked
+    """
+    import server
+    server.warm_up()
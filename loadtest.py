@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+Load test for the server's solving API, sending arguments from many threads at once and reporting the
+throughput and latency percentiles.
+
+    python loadtest.py --concurrency 16 --requests 2000
+    python loadtest.py --url http://127.0.0.1:8000 --endpoint jobs
+
+Without --url requests go straight to server.py through flask's test client in this process, a stand-in for a
+real server that measures the app (the solve pool, caches and solving) without the network or gunicorn.
+"""
+
+from __future__ import unicode_literals
+import argparse
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.request import Request, urlopen
+import benchmark
+import shorttruthtables
+
+# cases of benchmark.py and the sizes to take arguments from, small enough to be homework
+CASES = [("if_chain", [5, 10, 20]), ("wide_and", [5, 10, 20]), ("wide_or", [5, 10, 20]), ("nested_iff", [5, 10]),
+         ("pigeonhole", [2, 3])]
+# seconds between polls of a job
+POLL_INTERVAL = 0.01
+
+
+def make_arguments(count, seed=0):
+    """
+    Pick arguments from the benchmark cases, renaming symbols so that the result cache doesn't answer them all
+    :param count:
+    :param seed:
+    :return: list of {"premises": [...], "goal": "..."}
+    """
+    generator = random.Random(seed)
+    arguments = []
+    for _ in range(count):
+        name, sizes = generator.choice(CASES)
+        formulas, goal = benchmark.CASES[name][0](generator.choice(sizes))
+        names = {}
+        for formula in formulas + [goal]:
+            stack = [formula]
+            while len(stack) > 0:
+                formula = stack.pop()
+                if shorttruthtables.is_atomic(formula):
+                    names[shorttruthtables.symbol_key(formula)] = str(formula) + "x" + str(generator.randint(0, 99))
+                else:
+                    stack.extend(formula.args)
+        arguments.append({"premises": [shorttruthtables.functional_string(formula, names) for formula in formulas],
+                          "goal": shorttruthtables.functional_string(goal, names)})
+    return arguments
+
+
+class LocalClient(object):
+    def __init__(self):
+        """
+        Stand-in for a client of a real server, calling the app in this process
+        """
+        import server
+        self.client = server.FLASK_APP.test_client()
+
+    def post(self, path, data):
+        response = self.client.post(path, data=json.dumps(data), content_type="application/json")
+        return response.status_code, response.get_json()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_json()
+
+
+class HTTPClient(object):
+    def __init__(self, url):
+        """
+        Client of a server running at the given url
+        """
+        self.url = url.rstrip("/")
+
+    def send(self, request):
+        try:
+            response = urlopen(request, timeout=60)
+        except HTTPError as error:
+            response = error
+        with response:
+            return response.getcode(), json.loads(response.read().decode("utf-8"))
+
+    def post(self, path, data):
+        return self.send(Request(self.url + path, data=json.dumps(data).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"}))
+
+    def get(self, path):
+        return self.send(Request(self.url + path))
+
+
+def solve(client, endpoint, argument):
+    """
+    Solve one argument through the server, waiting for the job to finish when using jobs
+    :return: whether it was solved
+    """
+    if endpoint == "solve":
+        status, _ = client.post("/api/solve", argument)
+        return status == 200
+    status, job = client.post("/api/jobs", argument)
+    if status != 202:
+        return False
+    while True:
+        status, job = client.get("/api/jobs/" + job["id"])
+        if status != 200 or job["status"] in ("done", "error"):
+            return status == 200 and job["status"] == "done"
+        time.sleep(POLL_INTERVAL)
+
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run(make_client, arguments, concurrency, endpoint):
+    """
+    Solve every argument, from concurrency threads each with their own client
+    :param make_client: function making a client
+    :param arguments:
+    :param concurrency:
+    :param endpoint: "solve" or "jobs"
+    :return: the throughput and latencies
+    :rtype: collections.OrderedDict
+    """
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+    remaining = list(reversed(arguments))
+
+    def work():
+        client = make_client()
+        while True:
+            with lock:
+                if len(remaining) == 0:
+                    return
+                argument = remaining.pop()
+            start = time.perf_counter()
+            solved = solve(client, endpoint, argument)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if solved:
+                    latencies.append(elapsed)
+                else:
+                    failures[0] += 1
+
+    threads = [threading.Thread(target=work) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    result = OrderedDict()
+    result["requests"] = len(arguments)
+    result["failures"] = failures[0]
+    result["seconds"] = elapsed
+    result["throughput"] = len(latencies) / elapsed
+    result["p50"] = percentile(latencies, 0.5)
+    result["p99"] = percentile(latencies, 0.99)
+    result["max"] = latencies[-1] if len(latencies) > 0 else None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the short truth table server")
+    parser.add_argument("--url", help="Server to test, by default the app is called in this process")
+    parser.add_argument("--endpoint", choices=["solve", "jobs"], default="solve",
+                        help="Solve through /api/solve, or submit to /api/jobs and poll until done")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests to have in flight at once")
+    parser.add_argument("--requests", type=int, default=1000, help="Arguments to solve")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    arguments = make_arguments(args.requests, args.seed)
+    if args.url is None:
+        make_client = LocalClient
+    else:
+        make_client = lambda: HTTPClient(args.url)
+    result = run(make_client, arguments, args.concurrency, args.endpoint)
+    print("%d requests (%d failed) in %.2fs: %.1f requests/s, p50 %.1fms, p99 %.1fms, max %.1fms" % (
+        result["requests"], result["failures"], result["seconds"], result["throughput"], result["p50"] * 1000,
+        result["p99"] * 1000, result["max"] * 1000))
+
+
+if __name__ == "__main__":
+    main()
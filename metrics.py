@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Counters and latency histograms for the server, written out in the Prometheus text format for /metrics
+"""
+
+from __future__ import unicode_literals
+from collections import OrderedDict
+import threading
+from shorttruthtables import SolverHooks
+
+# upper bounds (in seconds) of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels):
+    return "{" + ",".join('%s="%s"' % (name, value) for name, value in labels) + "}" if len(labels) > 0 else ""
+
+
+class Histogram(object):
+    def __init__(self, buckets=BUCKETS):
+        """
+        Counts of observations falling in each bucket, with their sum
+        :param buckets: upper bounds of the buckets, in increasing order
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        """
+        :param name:
+        :param labels: list of (label, value) for this histogram
+        :return: lines of the text format
+        """
+        lines = []
+        total = 0
+        for i in range(len(self.buckets)):
+            total += self.counts[i]
+            lines.append("%s_bucket%s %d" % (name, format_labels(labels + [("le", repr(self.buckets[i]))]), total))
+        total += self.counts[-1]
+        lines.append("%s_bucket%s %d" % (name, format_labels(labels + [("le", "+Inf")]), total))
+        lines.append("%s_sum%s %r" % (name, format_labels(labels), self.sum))
+        lines.append("%s_count%s %d" % (name, format_labels(labels), total))
+        return lines
+
+
+class Metrics(object):
+    def __init__(self):
+        """
+        Every metric of one process, safe to share between threads
+        """
+        self.lock = threading.Lock()
+        # name: (help, type, {labels tuple: Histogram or number})
+        self.metrics = OrderedDict()
+
+    def declare(self, name, help_text, metric_type):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = (help_text, metric_type, OrderedDict())
+
+    def observe(self, name, value, **labels):
+        """
+        Add an observation to the histogram with the given labels
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.metrics[name][2]
+            if key not in values:
+                values[key] = Histogram()
+            values[key].observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.metrics[name][2]
+            values[key] = values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.metrics[name][2][key] = value
+
+    def render(self):
+        """
+        Get every metric in the Prometheus text format
+        :return:
+        :rtype: str
+        """
+        lines = []
+        with self.lock:
+            for name in self.metrics:
+                help_text, metric_type, values = self.metrics[name]
+                lines.append("# HELP %s %s" % (name, help_text))
+                lines.append("# TYPE %s %s" % (name, metric_type))
+                for key in values:
+                    if metric_type == "histogram":
+                        lines.extend(values[key].render(name, list(key)))
+                    else:
+                        lines.append("%s%s %s" % (name, format_labels(list(key)), values[key]))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHooks(SolverHooks):
+    def __init__(self, metrics):
+        """
+        Solver hooks recording each phase's time, and the solver counters, into the metrics
+        :param metrics:
+        :type metrics: Metrics
+        """
+        self.metrics = metrics
+
+    def phase(self, name, seconds):
+        self.metrics.observe("stt_phase_seconds", seconds, phase=name)
+
+    def finished(self, table, counters):
+        for name in counters:
+            self.metrics.increment("stt_solver_" + name + "_total", counters[name])
+
+
+def create_metrics():
+    """
+    Create the metrics of the server, declared up front so that /metrics lists them before they're first used
+    :return:
+    :rtype: Metrics
+    """
+    metrics = Metrics()
+    metrics.declare("stt_request_seconds", "Time to handle each request, by endpoint", "histogram")
+    metrics.declare("stt_phase_seconds", "Time spent in each phase of handling a request", "histogram")
+    metrics.declare("stt_solver_nodes_total", "Formula nodes built by the solver", "counter")
+    metrics.declare("stt_solver_steps_total", "Truth values set by the solver", "counter")
+    metrics.declare("stt_solver_symbol_lookups_total", "Symbols looked up by their text or updated by the solver",
+                    "counter")
+    metrics.declare("stt_solver_interned_lookups_total", "Atoms matched to their symbol by identity by the solver",
+                    "counter")
+    metrics.declare("stt_solver_passes_total", "Passes made over the formulas by the solver", "counter")
+    metrics.declare("stt_solver_contradictions_total", "Contradictions the solver ran into", "counter")
+    metrics.declare("stt_cache_events_total", "Result cache hits, misses and evictions", "counter")
+    metrics.declare("stt_cache_entries", "Solved arguments in the result cache", "gauge")
+    metrics.declare("stt_parse_cache_events_total", "Parse cache hits, misses and evictions", "counter")
+    metrics.declare("stt_parse_cache_entries", "Parsed formulas and atoms in the parse cache", "gauge")
+    metrics.declare("stt_parse_cache_nodes", "Rough total nodes of the formulas in the parse cache", "gauge")
+    return metrics
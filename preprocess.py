@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Simplifying an argument before its Short Truth Table is solved, and mapping what the table found back onto the
+argument as it was entered
+"""
+
+from __future__ import unicode_literals
+from collections import OrderedDict
+import copy
+import time
+from forseti.formula import Not, And, Or, If, Iff
+from shorttruthtables import MultiAnd, MultiOr, is_atomic, symbol_key, flatten, get_structure
+
+
+class Preprocessing(object):
+    def __init__(self, formulas, goal):
+        """
+        Simplify the argument: remove double negations, fold in the truth values of tautologies and
+        contradictions such as or(A, not(A)), merge repeated operands of an and (or), drop premises that are
+        tautologies, repeat another premise or follow from one directly, and fix each symbol that only appears
+        with one polarity to the truth value that can only help find a countermodel. The simplified argument has
+        a countermodel exactly when the original one does, and every node of it stands for a node of the original
+        :param formulas:
+        :type formulas: List[Formula]
+        :param goal:
+        :type goal: Formula
+        """
+        start = time.perf_counter()
+        self.original_formulas = [flatten(formula) for formula in formulas]
+        self.original_goal = flatten(goal)
+        # the roots of the original table, the premises and the negated goal
+        roots = self.original_formulas + [Not(self.original_goal)]
+
+        # a number for each distinct formula, (connective, numbers of the operands) or the atom: its number
+        self.interned = {}
+        # id of each simplified node: its number
+        self.keys = {}
+        # number of each negation: number of what it negates
+        self.negations = {}
+        # id of each simplified node: the original node it stands for, numbered as in get_structure
+        self.origin = {}
+
+        # name of each symbol in the order they first appear, and the truth value of those with only one polarity
+        self.symbols = []
+        self.pure_symbols = OrderedDict()
+        self.find_pure_symbols(roots)
+
+        simplified = [self.simplify(formula, 0) for formula in self.original_formulas]
+        goal = self.simplify(self.original_goal, 1)
+        if simplified.count(False) > 0 or isinstance(goal, bool):
+            # a formula that is always false (or a goal that never changes) is kept as it was entered, where the
+            # table could set its symbols differently to how they were fixed elsewhere, so don't fix any
+            self.pure_symbols.clear()
+            simplified = [self.simplify(formula, 0) for formula in self.original_formulas]
+            goal = self.simplify(self.original_goal, 1)
+
+        self.dropped_premises = 0
+        # index in roots of each root of the simplified table, and the original node of each of its positions
+        self.kept = []
+        self.positions = []
+        self.formulas = []
+        # premises (and later, anything that has to stay as it was entered) whose nodes are their own origins
+        fallback = set()
+        providers = {}
+        for i in range(len(simplified)):
+            if simplified[i] is False:
+                # leave the contradiction for the table to find
+                simplified[i] = self.original_formulas[i]
+                fallback.add(i)
+            elif simplified[i] is not True:
+                for fact in self.get_facts(simplified[i]):
+                    providers.setdefault(fact, []).append(i)
+        dropped = set()
+        for i in range(len(simplified)):
+            if simplified[i] is True:
+                dropped.add(i)
+            elif i not in fallback and self.is_implied(simplified, i, providers, dropped):
+                dropped.add(i)
+        for i in range(len(simplified)):
+            if i in dropped:
+                self.dropped_premises += 1
+                continue
+            self.kept.append(i)
+            self.formulas.append(simplified[i])
+            self.positions.append(self.get_positions(simplified[i], i in fallback))
+
+        self.kept.append(len(roots) - 1)
+        if isinstance(goal, bool):
+            self.goal = self.original_goal
+            self.positions.append(get_structure(roots[-1])[0])
+        else:
+            self.goal = goal
+            negated = Not(goal)
+            self.origin[id(negated)] = 0
+            self.positions.append(self.get_positions(negated, False))
+
+        self.original_nodes = [len(get_structure(root)[1]) for root in roots]
+        self.removed_nodes = sum(self.original_nodes)
+        for i in range(len(self.kept) - 1):
+            self.removed_nodes -= len(get_structure(self.formulas[i])[1])
+        self.removed_nodes -= len(get_structure(self.goal)[1]) + 1
+        self.seconds = time.perf_counter() - start
+
+    def find_pure_symbols(self, roots):
+        """
+        Find the polarity of every occurrence of each symbol in the roots, which are all set true
+        :param roots:
+        :return:
+        """
+        polarities = OrderedDict()
+        for root in roots:
+            # polarity is 1 where a formula is set true for the root to be, -1 where false, 0 where it can be both
+            stack = [(root, 1)]
+            while len(stack) > 0:
+                formula, polarity = stack.pop()
+                if is_atomic(formula):
+                    key = symbol_key(formula)
+                    if key not in polarities:
+                        self.symbols.append((key, str(formula)))
+                        polarities[key] = set()
+                    polarities[key].add(polarity)
+                elif isinstance(formula, Not):
+                    stack.append((formula.args[0], -polarity))
+                elif isinstance(formula, If):
+                    stack.append((formula.args[1], polarity))
+                    stack.append((formula.args[0], -polarity))
+                elif isinstance(formula, Iff):
+                    stack.append((formula.args[1], 0))
+                    stack.append((formula.args[0], 0))
+                else:
+                    for i in range(len(formula.args) - 1, -1, -1):
+                        stack.append((formula.args[i], polarity))
+        for key, name in self.symbols:
+            if polarities[key] == {1} or polarities[key] == {-1}:
+                self.pure_symbols[key] = polarities[key] == {1}
+
+    def simplify(self, formula, first_node):
+        """
+        Simplify a formula, building every node of the result anew so each can be mapped back to its origin
+        :param formula:
+        :param first_node: the number of the formula's node in its root
+        :return: the simplified formula, or True or False if it always has that truth value
+        """
+        results = []
+        node = first_node
+        stack = [(formula, None)]
+        while len(stack) > 0:
+            formula, number = stack.pop()
+            if number is None:
+                number = node
+                node += 1
+                if is_atomic(formula):
+                    results.append(self.simplify_atom(formula, number))
+                    continue
+                stack.append((formula, number))
+                for i in range(len(formula.args) - 1, -1, -1):
+                    stack.append((formula.args[i], None))
+            else:
+                args = results[len(results) - len(formula.args):]
+                del results[len(results) - len(formula.args):]
+                results.append(self.simplify_connective(formula, args, number))
+        return results[0]
+
+    def simplify_atom(self, formula, number):
+        key = symbol_key(formula)
+        if key in self.pure_symbols:
+            return self.pure_symbols[key]
+        return self.add_node(copy.copy(formula), ("atom",) + key, number)
+
+    def simplify_connective(self, formula, args, number):
+        """
+        :param formula: the original formula
+        :param args: its simplified operands
+        :param number: its node
+        :return:
+        """
+        if isinstance(formula, Not):
+            return self.negate(args[0], number)
+        elif isinstance(formula, And) or isinstance(formula, Or):
+            conjunction = isinstance(formula, And)
+            connective = And if conjunction else Or
+            # the truth value that decides an and (or) on its own
+            absorbing = not conjunction
+            operands = []
+            seen = set()
+            for arg in args:
+                if isinstance(arg, bool):
+                    if arg == absorbing:
+                        return absorbing
+                    continue
+                for operand in arg.args if isinstance(arg, connective) else [arg]:
+                    if self.keys[id(operand)] not in seen:
+                        seen.add(self.keys[id(operand)])
+                        operands.append(operand)
+            for operand in operands:
+                if self.negations.get(self.keys[id(operand)]) in seen:
+                    # A and not(A)
+                    return absorbing
+            if len(operands) == 0:
+                return not absorbing
+            elif len(operands) == 1:
+                return operands[0]
+            if len(operands) == 2:
+                simplified = connective(*operands)
+            else:
+                simplified = MultiAnd(*operands) if conjunction else MultiOr(*operands)
+            key = ("and" if conjunction else "or",) + tuple(self.keys[id(operand)] for operand in operands)
+            return self.add_node(simplified, key, number)
+        elif isinstance(formula, If):
+            antecedent, consequent = args
+            if antecedent is False or consequent is True:
+                return True
+            elif antecedent is True:
+                return consequent
+            elif consequent is False:
+                return self.negate(antecedent, number)
+            elif self.keys[id(antecedent)] == self.keys[id(consequent)]:
+                return True
+            return self.add_node(If(antecedent, consequent), ("if", self.keys[id(antecedent)],
+                                                              self.keys[id(consequent)]), number)
+        elif isinstance(formula, Iff):
+            left, right = args
+            if isinstance(left, bool) and isinstance(right, bool):
+                return left == right
+            elif isinstance(left, bool) or isinstance(right, bool):
+                value, other = (left, right) if isinstance(left, bool) else (right, left)
+                return other if value else self.negate(other, number)
+            elif self.keys[id(left)] == self.keys[id(right)]:
+                return True
+            elif self.negations.get(self.keys[id(left)]) == self.keys[id(right)] or \
+                    self.negations.get(self.keys[id(right)]) == self.keys[id(left)]:
+                return False
+            return self.add_node(Iff(left, right), ("iff", self.keys[id(left)], self.keys[id(right)]), number)
+        raise TypeError("Invalid Formula Type: " + str(type(formula)))
+
+    def negate(self, formula, number):
+        if isinstance(formula, bool):
+            return not formula
+        elif isinstance(formula, Not):
+            return formula.args[0]
+        negation = self.add_node(Not(formula), ("not", self.keys[id(formula)]), number)
+        self.negations[self.keys[id(negation)]] = self.keys[id(formula)]
+        return negation
+
+    def add_node(self, formula, key, number):
+        if key not in self.interned:
+            self.interned[key] = len(self.interned)
+        self.keys[id(formula)] = self.interned[key]
+        self.origin[id(formula)] = number
+        return formula
+
+    def get_facts(self, formula):
+        """
+        :return: numbers of the formula and, for an and, of each of its operands, which it makes true
+        """
+        facts = [self.keys[id(formula)]]
+        if isinstance(formula, And):
+            facts.extend(self.keys[id(operand)] for operand in formula.args)
+        return facts
+
+    def is_implied(self, simplified, i, providers, dropped):
+        """
+        Does another premise that is still kept make premise i true, by being it, having it as an operand of an
+        and, or being an operand of premise i when it is an or? Of two premises that are the same, the first is kept
+        """
+        key = self.keys[id(simplified[i])]
+        candidates = [key]
+        if isinstance(simplified[i], Or):
+            candidates.extend(self.keys[id(operand)] for operand in simplified[i].args)
+        for candidate in candidates:
+            for j in providers.get(candidate, []):
+                if j != i and j not in dropped and (self.keys[id(simplified[j])] != key or j < i):
+                    return True
+        return False
+
+    def get_positions(self, formula, original):
+        """
+        :param formula: a root of the simplified table
+        :param original: whether it was kept as it was entered, so each node is its own origin
+        :return: the original node of each position of the root's get_connective_values
+        """
+        nodes = get_structure(formula)[0]
+        if original:
+            return nodes
+        # the simplified nodes, in the order get_structure numbers them
+        order = []
+        stack = [formula]
+        while len(stack) > 0:
+            node = stack.pop()
+            order.append(self.origin[id(node)])
+            if not is_atomic(node):
+                stack.extend(reversed(node.args))
+        return [order[node] for node in nodes]
+
+    def restore(self, result):
+        """
+        Map a shorttruthtables.get_result of the simplified argument back onto the original one. Nodes that were
+        simplified away have no truth value, and symbols that are no longer in the argument are given the truth
+        value they were fixed to (or false, when any will do) in a countermodel
+        :param result:
+        :type result: dict
+        :return:
+        :rtype: dict
+        """
+        roots = self.original_formulas + [Not(self.original_goal)]
+        structures = [get_structure(root)[0] for root in roots]
+        restored = dict(result)
+        if result["formulas"] is not None:
+            restored["formulas"] = [[[None, None] for _ in structure] for structure in structures]
+            for i in range(len(self.kept)):
+                values = {}
+                for position in range(len(self.positions[i])):
+                    values[self.positions[i][position]] = result["formulas"][i][position]
+                structure = structures[self.kept[i]]
+                for position in range(len(structure)):
+                    if structure[position] in values:
+                        restored["formulas"][self.kept[i]][position] = list(values[structure[position]])
+        if result["contradiction_formula"] is not None:
+            restored["contradiction_formula"] = dict(result["contradiction_formula"])
+            root = result["contradiction_formula"]["root"]
+            node = self.positions[root][result["contradiction_formula"]["position"]]
+            restored["contradiction_formula"]["root"] = self.kept[root]
+            restored["contradiction_formula"]["position"] = structures[self.kept[root]].index(node)
+        if result["countermodel"] is not None:
+            restored["countermodel"] = OrderedDict(result["countermodel"])
+            for key, name in self.symbols:
+                if name not in restored["countermodel"]:
+                    restored["countermodel"][name] = self.pure_symbols.get(key, False)
+        if result["partial_assignment"] is not None:
+            restored["partial_assignment"] = OrderedDict(result["partial_assignment"])
+            for key, name in self.symbols:
+                if key in self.pure_symbols:
+                    restored["partial_assignment"][name] = self.pure_symbols[key]
+        restored["preprocessing"] = OrderedDict()
+        restored["preprocessing"]["removed_nodes"] = self.removed_nodes
+        restored["preprocessing"]["dropped_premises"] = self.dropped_premises
+        restored["preprocessing"]["pure_symbols"] = len(self.pure_symbols)
+        restored["preprocessing"]["seconds"] = self.seconds
+        return restored
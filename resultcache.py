@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded least recently used caches for solved Short Truth Tables, kept either in memory (per process) or in a
+sqlite file that every gunicorn worker can share
+"""
+
+from __future__ import unicode_literals
+from collections import OrderedDict
+import json
+import sqlite3
+import threading
+import time
+
+
+class LRUCache(object):
+    def __init__(self, size):
+        """
+        In memory cache, safe to share between threads. Each worker process has its own
+        :param size: most entries to keep, or with weighted entries the most total weight
+        :type size: int
+        """
+        self.size = size
+        self.entries = OrderedDict()
+        # weight of each entry, only kept for entries that weigh more than one
+        self.weights = {}
+        self.weight = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # move to the most recently used end
+            del self.entries[key]
+            self.entries[key] = value
+            return value
+
+    def put(self, key, value, weight=1):
+        """
+        :param key:
+        :param value:
+        :param weight: how much of the size the entry takes up, e.g. how big it is
+        :type weight: int
+        """
+        with self.lock:
+            if key in self.entries:
+                del self.entries[key]
+                self.weight -= self.weights.pop(key, 1)
+            self.entries[key] = value
+            if weight != 1:
+                self.weights[key] = weight
+            self.weight += weight
+            # the newest entry is kept even if it is too heavy to fit on its own
+            while self.weight > self.size and len(self.entries) > 1:
+                evicted, _ = self.entries.popitem(last=False)
+                self.weight -= self.weights.pop(evicted, 1)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.weights.clear()
+            self.weight = 0
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.entries), "weight": self.weight, "limit": self.size, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+class SqliteCache(object):
+    def __init__(self, path, size):
+        """
+        Cache in a sqlite database, shared by every thread and process that opens the same path. Values are
+        stored as JSON, and the hit, miss and eviction counts are kept in the database too
+        :param path:
+        :type path: str
+        :param size: most entries to keep
+        :type size: int
+        """
+        self.path = path
+        self.size = size
+        self.local = threading.local()
+        connection = self.connect()
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, used REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            for name in ("hits", "misses", "evictions"):
+                connection.execute("INSERT OR IGNORE INTO counters VALUES (?, 0)", (name,))
+
+    def connect(self):
+        """
+        Get this thread's connection, sqlite connections cannot be shared between threads
+        :return:
+        """
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        connection = self.connect()
+        with connection:
+            row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                connection.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+                return None
+            connection.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+            connection.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+        return json.loads(row[0], object_pairs_hook=OrderedDict)
+
+    def put(self, key, value):
+        connection = self.connect()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, json.dumps(value), time.time()))
+            count = connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.size:
+                connection.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)",
+                                   (count - self.size,))
+                connection.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'",
+                                   (count - self.size,))
+
+    def stats(self):
+        connection = self.connect()
+        stats = dict(connection.execute("SELECT name, value FROM counters").fetchall())
+        stats["size"] = connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        stats["limit"] = self.size
+        return stats
+
+
+def create_cache(size, path=None):
+    """
+    Create the cache for the given config, None if caching is turned off
+    :param size: most entries to keep, 0 to not cache
+    :param path: sqlite database to share the cache through, None to keep it in memory
+    :return:
+    """
+    if size <= 0:
+        return None
+    if path is None:
+        return LRUCache(size)
+    return SqliteCache(path, size)
@@ -1,12 +1,304 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-from flask import Flask, Markup, render_template, request
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import threading
+import time
+from flask import Flask, Markup, Response, g, jsonify, render_template, request
+from forseti.formula import Not
+import metrics
+import resultcache
 import shorttruthtables
+try:
+    import msgpack
+except ImportError:
+    # traces are only sent as JSON
+    msgpack = None
 
-TRUE_STRING = "<span class='truth' style='color: green;' id='#'>T</span>"
-FALSE_STRING = "<span class='truth' style='color: red;' id='#'>F</span>"
+BUDGET_REASONS = {"steps": "steps", "nodes": "formula size", "time": "time", "cancelled": "time"}
 FLASK_APP = Flask(__name__)
+# keyword arguments passed on to shorttruthtables.runner, e.g. {"compact": True} or {"flatten": False}
+FLASK_APP.config.setdefault("SOLVER_OPTIONS", {})
+# most solved arguments to cache (0 turns the cache off), and an optional sqlite file to share them between workers
+FLASK_APP.config.setdefault("RESULT_CACHE_SIZE", 256)
+FLASK_APP.config.setdefault("RESULT_CACHE_PATH", None)
+# worker processes each worker process keeps for /api/batch (None for one per core, 0 to solve in the request
+# thread), and the most arguments one batch may hold
+FLASK_APP.config.setdefault("BATCH_WORKERS", None)
+FLASK_APP.config.setdefault("BATCH_LIMIT", 1000)
+# most countermodels /api/countermodels streams for one argument
+FLASK_APP.config.setdefault("COUNTERMODEL_LIMIT", 10000)
+# most pretty printed rows (the text and the columns of its truth values) to keep, keyed by what was entered
+FLASK_APP.config.setdefault("LAYOUT_CACHE_SIZE", 1024)
+# smallest trace (in bytes) worth gzipping for clients that accept it
+FLASK_APP.config.setdefault("TRACE_GZIP_MINIMUM", 1024)
+# limits on solving each argument, see shorttruthtables.Budget, so that one huge argument can't hold up a worker
+FLASK_APP.config.setdefault("SOLVE_BUDGET", {"max_steps": 1000000, "max_nodes": 200000, "timeout": 10.0})
+# time requests and the phases of solving them for /metrics
+FLASK_APP.config.setdefault("COLLECT_METRICS", True)
+# threads each worker process solves API requests and jobs on, and how many more can wait for one before the
+# server answers 503
+FLASK_APP.config.setdefault("SOLVE_THREADS", 4)
+FLASK_APP.config.setdefault("SOLVE_QUEUE_LIMIT", 64)
+# most finished jobs to remember, and an optional sqlite file to share them between workers (needed with more than
+# one, as a job can be polled through any of them)
+FLASK_APP.config.setdefault("JOB_STORE_SIZE", 4096)
+FLASK_APP.config.setdefault("JOB_STORE_PATH", None)
+# largest request body accepted, answered with 413 past it. Flask has this key already, so it can't be defaulted
+FLASK_APP.config["MAX_CONTENT_LENGTH"] = 1024 * 1024
+
+RESULT_CACHE = None
+RESULT_CACHE_LOCK = threading.Lock()
+JOB_STORE = None
+# the solve pool of this process, the slots left in its queue, and the process it was made in
+SOLVE_POOL = None
+SOLVE_SLOTS = None
+SOLVE_POOL_PID = None
+SOLVE_POOL_LOCK = threading.Lock()
+# the process pool batches are solved on, and the process it was made in
+BATCH_POOL = None
+BATCH_POOL_PID = None
+BATCH_POOL_LOCK = threading.Lock()
+LAYOUT_CACHE = resultcache.LRUCache(FLASK_APP.config["LAYOUT_CACHE_SIZE"])
+METRICS = metrics.create_metrics()
+METRICS_HOOKS = metrics.MetricsHooks(METRICS)
+
+
+def get_result_cache():
+    """
+    Get the result cache, creating it from the config the first time it is needed
+    :return:
+    """
+    global RESULT_CACHE
+    with RESULT_CACHE_LOCK:
+        if RESULT_CACHE is None:
+            RESULT_CACHE = resultcache.create_cache(FLASK_APP.config["RESULT_CACHE_SIZE"],
+                                                    FLASK_APP.config["RESULT_CACHE_PATH"])
+        return RESULT_CACHE
+
+
+def get_job_store():
+    """
+    Get the store of jobs, creating it from the config the first time it is needed
+    :return:
+    """
+    global JOB_STORE
+    with RESULT_CACHE_LOCK:
+        if JOB_STORE is None:
+            JOB_STORE = resultcache.create_cache(FLASK_APP.config["JOB_STORE_SIZE"],
+                                                 FLASK_APP.config["JOB_STORE_PATH"])
+        return JOB_STORE
+
+
+def submit_solve(function, *args, **kwargs):
+    """
+    Run a solve on this process's solve pool. The pool is made the first time it is needed in each process, as
+    its threads don't survive gunicorn forking the workers
+    :param function:
+    :param args: passed on to the function
+    :param kwargs: passed on to the function
+    :return: the future of the solve, None if too many are already waiting
+    :rtype: concurrent.futures.Future
+    """
+    global SOLVE_POOL, SOLVE_SLOTS, SOLVE_POOL_PID
+    with SOLVE_POOL_LOCK:
+        if SOLVE_POOL is None or SOLVE_POOL_PID != os.getpid():
+            SOLVE_POOL = ThreadPoolExecutor(max_workers=FLASK_APP.config["SOLVE_THREADS"])
+            SOLVE_SLOTS = threading.BoundedSemaphore(FLASK_APP.config["SOLVE_THREADS"] +
+                                                     FLASK_APP.config["SOLVE_QUEUE_LIMIT"])
+            SOLVE_POOL_PID = os.getpid()
+        pool, slots = SOLVE_POOL, SOLVE_SLOTS
+    if not slots.acquire(False):
+        return None
+    future = pool.submit(function, *args, **kwargs)
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def get_batch_workers():
+    """
+    :return: how many processes batches are solved on, 0 to solve them in the request thread
+    """
+    workers = FLASK_APP.config["BATCH_WORKERS"]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def get_batch_pool():
+    """
+    Get this process's pool for solving batches, made the first time it is needed in each process (see
+    submit_solve) and kept for every batch after, so that a batch doesn't pay for starting its own processes
+    :return: the pool, None if batches are solved in the request thread
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+    global BATCH_POOL, BATCH_POOL_PID
+    if get_batch_workers() == 0:
+        return None
+    with BATCH_POOL_LOCK:
+        if BATCH_POOL is None or BATCH_POOL_PID != os.getpid():
+            BATCH_POOL = ProcessPoolExecutor(max_workers=get_batch_workers())
+            BATCH_POOL_PID = os.getpid()
+        return BATCH_POOL
+
+
+@atexit.register
+def shutdown_batch_pool():
+    # a pool made before gunicorn forked belongs to the master
+    if BATCH_POOL is not None and BATCH_POOL_PID == os.getpid():
+        BATCH_POOL.shutdown(wait=False, cancel_futures=True)
+
+
+def busy_response():
+    response = jsonify(error="The server is busy, try again shortly")
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+def warm_up():
+    """
+    Load and run everything a request needs (forseti's parser, the solver and its search, the templates) once, so
+    that under gunicorn it is done in the master before the workers are forked rather than in each worker
+    :return:
+    """
+    shorttruthtables.solve_report(["if(A, B)", "A"], "B")
+    shorttruthtables.solve_report(["or(A, B)"], "A", search=True)
+    for name in ("index.html", "table.html", "error.html", "form.html"):
+        FLASK_APP.jinja_env.get_template(name)
+
+
+def parse_argument(formulas, goal):
+    """
+    Parse an argument as it is solved, see shorttruthtables.parse_argument
+    :param formulas:
+    :param goal:
+    :return:
+    """
+    return shorttruthtables.parse_argument(formulas, goal, FLASK_APP.config["SOLVER_OPTIONS"].get("flatten", True))
+
+
+def get_solver_options():
+    """
+    Get the options to solve with, adding the budget and the metrics hooks if they are being collected
+    :return:
+    """
+    options = dict(FLASK_APP.config["SOLVER_OPTIONS"])
+    if FLASK_APP.config["SOLVE_BUDGET"] is not None:
+        options["budget"] = shorttruthtables.Budget(**FLASK_APP.config["SOLVE_BUDGET"])
+    if FLASK_APP.config["COLLECT_METRICS"]:
+        options["hooks"] = METRICS_HOOKS
+    return options
+
+
+def observe_phase(name, start):
+    """
+    Record the time since start as the given phase, if metrics are being collected
+    :param name:
+    :param start: time.perf_counter() when the phase started
+    :return:
+    """
+    if FLASK_APP.config["COLLECT_METRICS"]:
+        METRICS.observe("stt_phase_seconds", time.perf_counter() - start, phase=name)
+
+
+def solve_argument(formulas, goal, canonical=None):
+    """
+    Solve the parsed argument, through the result cache if it is turned on. Cached arguments are solved with
+    their symbols renamed, so that the same homework entered with other names or spacing is only solved once
+    :param formulas:
+    :param goal:
+    :param canonical: the argument's shorttruthtables.CanonicalArgument, if already made
+    :return: shorttruthtables.get_result of the table, with the symbols of the given argument
+    """
+    options = get_solver_options()
+    cache = get_result_cache()
+    if cache is None:
+        return shorttruthtables.get_result(shorttruthtables.solve(formulas, goal, **options))
+
+    if canonical is None:
+        canonical = shorttruthtables.CanonicalArgument(formulas, goal)
+    key = canonical.key + " " + json.dumps(FLASK_APP.config["SOLVER_OPTIONS"], sort_keys=True)
+    result = cache.get(key)
+    if result is None:
+        result = shorttruthtables.get_result(shorttruthtables.solve(canonical.formulas, canonical.goal, **options))
+        if result["budget_exceeded"] is None:
+            cache.put(key, result)
+    return canonical.restore(result)
+
+
+def get_layout(text, formula):
+    """
+    Get the pretty printed formula and the columns of its truth values, see shorttruthtables.pretty_layout
+    :param text: what was entered for the formula, to cache the layout by
+    :param formula: the parsed formula
+    :return:
+    """
+    # an unflattened formula is laid out with its nested and/or, unlike the same text flattened
+    key = text if FLASK_APP.config["SOLVER_OPTIONS"].get("flatten", True) else (text, False)
+    layout = LAYOUT_CACHE.get(key)
+    if layout is None:
+        layout = shorttruthtables.pretty_layout(formula)
+        LAYOUT_CACHE.put(key, layout)
+    return layout
+
+
+def get_argument_trace(texts, goal_text, formulas, goal, result):
+    """
+    Get the trace of a solved argument, see shorttruthtables.get_trace
+    :param texts: what was entered for each premise
+    :param goal_text: what was entered for the goal
+    :param formulas: the parsed premises
+    :param goal: the parsed goal
+    :param result: see solve_argument
+    :return:
+    """
+    roots = formulas + [Not(goal)]
+    texts = texts + ["not(" + goal_text + ")"]
+    layouts = [get_layout(texts[i], roots[i]) for i in range(len(roots))]
+    return shorttruthtables.get_trace(roots, result, layouts)
+
+
+def get_trace_etag(canonical, representation):
+    """
+    Get the ETag of an argument's trace, which only changes with the canonical argument (and how it maps back onto
+    the symbols entered), the solver options, the trace format and how it is sent
+    :param canonical:
+    :type canonical: shorttruthtables.CanonicalArgument
+    :param representation: the format and encoding the trace is sent in
+    :return:
+    """
+    names = sorted((canonical.names[key], str(canonical.symbols[canonical.names[key]])) for key in canonical.names)
+    parts = [str(shorttruthtables.TRACE_VERSION), representation, canonical.key, json.dumps(names),
+             json.dumps(FLASK_APP.config["SOLVER_OPTIONS"], sort_keys=True)]
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+@FLASK_APP.before_request
+def start_timer():
+    g.start = time.perf_counter()
+
+
+@FLASK_APP.before_request
+def limit_content_length():
+    # werkzeug only holds form data to MAX_CONTENT_LENGTH, so JSON bodies are checked here
+    limit = FLASK_APP.config["MAX_CONTENT_LENGTH"]
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        return jsonify(error="The request is too large"), 413
+
+
+@FLASK_APP.after_request
+def observe_request(response):
+    if FLASK_APP.config["COLLECT_METRICS"] and "start" in g:
+        METRICS.observe("stt_request_seconds", time.perf_counter() - g.start, endpoint=request.endpoint)
+    return response
 
 
 @FLASK_APP.route("/")
@@ -28,69 +320,224 @@ def generate_table():
     form = Markup(render_template('form.html', formulas=formulas, goal=goal))
 
     try:
-        table = shorttruthtables.runner(formulas, goal)
+        start = time.perf_counter()
+        parsed_formulas, parsed_goal = parse_argument(formulas, goal)
+        observe_phase("parse", start)
+        result = solve_argument(parsed_formulas, parsed_goal)
     except (SyntaxError, TypeError) as exception:
         return render_template('error.html', error=str(exception), form=form)
+    if result["budget_exceeded"] is not None:
+        return render_template('error.html', form=form,
+                               error="Gave up solving the argument, it went over the server's limit on " +
+                                     BUDGET_REASONS[result["budget_exceeded"]])
+
+    start = time.perf_counter()
+    # the table is drawn from the trace in the browser
+    trace = get_argument_trace(formulas, goal, parsed_formulas, parsed_goal, result)
+    page = render_template('table.html', form=form, trace=trace)
+    observe_phase("render", start)
+    return page
+
+
+@FLASK_APP.route("/api/solve", methods=['POST'])
+def solve_api():
+    """
+    Solve one argument given as {"premises": [...], "goal": "..."}, see shorttruthtables.solve_report
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Expected a JSON object with premises and goal"), 400
+    future = submit_solve(shorttruthtables.solve_report, data.get("premises", []), data.get("goal"),
+                          **get_solver_options())
+    if future is None:
+        return busy_response()
+    try:
+        return jsonify(future.result())
+    except (SyntaxError, TypeError) as exception:
+        return jsonify(error=str(exception)), 400
+
+
+def run_job(job_id, premises, goal, options):
+    """
+    Solve the argument of a job on the solve pool, storing how it went
+    """
+    store = get_job_store()
+    store.put(job_id, OrderedDict([("id", job_id), ("status", "running")]))
+    job = OrderedDict([("id", job_id)])
+    try:
+        report = shorttruthtables.solve_report(premises, goal, **options)
+        job["status"] = "done"
+        job["result"] = report
+    except (SyntaxError, TypeError, ValueError) as exception:
+        job["status"] = "error"
+        job["error"] = str(exception)
+    store.put(job_id, job)
+
+
+@FLASK_APP.route("/api/jobs", methods=['POST'])
+def submit_job_api():
+    """
+    Queue {"premises": [...], "goal": "..."} to be solved without keeping the request open, answering 202 with
+    the job's "id" straight away. Poll /api/jobs/<id> for its "status" ("queued", "running", "done" with the
+    solve_report as "result", or "error")
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Expected a JSON object with premises and goal"), 400
+    try:
+        # only parsed here so a bad formula is answered at once, the job gets them from the parse cache
+        parse_argument(data.get("premises", []), data.get("goal"))
+    except (SyntaxError, TypeError) as exception:
+        return jsonify(error=str(exception)), 400
+
+    job_id = uuid.uuid4().hex
+    store = get_job_store()
+    store.put(job_id, OrderedDict([("id", job_id), ("status", "queued")]))
+    if submit_solve(run_job, job_id, data.get("premises", []), data.get("goal"), get_solver_options()) is None:
+        store.put(job_id, OrderedDict([("id", job_id), ("status", "error"), ("error", "The server is busy")]))
+        return busy_response()
+    response = jsonify(id=job_id, status="queued")
+    response.status_code = 202
+    response.headers["Location"] = "/api/jobs/" + job_id
+    return response
+
+
+@FLASK_APP.route("/api/jobs/<job_id>")
+def job_api(job_id):
+    """
+    The status of a job, and its result once it is done
+    """
+    job = get_job_store().get(job_id)
+    if job is None:
+        return jsonify(error="No such job, it may have been forgotten"), 404
+    return jsonify(job)
 
-    pretty = []
-    truthy = []
-    for formula in table.formulas:
-        pretty_formula = shorttruthtables.pretty_print(formula.formula)
-        truth_values = formula.get_connective_values()
-        truth_formula = u""
-        idx = 0
-        seen_string = False
-        for i in range(len(pretty_formula)):
-            if shorttruthtables.is_connective(pretty_formula[i]):
-                if truth_values[idx][0] is True:
-                    truth_formula += TRUE_STRING.replace("#", str(truth_values[idx][1]))
-                elif truth_values[idx][0] is False:
-                    truth_formula += FALSE_STRING.replace("#", str(truth_values[idx][1]))
-                else:
-                    truth_formula += "&nbsp;"
-                seen_string = False
-                idx += 1
-            elif pretty_formula[i].isalnum() and not seen_string:
-                if truth_values[idx][0] is True:
-                    truth_formula += TRUE_STRING.replace("#", str(truth_values[idx][1]))
-                elif truth_values[idx][0] is False:
-                    truth_formula += FALSE_STRING.replace("#", str(truth_values[idx][1]))
-                else:
-                    truth_formula += "&nbsp;"
-                seen_string = True
-                idx += 1
-            else:
-                if pretty_formula[i] == " ":
-                    seen_string = False
-                truth_formula += "&nbsp;"
-        pretty.append(pretty_formula)
-        truthy.append(Markup(truth_formula))
-
-    if table.contradiction:
-        parent_formula = shorttruthtables.pretty_print(table.contradiction_parent.formula)
-        contradiction_formula = shorttruthtables.pretty_print(table.contradiction_formula.formula)
-        if not table.contradiction_formula.truth_value:
-            formula_truth = "<span style='color: green;'>True</span>"
-            actual_truth = "<span style='color: red;'>False</span>"
-        else:
-            formula_truth = "<span style='color: red;'>False</span>"
-            actual_truth = "<span style='color: green;'>True</span>"
-        formula_truth = Markup(formula_truth)
-        actual_truth = Markup(actual_truth)
+
+@FLASK_APP.route("/api/batch", methods=['POST'])
+def batch_api():
+    """
+    Solve {"arguments": [{"premises": [...], "goal": "..."}, ...]}, optionally with "timeout" (seconds per
+    argument, past which its result has "budget_exceeded") and "ordered" (false to list results as they finish).
+    Each result has the "index" of its argument, and arguments that could not be solved get an "error" instead of
+    failing the whole batch
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("arguments"), list):
+        return jsonify(error="Expected a JSON object with a list of arguments"), 400
+    if len(data["arguments"]) > FLASK_APP.config["BATCH_LIMIT"]:
+        return jsonify(error="At most %d arguments can be solved at once" % FLASK_APP.config["BATCH_LIMIT"]), 400
+    timeout = data.get("timeout")
+    if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+        return jsonify(error="Expected a number of seconds for timeout"), 400
+
+    options = get_solver_options()
+    # the metrics hooks are in this process, the pool's processes have nothing to report them to
+    options.pop("hooks", None)
+    if timeout is not None:
+        limits = dict(FLASK_APP.config["SOLVE_BUDGET"] or {})
+        limits["timeout"] = min(timeout, limits.get("timeout") or timeout)
+        options["budget"] = shorttruthtables.Budget(**limits)
+    results = shorttruthtables.solve_many(data["arguments"], workers=get_batch_workers(),
+                                          ordered=data.get("ordered", True), executor=get_batch_pool(), **options)
+    return jsonify(results=list(results))
+
+
+@FLASK_APP.route("/api/trace")
+def trace_api():
+    """
+    Trace of solving the argument given as ?premise=...&premise=...&goal=..., see shorttruthtables.get_trace.
+    It is sent with an ETag, so a client that already has it gets a 304 for If-None-Match without the argument
+    being solved again. Sent as msgpack if the client prefers it (and it is installed), and gzipped if accepted
+    """
+    texts = [text.strip() for text in request.args.getlist("premise") if len(text.strip()) > 0]
+    goal_text = request.args.get("goal")
+    try:
+        formulas, goal = parse_argument(texts, goal_text)
+    except (SyntaxError, TypeError) as exception:
+        return jsonify(error=str(exception)), 400
+
+    use_msgpack = msgpack is not None and request.accept_mimetypes.best_match(
+        ["application/json", "application/msgpack"]) == "application/msgpack"
+    use_gzip = request.accept_encodings["gzip"] > 0
+    representation = ("msgpack" if use_msgpack else "json") + ("+gzip" if use_gzip else "")
+    canonical = shorttruthtables.CanonicalArgument(formulas, goal)
+    etag = get_trace_etag(canonical, representation)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    result = solve_argument(formulas, goal, canonical)
+    trace = get_argument_trace(texts, goal_text, formulas, goal, result)
+    if use_msgpack:
+        response = Response(msgpack.packb(trace), mimetype="application/msgpack")
     else:
-        parent_formula = None
-        contradiction_formula = None
-        formula_truth = ""
-        actual_truth = ""
-
-    symbols = []
-    for symbol in table.unfulled_symbols:
-        symbols.append(shorttruthtables.pretty_print(symbol.symbol))
-
-    return render_template('table.html', form=form, contradiction=table.contradiction, step=table.count,
-                           parent_formula=parent_formula, formula=contradiction_formula,
-                           formula_truth=formula_truth, actual_truth=actual_truth, formulas=pretty, truths=truthy,
-                           symbols=symbols)
+        response = Response(json.dumps(trace, separators=(",", ":")), mimetype="application/json")
+    if use_gzip and response.content_length >= FLASK_APP.config["TRACE_GZIP_MINIMUM"]:
+        response.set_data(gzip.compress(response.get_data()))
+        response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept")
+    response.vary.add("Accept-Encoding")
+    if result["budget_exceeded"] is None:
+        # always checked with the server, which is cheap as it only has to parse the argument to answer
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+    return response
+
+
+@FLASK_APP.route("/api/countermodels", methods=['POST'])
+def countermodels_api():
+    """
+    Stream every countermodel of {"premises": [...], "goal": "..."} (or the first "limit" of them) as JSON lines,
+    one {"index": ..., "countermodel": {...}} per line as each is found. If the solve budget runs out part way,
+    the last line is {"budget_exceeded": ...} instead
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Expected a JSON object with premises and goal"), 400
+    limit = data.get("limit", FLASK_APP.config["COUNTERMODEL_LIMIT"])
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 0:
+        return jsonify(error="Expected a limit of zero or more"), 400
+    limit = min(limit, FLASK_APP.config["COUNTERMODEL_LIMIT"])
+    try:
+        # parsed here so that a bad formula is an error response rather than a broken stream, the stream then
+        # gets them from the parse cache
+        parse_argument(data.get("premises", []), data.get("goal"))
+    except (SyntaxError, TypeError) as exception:
+        return jsonify(error=str(exception)), 400
+
+    options = get_solver_options()
+
+    def generate():
+        index = 0
+        try:
+            for countermodel in shorttruthtables.countermodels(data.get("premises", []), data.get("goal"), limit,
+                                                               **options):
+                yield json.dumps(OrderedDict([("index", index), ("countermodel", countermodel)])) + "\n"
+                index += 1
+        except shorttruthtables.BudgetExceeded as exception:
+            yield json.dumps({"budget_exceeded": exception.reason}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+@FLASK_APP.route("/metrics")
+def metrics_page():
+    """
+    Request and solver metrics of this process in the Prometheus text format
+    """
+    cache = get_result_cache()
+    if cache is not None:
+        stats = cache.stats()
+        for event in ("hits", "misses", "evictions"):
+            METRICS.set("stt_cache_events_total", stats[event], event=event)
+        METRICS.set("stt_cache_entries", stats["size"])
+    stats = shorttruthtables.PARSE_CACHE.stats()
+    for event in ("hits", "misses", "evictions"):
+        METRICS.set("stt_parse_cache_events_total", stats[event], event=event)
+    METRICS.set("stt_parse_cache_entries", stats["size"])
+    METRICS.set("stt_parse_cache_nodes", stats["weight"])
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == '__main__':
     FLASK_APP.debug = True
@@ -1,14 +1,99 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import sys
+
+if __name__ == "__main__" and "--daemon" in sys.argv[1:]:
+    # a thin client, handing the run to the solver daemon before paying for the imports below. It gives None
+    # when the run has to be done here after all
+    import solverdaemon
+    CLIENT_STATUS = solverdaemon.run_client(sys.argv[1:])
+    if CLIENT_STATUS is not None:
+        sys.exit(CLIENT_STATUS)
+
 import argparse
+import heapq
+import io
+import json
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
 import forseti.parser
 from forseti.formula import Formula, Symbol, Predicate, Not, And, Or, If, Iff
 from six import string_types
+import resultcache
 
 
 TRUTH_COUNT = 1
 
+# propagation engines, "sweep" re-evaluates every formula tree until a full pass changes nothing while
+# "worklist" only re-evaluates the formulas whose value or whose children's values changed
+ENGINES = ("worklist", "sweep")
+DEFAULT_ENGINE = "worklist"
+
+# reason given for a truth value that was guessed while searching, rather than forced by another formula
+DECISION = "decision"
+# how much the activity bump for symbols in learnt clauses grows after each conflict, so that recent conflicts
+# count for more when choosing which symbol to branch on
+ACTIVITY_DECAY = 0.95
+# how many steps (or nodes built) go by between checking the clock and the cancel token of a Budget
+BUDGET_CHECK_INTERVAL = 1024
+# parsed formulas (and atoms) of this process keyed by their text without spaces, see parse_cached. Parsed
+# formulas are never changed, so the same one can be handed to every table that needs it. Bounded by the total
+# nodes of the formulas rather than how many there are, so that one argument with a lot of atoms or premises
+# doesn't push its own formulas out while it is being parsed
+PARSE_CACHE = resultcache.LRUCache(1000000)
+# changed whenever what get_trace gives changes, so clients don't keep using traces in an older format
+TRACE_VERSION = 2
+
+
+class MultiAnd(And):
+    """
+    And of any number of formulas, and(A, B, C). forseti's own And only ever takes two
+    """
+    def __init__(self, *args):
+        # skip And.__init__, LogicalOperator checks the arguments are all formulas
+        super(And, self).__init__(*args)
+        self.args.extend(args)
+        self.arity = len(args)
+
+    def __repr__(self):
+        return "and(" + ", ".join(repr(arg) for arg in self.args) + ")"
+
+    def __str__(self):
+        return "(" + " & ".join(str(arg) for arg in self.args) + ")"
+
+
+class MultiOr(Or):
+    """
+    Or of any number of formulas, or(A, B, C)
+    """
+    def __init__(self, *args):
+        super(Or, self).__init__(*args)
+        self.args.extend(args)
+        self.arity = len(args)
+
+    def __repr__(self):
+        return "or(" + ", ".join(repr(arg) for arg in self.args) + ")"
+
+    def __str__(self):
+        return "(" + " | ".join(str(arg) for arg in self.args) + ")"
+
+
+# connectives of the functional format: (class, class taking more than two arguments, fewest arguments, most
+# arguments or None for any number)
+CONNECTIVES = {
+    "not": (Not, None, 1, 1),
+    "and": (And, MultiAnd, 2, None),
+    "or": (Or, MultiOr, 2, None),
+    "if": (If, None, 2, 2),
+    "iff": (Iff, None, 2, 2)
+}
+
 
 def is_atomic(formula):
     """
@@ -38,22 +123,787 @@ def is_operator(formula):
     return is_binary_operator(formula) or isinstance(formula, Not)
 
 
-def runner(formulas, goal):
+def symbol_key(formula):
+    """
+    Get a hashable key for an atomic formula, forseti formulas define __eq__ but are not hashable
+    :param formula:
+    :return:
+    """
+    return type(formula).__name__, repr(formula)
+
+
+def evaluate(formula, values):
+    """
+    Evaluate a formula for the given truth values of its symbols
+    :param formula:
+    :type formula: Formula
+    :param values: truth value for each symbol, keyed by symbol_key
+    :type values: dict
+    :return:
+    """
+    results = []
+    stack = [(formula, False)]
+    while len(stack) > 0:
+        formula, visited = stack.pop()
+        if is_atomic(formula):
+            results.append(values[symbol_key(formula)])
+        elif not visited:
+            stack.append((formula, True))
+            for i in range(len(formula.args) - 1, -1, -1):
+                stack.append((formula.args[i], False))
+        else:
+            args = results[len(results) - len(formula.args):]
+            del results[len(results) - len(formula.args):]
+            if isinstance(formula, Not):
+                results.append(not args[0])
+            elif isinstance(formula, And):
+                results.append(all(args))
+            elif isinstance(formula, Or):
+                results.append(any(args))
+            elif isinstance(formula, If):
+                results.append(not args[0] or args[1])
+            elif isinstance(formula, Iff):
+                results.append(args[0] == args[1])
+            else:
+                raise TypeError("Invalid Formula Type: " + str(type(formula)))
+    return results[0]
+
+
+def runner(formulas, goal, **kwargs):
+    """
+    Parse the given formulas and goal and solve the resulting Short Truth Table
+    :param formulas:
+    :param goal:
+    :param kwargs: options passed on to ShortTruthTable, compact=True to solve with a CompactShortTruthTable, and
+                   preprocess=True to simplify the argument first (see preprocess.Preprocessing)
+    :return:
+    """
+    hooks = kwargs.get("hooks")
+    if hooks is None:
+        parsed_formulas, goal = parse_argument(formulas, goal, kwargs.get("flatten", True))
+    else:
+        start = time.perf_counter()
+        parsed_formulas, goal = parse_argument(formulas, goal, kwargs.get("flatten", True))
+        hooks.phase("parse", time.perf_counter() - start)
+    return solve(parsed_formulas, goal, **kwargs)
+
+
+def parse_argument(formulas, goal, flat=True):
+    """
+    Parse the given formulas (skipping empty ones) and goal
+    :param formulas:
+    :param goal:
+    :param flat: whether to flatten them, see flatten
+    :return: the parsed formulas and the parsed goal
+    """
     if isinstance(formulas, string_types):
         formulas = [formulas]
+    if not isinstance(formulas, (list, tuple)):
+        raise TypeError("Expected a list of premises, got " + str(type(formulas)))
 
     if not isinstance(goal, string_types):
         raise TypeError("Expected str for goal, got " + str(type(goal)))
 
     parsed_formulas = []
     for formula in formulas:
+        if not isinstance(formula, string_types):
+            raise TypeError("Expected str for premise, got " + str(type(formula)))
         formula = formula.strip()
         if len(formula) == 0:
             continue
-        parsed_formulas.append(forseti.parser.parse(formula))
+        parsed_formulas.append(parse_cached(formula, flat))
+
+    return parsed_formulas, parse_cached(goal, flat)
+
+
+def parse_cached(text, flat=True):
+    """
+    Parse and flatten a formula, reusing the formula parsed from the same text (ignoring spaces) if it is still
+    in PARSE_CACHE
+    :param text:
+    :param flat: whether to flatten it, see flatten
+    :return:
+    :rtype: Formula
+    """
+    key = text.replace(" ", "")
+    if not flat:
+        key = (key, False)
+    formula = PARSE_CACHE.get(key)
+    if formula is None:
+        formula = parse_formula(text)
+        if flat:
+            formula = flatten(formula)
+        # roughly a node for each atom and connective, without going through the formula
+        nodes = text.count("(") + text.count(",") + 1
+        PARSE_CACHE.put(key, formula, nodes)
+    return formula
+
+
+def parse_formula(text):
+    """
+    Parse a formula in the functional format like forseti.parser.parse, but also taking and/or of more than two
+    formulas, e.g. and(A, B, C). Parsed in one pass without recursing, so deeply nested formulas are fine
+    :param text:
+    :return:
+    :rtype: Formula
+    """
+    statement = text.replace(" ", "")
+    if statement.count("(") > statement.count(")"):
+        raise SyntaxError("Invalid formula (check parentheses): " + text)
+
+    # connectives (or None for parentheses around a formula) still waiting on their closing parenthesis, with
+    # the arguments parsed so far
+    stack = []
+    i = 0
+    while True:
+        # read the name at i, then an argument list, predicate or atom
+        j = i
+        while j < len(statement) and statement[j] not in "(),":
+            j += 1
+        name = statement[i:j]
+        if j < len(statement) and statement[j] == "(" and (name == "" or name.lower() in CONNECTIVES):
+            stack.append((name.lower() if name != "" else None, []))
+            i = j + 1
+            continue
+        if j < len(statement) and statement[j] == "(":
+            # a predicate, forseti parses its arguments
+            depth = 0
+            while j < len(statement):
+                if statement[j] == "(":
+                    depth += 1
+                elif statement[j] == ")":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            j += 1
+            name = statement[i:j]
+        if name == "":
+            raise SyntaxError("Invalid formula: " + text)
+        # atoms and predicates are interned through the parse cache, so every occurrence of one is usually the
+        # same object
+        formula = PARSE_CACHE.get(name)
+        if formula is None:
+            formula = forseti.parser.parse(name)
+            PARSE_CACHE.put(name, formula)
+        i = j
+
+        # close every connective that this finishes
+        while True:
+            if len(stack) == 0:
+                if i != len(statement):
+                    raise SyntaxError("Invalid formula: " + text)
+                return formula
+            name, args = stack[-1]
+            args.append(formula)
+            if i < len(statement) and statement[i] == "," and name is not None:
+                i += 1
+                break
+            if i >= len(statement) or statement[i] != ")":
+                raise SyntaxError("Invalid formula: " + text)
+            i += 1
+            stack.pop()
+            if name is None:
+                formula = args[0]
+                continue
+            connective, multi_connective, fewest, most = CONNECTIVES[name]
+            if len(args) < fewest or (most is not None and len(args) > most):
+                raise SyntaxError("Invalid formula: " + text)
+            formula = multi_connective(*args) if len(args) > 2 else connective(*args)
+
+
+def flatten(formula):
+    """
+    Merge each and (or) directly inside another and (or) into it, so and(and(A, B), C) becomes and(A, B, C) and
+    is solved as one formula. Formulas with nothing to merge are kept as they are
+    :param formula:
+    :type formula: Formula
+    :return:
+    :rtype: Formula
+    """
+    results = []
+    # id of each formula already flattened, for formulas reused as the argument of more than one
+    done = {}
+    # (formula, None) to visit a formula, then (formula, operands) once its operands have been flattened
+    stack = [(formula, None)]
+    while len(stack) > 0:
+        formula, operands = stack.pop()
+        if is_atomic(formula):
+            results.append(formula)
+        elif operands is None:
+            if id(formula) in done:
+                results.append(done[id(formula)])
+                continue
+            operands = formula.args
+            if isinstance(formula, And) or isinstance(formula, Or):
+                # gather the operands from under every and (or) directly below this one, left to right
+                connective = And if isinstance(formula, And) else Or
+                operands = []
+                below = [formula]
+                while len(below) > 0:
+                    operand = below.pop()
+                    if isinstance(operand, connective):
+                        below.extend(reversed(operand.args))
+                    else:
+                        operands.append(operand)
+            stack.append((formula, operands))
+            for i in range(len(operands) - 1, -1, -1):
+                stack.append((operands[i], None))
+        else:
+            args = results[len(results) - len(operands):]
+            del results[len(results) - len(operands):]
+            if len(args) > len(formula.args):
+                flattened = MultiAnd(*args) if isinstance(formula, And) else MultiOr(*args)
+            elif all(args[i] is formula.args[i] for i in range(len(args))):
+                flattened = formula
+            else:
+                flattened = type(formula)(*args)
+            done[id(formula)] = flattened
+            results.append(flattened)
+    return results[0]
+
+
+def solve(formulas, goal, **kwargs):
+    """
+    Solve the Short Truth Table for already parsed formulas and goal
+    :param formulas:
+    :type formulas: List[Formula]
+    :param goal:
+    :type goal: Formula
+    :param kwargs: see runner
+    :return:
+    """
+    if kwargs.pop("preprocess", False):
+        if not kwargs.get("flatten", True):
+            raise ValueError("Preprocessing always flattens the argument, it cannot be used with flatten=False")
+        # like compacttables, preprocess builds on this module
+        from preprocess import Preprocessing
+        preprocessing = Preprocessing(formulas, goal)
+        if kwargs.get("hooks") is not None:
+            kwargs["hooks"].phase("preprocess", preprocessing.seconds)
+        table = solve(preprocessing.formulas, preprocessing.goal, **kwargs)
+        table.preprocessing = preprocessing
+        return table
+    if kwargs.pop("compact", False):
+        # compacttables builds on this module, so can only be imported once it has loaded
+        from compacttables import CompactShortTruthTable
+        return CompactShortTruthTable(formulas, goal, **kwargs)
+    return ShortTruthTable(formulas, goal, **kwargs)
+
+
+def functional_string(formula, names=None):
+    """
+    Print the formula in the functional format it is entered in, e.g. and(A, not(B))
+    :param formula:
+    :param names: replacement text for symbols, keyed by symbol_key
+    :type names: dict
+    :return:
+    """
+    text = []
+    stack = [formula]
+    while len(stack) > 0:
+        formula = stack.pop()
+        if isinstance(formula, string_types):
+            text.append(formula)
+        elif is_atomic(formula):
+            text.append(repr(formula) if names is None else names[symbol_key(formula)])
+        else:
+            stack.append(")")
+            for i in range(len(formula.args) - 1, -1, -1):
+                stack.append(formula.args[i])
+                if i > 0:
+                    stack.append(", ")
+            stack.append(formula.name + "(")
+    return "".join(text)
+
+
+def rename_symbols(formula, names, symbols=None):
+    """
+    Rebuild the formula with each symbol (or predicate) replaced by a Symbol of the given name
+    :param formula:
+    :param names: new name for each symbol, keyed by symbol_key
+    :type names: dict
+    :param symbols: the Symbol made for each new name, pass the same dict to rename several formulas with one
+                    Symbol object per name
+    :type symbols: dict
+    :return:
+    """
+    if symbols is None:
+        symbols = {}
+    results = []
+    stack = [(formula, False)]
+    while len(stack) > 0:
+        formula, visited = stack.pop()
+        if is_atomic(formula):
+            name = names[symbol_key(formula)]
+            if name not in symbols:
+                symbols[name] = Symbol(name)
+            results.append(symbols[name])
+        elif not visited:
+            stack.append((formula, True))
+            for i in range(len(formula.args) - 1, -1, -1):
+                stack.append((formula.args[i], False))
+        else:
+            args = results[len(results) - len(formula.args):]
+            del results[len(results) - len(formula.args):]
+            results.append(type(formula)(*args))
+    return results[0]
+
+
+def get_position(root, formula):
+    """
+    Get where the formula comes in the root's get_connective_values
+    :param root:
+    :type root: ShortTruthTableFormula
+    :param formula:
+    :type formula: ShortTruthTableFormula
+    :return:
+    """
+    position = 0
+    stack = [(root, False)]
+    while len(stack) > 0:
+        node, visited = stack.pop()
+        if visited or len(node.children) == 0:
+            if node.index == formula.index:
+                return position
+            position += 1
+            continue
+        children = node.children
+        for i in range(len(children) - 1, 0, -1):
+            stack.append((children[i], False))
+            stack.append((node, True))
+        if len(children) == 1:
+            # a not comes before what it negates
+            stack.append((children[0], False))
+            stack.append((node, True))
+        else:
+            stack.append((children[0], False))
+    return None
+
+
+def get_subformula(formula, position):
+    """
+    Get the subformula at the given position of the formula's in order walk, the inverse of get_position
+    :param formula:
+    :type formula: Formula
+    :param position:
+    :type position: int
+    :return:
+    """
+    stack = [(formula, False)]
+    while len(stack) > 0:
+        formula, visited = stack.pop()
+        if visited or is_atomic(formula):
+            if position == 0:
+                return formula
+            position -= 1
+            continue
+        for i in range(len(formula.args) - 1, 0, -1):
+            stack.append((formula.args[i], False))
+            stack.append((formula, True))
+        if len(formula.args) == 1:
+            stack.append((formula.args[0], False))
+            stack.append((formula, True))
+        else:
+            stack.append((formula.args[0], False))
+    return None
+
+
+def get_result(table):
+    """
+    Get the outcome of a solved table as plain data (lists, dicts, strings, numbers) that can be cached or sent
+    as JSON. A table solved for a preprocessed argument is mapped back onto the argument as it was given. A table
+    that has been edited is renumbered the first time it is reported after the edits, so that its steps are those
+    of a fresh table, however many edits were made in between
+    :param table:
+    :type table: ShortTruthTable
+    :return:
+    :rtype: dict
+    """
+    if getattr(table, "stale", False):
+        table.renumber()
+    formulas = table.formulas
+    result = {
+        "contradiction": table.contradiction,
+        "count": table.count,
+        # the formula trees are only partly built if the budget ran out while building them
+        "formulas": [formula.get_connective_values() for formula in formulas] if table.built else None,
+        "contradiction_formula": None,
+        "unfulled_symbols": [str(symbol.symbol) for symbol in table.unfulled_symbols],
+        "countermodel": table.countermodel,
+        "budget_exceeded": table.budget_exceeded,
+        "partial_assignment": table.partial_assignment
+    }
+    if table.contradiction:
+        for i in range(len(formulas)):
+            if formulas[i].index == table.contradiction_parent.index:
+                result["contradiction_formula"] = {
+                    "root": i,
+                    "position": get_position(formulas[i], table.contradiction_formula),
+                    "truth_value": table.contradiction_formula.truth_value
+                }
+                break
+    result["preprocessing"] = None
+    if getattr(table, "preprocessing", None) is not None:
+        result = table.preprocessing.restore(result)
+    return result
 
-    goal = forseti.parser.parse(goal)
-    return ShortTruthTable(parsed_formulas, goal)
+
+class CanonicalArgument(object):
+    def __init__(self, formulas, goal):
+        """
+        The argument with its symbols renamed in the order they first appear, so that arguments that only differ
+        in their symbol names (or spacing) share the same key. The premises keep their order, the steps a table is
+        solved in depend on it
+        :param formulas:
+        :type formulas: List[Formula]
+        :param goal:
+        :type goal: Formula
+        """
+        self.names = {}
+        self.symbols = {}
+        for formula in [goal] + formulas:
+            stack = [formula]
+            while len(stack) > 0:
+                formula = stack.pop()
+                if is_atomic(formula):
+                    key = symbol_key(formula)
+                    if key not in self.names:
+                        self.names[key] = "A" + str(len(self.names) + 1)
+                        self.symbols[self.names[key]] = formula
+                else:
+                    stack.extend(reversed(formula.args))
+
+        # one Symbol per name, so the atoms are interned when the canonical argument is solved
+        renamed = {}
+        self.formulas = [rename_symbols(formula, self.names, renamed) for formula in formulas]
+        self.goal = rename_symbols(goal, self.names, renamed)
+        self.key = "; ".join([functional_string(formula) for formula in self.formulas]) + " |- " + \
+            functional_string(self.goal)
+
+    def restore(self, result):
+        """
+        Map a get_result of the canonical argument back onto the original symbol names
+        :param result:
+        :type result: dict
+        :return:
+        :rtype: dict
+        """
+        restored = dict(result)
+        restored["unfulled_symbols"] = [str(self.symbols[symbol]) for symbol in result["unfulled_symbols"]]
+        if result["countermodel"] is not None:
+            restored["countermodel"] = OrderedDict()
+            for symbol in result["countermodel"]:
+                restored["countermodel"][str(self.symbols[symbol])] = result["countermodel"][symbol]
+        if result["partial_assignment"] is not None:
+            restored["partial_assignment"] = OrderedDict()
+            for symbol in result["partial_assignment"]:
+                restored["partial_assignment"][str(self.symbols[symbol])] = result["partial_assignment"][symbol]
+        return restored
+
+
+def get_verdict(result):
+    """
+    :param result: see get_result
+    :return: whether the argument is valid, None if the table got stuck or ran out of budget so we don't know
+    """
+    if result["contradiction"]:
+        return True
+    elif len(result["unfulled_symbols"]) == 0 and result["budget_exceeded"] is None:
+        return False
+    return None
+
+
+def solve_report(formulas, goal, **kwargs):
+    """
+    Parse and solve an argument, describing the outcome as plain data that can be sent as JSON
+    :param formulas:
+    :param goal:
+    :param kwargs: see runner
+    :return:
+    :rtype: dict
+    """
+    formulas, goal = parse_argument(formulas, goal, kwargs.get("flatten", True))
+    result = get_result(solve(formulas, goal, **kwargs))
+    roots = formulas + [Not(goal)]
+
+    report = OrderedDict()
+    report["valid"] = get_verdict(result)
+    report["contradiction"] = result["contradiction"]
+    report["step"] = result["count"]
+    report["contradiction_formula"] = None
+    report["contradiction_parent"] = None
+    if result["contradiction_formula"] is not None:
+        parent = roots[result["contradiction_formula"]["root"]]
+        formula = get_subformula(parent, result["contradiction_formula"]["position"])
+        report["contradiction_formula"] = functional_string(formula)
+        report["contradiction_parent"] = functional_string(parent)
+    report["formulas"] = []
+    for i in range(len(roots)):
+        values = None if result["formulas"] is None else result["formulas"][i]
+        report["formulas"].append(OrderedDict([("formula", functional_string(roots[i])), ("values", values)]))
+    report["unassigned"] = result["unfulled_symbols"]
+    report["countermodel"] = result["countermodel"]
+    report["budget_exceeded"] = result["budget_exceeded"]
+    report["partial_assignment"] = result["partial_assignment"]
+    report["preprocessing"] = result["preprocessing"]
+    return report
+
+
+def get_structure(formula):
+    """
+    Number the nodes of the formula in the order they are first reached, finding which node each position of
+    get_connective_values belongs to (a formula with more than two children has a position per connective) and
+    the parent of each node
+    :param formula:
+    :type formula: Formula
+    :return: the node of each position and the parent node of each node, None for the formula itself
+    :rtype: (List[int], List[int])
+    """
+    nodes = []
+    parents = []
+    stack = [(formula, None, False)]
+    while len(stack) > 0:
+        formula, node, visited = stack.pop()
+        if not visited:
+            parents.append(node)
+            node = len(parents) - 1
+        if visited or is_atomic(formula):
+            nodes.append(node)
+            continue
+        for i in range(len(formula.args) - 1, 0, -1):
+            stack.append((formula.args[i], node, False))
+            stack.append((formula, node, True))
+        if len(formula.args) == 1:
+            stack.append((formula.args[0], node, False))
+            stack.append((formula, node, True))
+        else:
+            stack.append((formula.args[0], node, False))
+    return nodes, parents
+
+
+def get_trace(roots, result, layouts=None):
+    """
+    Describe how a table was solved as plain data, for a client to draw the table and step through it: the
+    layout and node structure of each formula, the truth value and step of each position, and the nodes from
+    the contradiction up to the formula it was found in
+    :param roots: the premises and the negated goal
+    :type roots: List[Formula]
+    :param result: see get_result
+    :param layouts: pretty_layout of each root, if already worked out
+    :return:
+    :rtype: collections.OrderedDict
+    """
+    trace = OrderedDict()
+    trace["version"] = TRACE_VERSION
+    trace["valid"] = get_verdict(result)
+    trace["contradiction"] = result["contradiction"]
+    trace["step"] = result["count"]
+    trace["formulas"] = []
+    structures = []
+    for i in range(len(roots)):
+        text, columns = pretty_layout(roots[i]) if layouts is None else layouts[i]
+        structures.append(get_structure(roots[i]))
+        formula = OrderedDict()
+        formula["text"] = text
+        formula["columns"] = columns
+        formula["nodes"], formula["parents"] = structures[-1]
+        formula["values"] = None if result["formulas"] is None else result["formulas"][i]
+        trace["formulas"].append(formula)
+    trace["contradiction_path"] = None
+    if result["contradiction_formula"] is not None:
+        root = result["contradiction_formula"]["root"]
+        position = result["contradiction_formula"]["position"]
+        nodes, parents = structures[root]
+        path = [nodes[position]]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        trace["contradiction_path"] = OrderedDict()
+        trace["contradiction_path"]["root"] = root
+        trace["contradiction_path"]["nodes"] = path
+        trace["contradiction_path"]["formula"] = pretty_print(get_subformula(roots[root], position))
+        trace["contradiction_path"]["truth_value"] = result["contradiction_formula"]["truth_value"]
+    trace["unassigned"] = result["unfulled_symbols"]
+    trace["countermodel"] = result["countermodel"]
+    trace["budget_exceeded"] = result["budget_exceeded"]
+    # results cached before preprocessing was added don't have it
+    trace["preprocessing"] = result.get("preprocessing")
+    return trace
+
+
+def countermodels(formulas, goal, limit=None, **kwargs):
+    """
+    Parse an argument and lazily go through its countermodels, see ShortTruthTable.iterate_countermodels
+    :param formulas:
+    :param goal:
+    :param limit: most countermodels to go through, None for every one
+    :param kwargs: see runner, apart from compact, search and preprocess which don't apply (preprocessing drops
+                   atoms the countermodels are made of)
+    :return:
+    """
+    kwargs.pop("compact", None)
+    kwargs.pop("search", None)
+    kwargs.pop("preprocess", None)
+    formulas, goal = parse_argument(formulas, goal, kwargs.get("flatten", True))
+    table = ShortTruthTable(formulas, goal, **kwargs)
+    if table.budget_exceeded is not None:
+        raise BudgetExceeded(table.budget_exceeded)
+    countermodel_iterator = table.iterate_countermodels()
+    try:
+        for countermodel in islice(countermodel_iterator, limit):
+            yield countermodel
+    finally:
+        countermodel_iterator.close()
+
+
+class SolveTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise SolveTimeout("Timed out")
+
+
+def solve_item(index, argument, timeout=None, options=None):
+    """
+    Solve one argument of a batch, catching anything wrong with it rather than stopping the batch
+    :param index: where the argument is in the batch
+    :param argument: {"premises": [...], "goal": "..."}, the same as a line of JSON, or (premises, goal)
+    :param timeout: seconds to give up after, only enforced where SIGALRM can be used (the main thread on unix)
+    :param options: see runner
+    :return:
+    :rtype: dict
+    """
+    use_alarm = timeout is not None and hasattr(signal, "setitimer") and \
+        threading.current_thread().name == "MainThread"
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        if isinstance(argument, string_types):
+            argument = json.loads(argument)
+        if isinstance(argument, dict):
+            report = solve_report(argument.get("premises", []), argument.get("goal"), **(options or {}))
+        else:
+            report = solve_report(argument[0], argument[1], **(options or {}))
+    except SolveTimeout as exception:
+        report = OrderedDict([("error", str(exception)), ("timeout", True)])
+    except Exception as exception:
+        # a bad argument (or a bug it runs into) only fails its own line, the rest of the batch goes on
+        report = OrderedDict([("error", str(exception))])
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    report["index"] = index
+    return report
+
+
+def solve_many(arguments, workers=None, timeout=None, ordered=True, executor=None, **kwargs):
+    """
+    Solve a batch of arguments across a pool of worker processes, yielding each solve_report (with an "index"
+    and, if something went wrong, an "error") as it is ready. Arguments are only read from the iterable as
+    workers free up, so it can be a stream of any length
+    :param arguments: iterable of arguments as taken by solve_item
+    :param workers: number of worker processes, None for one per core, 0 to solve in this process
+    :param timeout: seconds each argument may take
+    :param ordered: yield results in the order of the arguments, rather than as they complete
+    :param executor: process pool with that many workers to solve on, kept by the caller for many batches, by
+                     default one is started for this batch
+    :type executor: concurrent.futures.ProcessPoolExecutor
+    :param kwargs: see runner
+    :return:
+    """
+    if workers == 0:
+        for index, argument in enumerate(arguments):
+            yield solve_item(index, argument, timeout, kwargs)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for report in solve_on_pool(executor, workers, arguments, timeout, ordered, kwargs):
+                yield report
+    else:
+        for report in solve_on_pool(executor, workers, arguments, timeout, ordered, kwargs):
+            yield report
+
+
+def solve_on_pool(executor, workers, arguments, timeout, ordered, options):
+    """
+    Solve the arguments on a pool of worker processes, see solve_many
+    :param executor:
+    :type executor: concurrent.futures.ProcessPoolExecutor
+    :param workers: how many worker processes the pool has
+    :param arguments:
+    :param timeout:
+    :param ordered:
+    :param options:
+    :return:
+    """
+    # at most this many results are being solved or waiting for an earlier one to be yielded
+    window = 2 * workers
+    arguments = enumerate(arguments)
+    running = set()
+    finished = {}
+    next_index = 0
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(running) + len(finished) < window:
+                try:
+                    index, argument = next(arguments)
+                except StopIteration:
+                    exhausted = True
+                    break
+                running.add(executor.submit(solve_item, index, argument, timeout, options))
+            if len(running) == 0 and len(finished) == 0:
+                return
+
+            if len(running) > 0:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report = future.result()
+                    if ordered:
+                        finished[report["index"]] = report
+                    else:
+                        yield report
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+    finally:
+        # a pool that outlives the batch isn't left solving what nobody is waiting for any more
+        for future in running:
+            future.cancel()
+
+
+def read_lines(stream):
+    """
+    Lazily read the non-blank lines of a JSON lines stream, leaving them to be parsed by whoever solves them
+    :param stream:
+    :return:
+    """
+    for line in stream:
+        line = line.strip()
+        if len(line) > 0:
+            yield line
+
+
+def solve_stream(source, destination, **kwargs):
+    """
+    Solve each line of JSON in the source, writing a line of JSON for each result to the destination as soon as
+    it is ready. Only a few arguments per worker are held at a time, so the source can be as large as it likes
+    :param source: readable text stream
+    :param destination: writable text stream
+    :param kwargs: see solve_many
+    :return: number of arguments solved
+    """
+    count = 0
+    for report in solve_many(read_lines(source), **kwargs):
+        destination.write(json.dumps(report) + "\n")
+        destination.flush()
+        count += 1
+    return count
 
 
 def is_connective(char):
@@ -67,30 +917,183 @@ def is_connective(char):
 
 def pretty_print(formula):
     """
-
+    Pretty print the formula using the logical connective characters
     :param formula:
     :return:
     """
-    if isinstance(formula, Symbol) or isinstance(formula, Predicate):
-        text = str(formula)
-    elif isinstance(formula, Not):
-        text = "¬" + pretty_print(formula.args[0])
-    else:
-        temp = []
-        for arg in formula.args:
-            temp.append(pretty_print(arg))
-        if isinstance(formula, And):
-            text = " ∧ ".join(temp)
-        elif isinstance(formula, Or):
-            text = " ∨ ".join(temp)
-        elif isinstance(formula, If):
-            text = " → ".join(temp)
-        elif isinstance(formula, Iff):
-            text = " ↔ ".join(temp)
+    return pretty_layout(formula)[0]
+
+
+def pretty_layout(formula):
+    """
+    Pretty print the formula, also finding the column of each connective and atom (the first character of a
+    multi-character atom), in the order that get_connective_values lists their truth values. Subformulas that
+    are the same object, such as atoms reused when building formulas, are only laid out the once
+    :param formula:
+    :return: the text and the columns
+    :rtype: (str, List[int])
+    """
+    pieces = []
+    columns = []
+    width = 0
+    # id of each formula laid out: (first piece, end piece, first column, first token, end token)
+    done = {}
+    # stack of formulas still to be laid out, (connective, column offset) to go between them, plain strings,
+    # and (formula, first piece, first column, first token) once a formula is finished
+    stack = [formula]
+    while len(stack) > 0:
+        formula = stack.pop()
+        if isinstance(formula, string_types):
+            pieces.append(formula)
+            width += len(formula)
+            continue
+        elif isinstance(formula, tuple):
+            if len(formula) == 2:
+                columns.append(width + formula[1])
+                pieces.append(formula[0])
+                width += len(formula[0])
+            else:
+                done[id(formula[0])] = (formula[1], len(pieces), formula[2], formula[3], len(columns))
+            continue
+
+        copy = done.get(id(formula))
+        if copy is not None:
+            first_piece, end_piece, first_column, first_token, end_token = copy
+            for i in range(first_token, end_token):
+                columns.append(columns[i] - first_column + width)
+            for i in range(first_piece, end_piece):
+                pieces.append(pieces[i])
+                width += len(pieces[i])
+            continue
+
+        stack.append((formula, len(pieces), width, len(columns)))
+        if isinstance(formula, Symbol) or isinstance(formula, Predicate):
+            stack.append((str(formula), 0))
+        elif isinstance(formula, Not):
+            stack.append(formula.args[0])
+            stack.append(("¬", 0))
         else:
-            raise TypeError("Invalid Formula Type: " + str(type(formula)))
-        text = "(" + text + ")"
-    return text.strip()
+            if isinstance(formula, And):
+                connective = " ∧ "
+            elif isinstance(formula, Or):
+                connective = " ∨ "
+            elif isinstance(formula, If):
+                connective = " → "
+            elif isinstance(formula, Iff):
+                connective = " ↔ "
+            else:
+                raise TypeError("Invalid Formula Type: " + str(type(formula)))
+            stack.append(")")
+            for i in range(len(formula.args) - 1, -1, -1):
+                stack.append(formula.args[i])
+                if i > 0:
+                    stack.append((connective, 1))
+            stack.append("(")
+    return "".join(pieces), columns
+
+
+class SolverHooks(object):
+    """
+    Instrumentation for solving a table, override whichever methods are wanted and pass an instance as hooks.
+    Tables given no hooks don't time anything, so leaving them out costs nothing
+    """
+    def phase(self, name, seconds):
+        """
+        Called as each phase of solving finishes: "parse" (only through runner), "preprocess" (only with
+        preprocess=True), "build", "propagate" and "search"
+        :param name:
+        :param seconds:
+        :return:
+        """
+        pass
+
+    def finished(self, table, counters):
+        """
+        Called once the table is solved
+        :param table:
+        :param counters: table.get_counters()
+        :return:
+        """
+        pass
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, reason):
+        """
+        :param reason: "steps", "nodes", "time" or "cancelled"
+        """
+        super(BudgetExceeded, self).__init__("Budget exceeded: " + reason)
+        self.reason = reason
+
+
+class CancelToken(object):
+    def __init__(self):
+        """
+        Lets another thread stop a table being solved with a Budget holding this token
+        """
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+
+class Budget(object):
+    def __init__(self, max_steps=None, max_nodes=None, timeout=None, token=None):
+        """
+        Limits on solving a table, past which it gives up with whatever it has set so far. None is no limit
+        :param max_steps: most truth values to set, counting those undone while searching
+        :param max_nodes: most formula nodes to build
+        :param timeout: seconds from when the table starts being built
+        :param token: CancelToken to stop the table from another thread
+        """
+        self.max_steps = max_steps
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        self.token = token
+
+    def start(self):
+        return BudgetMeter(self)
+
+
+class BudgetMeter(object):
+    def __init__(self, budget):
+        """
+        How much of a budget one table has used
+        :param budget:
+        :type budget: Budget
+        """
+        self.budget = budget
+        self.steps = 0
+        self.deadline = None
+        if budget.timeout is not None:
+            self.deadline = time.perf_counter() + budget.timeout
+
+    def step(self):
+        self.steps += 1
+        if self.budget.max_steps is not None and self.steps > self.budget.max_steps:
+            raise BudgetExceeded("steps")
+        if self.steps % BUDGET_CHECK_INTERVAL == 0:
+            self.check()
+
+    def node(self, count):
+        """
+        :param count: nodes built so far
+        :return:
+        """
+        if self.budget.max_nodes is not None and count > self.budget.max_nodes:
+            raise BudgetExceeded("nodes")
+        if count % BUDGET_CHECK_INTERVAL == 0:
+            self.check()
+
+    def check(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise BudgetExceeded("time")
+        if self.budget.token is not None and self.budget.token.cancelled:
+            raise BudgetExceeded("cancelled")
 
 
 class FormulaException(Exception):
@@ -98,6 +1101,8 @@ class FormulaException(Exception):
         super(FormulaException, self).__init__("Already set truth value")
         self.formula = formula
         self.number = formula.number
+        # the formulas whose truth values together caused the contradiction
+        self.antecedents = []
 
 
 class ShortTruthTableFormula(object):
@@ -113,44 +1118,102 @@ class ShortTruthTableFormula(object):
         """
         self.formula = formula
         self.parent = parent
+        self.parents = [] if parent is None else [parent]
+        """:type parents: list[ShortTruthTableFormula]"""
         self.children = []
         """:type children: list[ShortTruthTableFormula]"""
+        self.symbol = None
+        """:type symbol: ShortTruthTableSymbol"""
         self.truth_value = None
         self.number = None
+        self.index = None
+        self.queued = False
+        # what forced the truth value: None for a premise, the formula whose connective rule set it, the
+        # ShortTruthTableSymbol it was copied from, DECISION, or the formulas of a learnt clause
+        self.reason = None
+        self.trail_index = None
+        # how many of the children are set to True and to False, so the connective rules don't have to look
+        # at every child
+        self.true_children = 0
+        self.false_children = 0
 
     def get_connective_values(self):
         """
         Returns a list of the truth values of all formulas in the Formula by traversing the tree to the left
-        when possible and then up and right as necessary
+        when possible and then up and right as necessary. A formula with more than two children is listed
+        between each of them, once per connective symbol
         :return:
         """
-        values = [[self.truth_value, self.number]]
-        if len(self.children) == 1:
-            values.extend(self.children[0].get_connective_values())
-        elif len(self.children) == 2:
-            child = self.children[0].get_connective_values()
-            child.extend(values)
-            child.extend(self.children[1].get_connective_values())
-            values = child
+        values = []
+        stack = [(self, False)]
+        while len(stack) > 0:
+            formula, visited = stack.pop()
+            if visited or len(formula.children) == 0:
+                values.append([formula.truth_value, formula.number])
+                continue
+            children = formula.children
+            for i in range(len(children) - 1, 0, -1):
+                stack.append((children[i], False))
+                stack.append((formula, True))
+            if len(children) == 1:
+                stack.append((children[0], False))
+                stack.append((formula, True))
+            else:
+                stack.append((children[0], False))
         return values
 
+    def count_children(self):
+        """
+        Count the children that are already set, for a formula put on top of them
+        :return:
+        """
+        self.true_children = 0
+        self.false_children = 0
+        for child in self.children:
+            if child.truth_value is True:
+                self.true_children += 1
+            elif child.truth_value is False:
+                self.false_children += 1
+
     def set_truth_value(self, boolean, count):
         if self.truth_value is None:
             self.truth_value = boolean
             self.number = count
+            for parent in self.parents:
+                if boolean:
+                    parent.true_children += 1
+                else:
+                    parent.false_children += 1
         else:
             raise FormulaException(self)
 
+    def unset_truth_value(self):
+        if self.truth_value is not None:
+            for parent in self.parents:
+                if self.truth_value:
+                    parent.true_children -= 1
+                else:
+                    parent.false_children -= 1
+        self.truth_value = None
+        self.number = None
+        self.reason = None
+        self.trail_index = None
+
 
 class ShortTruthTableSymbol(object):
-    def __init__(self, symbol):
+    def __init__(self, symbol, symbol_id=None):
         """
 
         :param symbol:
+        :param symbol_id: small number standing in for the symbol, unique within its table
+        :type symbol_id: int
         """
         assert(is_atomic(symbol))
         self.symbol = symbol
+        self.id = symbol_id
         self.formula = None
+        self.occurrences = []
+        """:type occurrences: list[ShortTruthTableFormula]"""
         self.truth_value = None
         self.number = None
 
@@ -164,311 +1227,1356 @@ class ShortTruthTableSymbol(object):
 
 
 class ShortTruthTable(object):
-    def __init__(self, formulas, goal):
+    def __init__(self, formulas, goal, engine=DEFAULT_ENGINE, share_subformulas=False, search=False, hooks=None,
+                 budget=None, flatten=True):
         """
 
         :param formulas:
         :type formulas: List[Formula]
         :param goal:
         :type goal: Formula
+        :param engine: which propagation engine to use, one of ENGINES
+        :type engine: str
+        :param share_subformulas: build one node for all structurally identical subformulas instead of one per
+                                  occurrence, so each distinct subformula is only propagated once
+        :type share_subformulas: bool
+        :param search: if propagation gets stuck, branch on the remaining symbols until either a countermodel is
+                       found or every branch is contradictory
+        :type search: bool
+        :param hooks: instrumentation to report the phases and counters of solving the table to
+        :type hooks: SolverHooks
+        :param budget: limits past which to give up, leaving budget_exceeded set to why
+        :type budget: Budget
+        :param flatten: merge and/or directly inside another and/or into it (see flatten), rather than solving
+                        the formulas exactly as they are nested
+        :type flatten: bool
         """
+        if engine not in ENGINES:
+            raise ValueError("Unknown engine: " + str(engine))
+        self.engine = engine
+        self.share_subformulas = share_subformulas
+        self.search_enabled = search
+        self.budget = budget
+        self.flatten = flatten
         self.basic_formulas = formulas
         self.goal = goal
         self.count = 1
+        self.hooks = hooks
+        # counters for get_counters
+        self.symbol_lookups = 0
+        self.interned_lookups = 0
+        self.passes = 0
+        self.meter = None if budget is None else budget.start()
+        self.budget_exceeded = None
+        self.partial_assignment = None
+        # whether every formula tree was built before running out of budget
+        self.built = False
         self.formulas = []
         """:type : List[ShortTruthTableFormula]"""
 
+        if hooks is not None:
+            start = time.perf_counter()
         for formula in formulas:
-            self.formulas.append(ShortTruthTableFormula(formula))
-        self.formulas.append(ShortTruthTableFormula(Not(self.goal)))
+            self.formulas.append(ShortTruthTableFormula(self.prepare_formula(formula)))
+        self.formulas.append(ShortTruthTableFormula(Not(self.prepare_formula(self.goal))))
 
         self.symbols = []
         """:type : List[ShortTruthTableSymbol]"""
-        self.break_apart_formulas()
+        self.symbol_map = {}
+        """:type : Dict[tuple, ShortTruthTableSymbol]"""
+        # id of every atom object seen: (the atom, its symbol), so each object is only looked up by its text once.
+        # Keeping the atom stops its id being reused by another object
+        self.interned = {}
+        self.next_symbol_id = 0
+        self.nodes = []
+        """:type : List[ShortTruthTableFormula]"""
+        self.shared_formulas = {}
+        """:type : Dict[tuple, ShortTruthTableFormula]"""
+        try:
+            self.break_apart_formulas()
+            self.built = True
+        except BudgetExceeded as e:
+            self.budget_exceeded = e.reason
+        if hooks is not None:
+            hooks.phase("build", time.perf_counter() - start)
+            start = time.perf_counter()
+
+        # worklist of node indices still to be evaluated in this pass, and those for the next pass
+        self.queue = []
+        self.next_queue = []
+        self.cursor = None
+
+        # every formula in the order it was set, so that searching can undo back to an earlier point
+        self.trail = []
+        """:type : List[ShortTruthTableFormula]"""
+        self.learnt_clauses = []
+        """:type : List[List[ShortTruthTableFormula]]"""
+        # for each symbol, the learnt clauses (by index) watching it. A clause watches two of its guesses that don't
+        # hold, its first two, and is only looked at again when one of those is set so that it holds
+        self.watches = defaultdict(list)
+        # learnt clauses of a single guess, which have nothing else to watch
+        self.unit_clauses = []
+        # how far along the trail the watches have been updated, and whether the unit clauses need checking again
+        self.clause_head = 0
+        self.units_undone = False
+        self.activity = {}
+        # heap of (-activity, id, push number, symbol) for choose_symbol. A symbol is pushed again whenever its
+        # activity goes up or it is unset, and entries that are out of date or for symbols that are set are dropped
+        # once they reach the top
+        self.activity_heap = []
+        self.activity_pushes = 0
+        self.activity_bump = 1.0
+        self.phases = {}
+        self.search_stats = {"decisions": 0, "conflicts": 0, "learnt_clauses": 0, "max_depth": 0, "backjumps": 0}
+        self.countermodel = None
+        # set once the table has been edited, as the step numbers then follow the order of the edits until it is
+        # renumbered, which get_result does before reporting it
+        self.stale = False
+        # entries of the trail that were unset by an edit, left as None until there are enough to tidy up
+        self.trail_holes = 0
 
         self.contradiction = False
         self.contradiction_formula = None
         self.contradiction_parent = None
 
         try:
-            for formula in self.formulas:
-                self.set_truth_value(formula, True)
+            if self.built:
+                for formula in self.formulas:
+                    self.set_truth_value(formula, True)
 
-            self.evaluate_table()
+                self.evaluate_table()
         except FormulaException as e:
-            self.contradiction = True
-            self.contradiction_formula = e.formula
-            formula = e.formula
-            while formula.parent is not None:
-                formula = formula.parent
-            self.contradiction_parent = formula
+            self.set_contradiction(e)
+        except BudgetExceeded as e:
+            self.budget_exceeded = e.reason
+        if hooks is not None:
+            hooks.phase("propagate", time.perf_counter() - start)
+
+        if search and not self.contradiction and self.budget_exceeded is None:
+            if hooks is not None:
+                start = time.perf_counter()
+            try:
+                self.search()
+            except BudgetExceeded as e:
+                self.budget_exceeded = e.reason
+            if hooks is not None:
+                hooks.phase("search", time.perf_counter() - start)
 
         self.unfulled_symbols = []
         if not self.contradiction:
             for symbol in self.symbols:
                 if symbol.truth_value is None:
                     self.unfulled_symbols.append(symbol)
+            if search and self.budget_exceeded is None and len(self.unfulled_symbols) == 0:
+                self.countermodel = self.get_countermodel()
+        if self.budget_exceeded is not None:
+            self.partial_assignment = OrderedDict()
+            for symbol in self.symbols:
+                if symbol.truth_value is not None:
+                    self.partial_assignment[str(symbol.symbol)] = symbol.truth_value
+        if hooks is not None:
+            hooks.finished(self, self.get_counters())
 
-    def break_apart_formulas(self):
+    def prepare_formula(self, formula):
+        return flatten(formula) if self.flatten else formula
+
+    def get_counters(self):
+        """
+        Get how much work solving the table took
+        :return:
+        :rtype: collections.OrderedDict
+        """
+        counters = OrderedDict()
+        counters["nodes"] = len(self.nodes)
+        counters["steps"] = self.count - 1
+        counters["symbol_lookups"] = self.symbol_lookups
+        counters["interned_lookups"] = self.interned_lookups
+        counters["passes"] = self.passes
+        # a contradiction found while searching is also counted as a conflict
+        counters["contradictions"] = max(self.search_stats["conflicts"], int(self.contradiction))
+        return counters
+
+    def set_contradiction(self, exception):
+        """
+        Record the contradiction we've run into
+        :param exception:
+        :type exception: FormulaException
+        :return:
         """
+        self.contradiction = True
+        self.contradiction_formula = exception.formula
+        formula = exception.formula
+        while formula.parent is not None:
+            formula = formula.parent
+        self.contradiction_parent = formula
 
+    def break_apart_formulas(self):
+        """
+        Build the tree (or with share_subformulas, the DAG) for each formula and index every occurrence of
+        each symbol
         :return:
         """
+        self.nodes_built = len(self.formulas)
+        for i in range(len(self.formulas)):
+            self.formulas[i] = self.build_formula(self.formulas[i])
+
+        # nodes and occurrences are indexed depth first (left to right) so that symbol updates and the
+        # worklist visit them in the same order as walking every formula tree would
         for formula in self.formulas:
-            broken_formula = [formula]
-            while len(broken_formula) > 0:
-                use_formula = broken_formula.pop(0)
-                assert(isinstance(use_formula, ShortTruthTableFormula))
-                if is_atomic(use_formula.formula):
-                    not_in = True
-                    for symbol in self.symbols:
-                        if use_formula.formula == symbol.symbol:
-                            not_in = False
-                            break
-                    if not_in:
-                        self.symbols.append(ShortTruthTableSymbol(use_formula.formula))
-                else:
-                    for arg in use_formula.formula.args:
-                        new_child = ShortTruthTableFormula(arg, use_formula)
-                        use_formula.children.append(new_child)
-                        broken_formula.append(new_child)
+            self.index_formula(formula)
+
+    def build_formula(self, root):
+        """
+        Build the tree below the root, or with share_subformulas get the node for it in the DAG
+        :param root:
+        :type root: ShortTruthTableFormula
+        :return: the root node
+        :rtype: ShortTruthTableFormula
+        """
+        if self.share_subformulas:
+            return self.share_formula(root.formula)
+        broken_formula = [root]
+        j = 0
+        while j < len(broken_formula):
+            use_formula = broken_formula[j]
+            j += 1
+            assert(isinstance(use_formula, ShortTruthTableFormula))
+            if is_atomic(use_formula.formula):
+                use_formula.symbol = self.get_symbol(use_formula.formula)
+            else:
+                for arg in use_formula.formula.args:
+                    new_child = ShortTruthTableFormula(arg, use_formula)
+                    use_formula.children.append(new_child)
+                    broken_formula.append(new_child)
+                    self.nodes_built += 1
+                    if self.meter is not None:
+                        self.meter.node(self.nodes_built)
+        return root
+
+    def index_formula(self, root):
+        """
+        Add the nodes below the root that aren't indexed yet to nodes and their symbols' occurrences
+        :param root:
+        :type root: ShortTruthTableFormula
+        :return:
+        """
+        stack = [root]
+        while len(stack) > 0:
+            use_formula = stack.pop()
+            if use_formula.index is not None:
+                # a shared subformula we have already reached from another parent
+                continue
+            use_formula.index = len(self.nodes)
+            self.nodes.append(use_formula)
+            if use_formula.symbol is not None:
+                use_formula.symbol.occurrences.append(use_formula)
+            stack.extend(reversed(use_formula.children))
+
+    def share_formula(self, formula):
+        """
+        Get the node for the formula, reusing the node of any structurally identical formula already seen
+        :param formula:
+        :type formula: Formula
+        :return:
+        :rtype: ShortTruthTableFormula
+        """
+        nodes = []
+        stack = [(formula, False)]
+        while len(stack) > 0:
+            formula, visited = stack.pop()
+            if is_atomic(formula):
+                children = []
+                symbol = self.get_symbol(formula)
+                key = symbol.id
+            elif not visited:
+                stack.append((formula, True))
+                for i in range(len(formula.args) - 1, -1, -1):
+                    stack.append((formula.args[i], False))
+                continue
+            else:
+                children = nodes[len(nodes) - len(formula.args):]
+                del nodes[len(nodes) - len(formula.args):]
+                key = (type(formula).__name__,) + tuple(id(child) for child in children)
+
+            node = self.shared_formulas.get(key)
+            if node is None:
+                node = ShortTruthTableFormula(formula)
+                node.children = children
+                for child in children:
+                    if child.parent is None:
+                        child.parent = node
+                    child.parents.append(node)
+                # the children may already be set, if the node is added to a table that was solved
+                node.count_children()
+                if is_atomic(formula):
+                    node.symbol = symbol
+                self.shared_formulas[key] = node
+                if self.meter is not None:
+                    self.meter.node(len(self.shared_formulas))
+            nodes.append(node)
+        return nodes[0]
+
+    def get_symbol(self, formula):
+        """
+        Get the symbol of an atom, adding it if it is new. Atoms are interned, an atom object that has been seen
+        before is matched to its symbol by identity and only new objects are compared by their text
+        :param formula:
+        :type formula: Formula
+        :return:
+        :rtype: ShortTruthTableSymbol
+        """
+        interned = self.interned.get(id(formula))
+        if interned is not None:
+            self.interned_lookups += 1
+            return interned[1]
+        key = symbol_key(formula)
+        self.symbol_lookups += 1
+        symbol = self.symbol_map.get(key)
+        if symbol is None:
+            symbol = ShortTruthTableSymbol(formula, self.next_symbol_id)
+            self.next_symbol_id += 1
+            self.symbol_map[key] = symbol
+            self.symbols.append(symbol)
+        self.interned[id(formula)] = (formula, symbol)
+        return symbol
 
-    def set_truth_value(self, formula, boolean):
+    def set_truth_value(self, formula, boolean, reason=None):
         """
 
         :param formula:
         :type formula: ShortTruthTableFormula
         :param boolean:
         :type boolean: bool
+        :param reason: what forces the truth value, see ShortTruthTableFormula.reason
         :return:
         """
         if formula.truth_value is boolean:
             # we've already dealt with this formula and we don't have a contradiction
             return False
-        formula.set_truth_value(boolean, self.count)
-        update_symbol = None
-        if is_atomic(formula.formula):
-            for symbol in self.symbols:
-                if formula.formula == symbol.symbol:
-                    # prevent running update_symbols in a recursive mess
-                    if formula.truth_value == symbol.truth_value:
-                        break
+
+        # formulas still to be set, or (parent, child) pairs whose parent has to be updated for the child that
+        # was just set. Kept as a stack, so everything happens in the same order as calling ourselves recursively
+        pending = [(formula, boolean, reason)]
+        while len(pending) > 0:
+            formula, boolean, reason = pending.pop()
+            if isinstance(boolean, ShortTruthTableFormula):
+                boolean = self.update_parent(formula, boolean)
+                if boolean is not None:
+                    pending.append((formula, boolean, formula))
+                continue
+            if formula.truth_value is boolean:
+                continue
+
+            try:
+                formula.set_truth_value(boolean, self.count)
+            except FormulaException as e:
+                e.antecedents = [formula] + self.get_antecedents(formula, reason)
+                raise
+            formula.reason = reason
+            formula.trail_index = len(self.trail)
+            self.trail.append(formula)
+            self.queue_formula(formula)
+            for parent in formula.parents:
+                self.queue_formula(parent)
+            update_symbol = None
+            symbol = formula.symbol
+            # prevent running update_symbols in a recursive mess
+            if symbol is not None and formula.truth_value != symbol.truth_value:
+                self.symbol_lookups += 1
+                try:
                     symbol.set_truth_value(formula, self.count)
-                    update_symbol = symbol
-                    break
-        self.count += 1
-        if update_symbol is not None:
-            for formula in self.formulas:
-                self.update_symbol(formula, update_symbol)
+                except FormulaException as e:
+                    e.antecedents = [formula, symbol.formula]
+                    raise
+                update_symbol = symbol
+            self.count += 1
+            if self.meter is not None:
+                self.meter.step()
 
-        if formula.parent is not None:
-            self.update_parent(formula.parent, formula)
+            for i in range(len(formula.parents) - 1, -1, -1):
+                pending.append((formula.parents[i], formula, None))
+            if update_symbol is not None:
+                for occurrence in reversed(update_symbol.occurrences):
+                    pending.append((occurrence, update_symbol.truth_value, update_symbol))
 
         return True
 
     def update_parent(self, formula, child):
-        child_idx = -1
-        for i in range(len(formula.children)):
-            if formula.children[i] == child:
-                child_idx = i
-                break
-
-        other_idx = 0 if child_idx == 1 else 1
-        
+        """
+        Work out the truth value the child that was just set forces onto its parent
+        :param formula:
+        :type formula: ShortTruthTableFormula
+        :param child:
+        :type child: ShortTruthTableFormula
+        :return: the truth value to set the parent to, None if it is not forced
+        """
         if isinstance(formula.formula, Not):
-            self.set_truth_value(formula, not child.truth_value)
+            return not child.truth_value
         elif isinstance(formula.formula, And):
-            if child.truth_value is False:
-                self.set_truth_value(formula, False)
-            elif child.truth_value is True:
-                if formula.children[other_idx].truth_value is True:
-                    self.set_truth_value(formula, True)
-                elif formula.children[other_idx].truth_value is False:
-                    self.set_truth_value(formula, False)
+            if formula.false_children > 0:
+                return False
+            elif formula.true_children == len(formula.children):
+                return True
+            return None
         elif isinstance(formula.formula, Or):
-            if child.truth_value is True:
-                self.set_truth_value(formula, True)
-            elif child.truth_value is False:
-                if formula.children[other_idx].truth_value is True:
-                    self.set_truth_value(formula, True)
-                elif formula.children[other_idx].truth_value is False:
-                    self.set_truth_value(formula, False)
-        elif isinstance(formula.formula, If):
+            if formula.true_children > 0:
+                return True
+            elif formula.false_children == len(formula.children):
+                return False
+            return None
+
+        child_idx = 0 if formula.children[0] is child else 1
+        other_idx = 1 - child_idx
+        if isinstance(formula.formula, If):
             if child_idx == 1:
                 if child.truth_value is True:
-                    self.set_truth_value(formula, True)
+                    return True
                 elif child.truth_value is False and formula.children[0].truth_value is True:
-                    self.set_truth_value(formula, False)
+                    return False
                 elif child.truth_value is False and formula.children[0].truth_value is False:
-                    self.set_truth_value(formula, True)
+                    return True
             else:
                 if child.truth_value is False:
-                    self.set_truth_value(formula, True)
+                    return True
                 elif child.truth_value is True and formula.children[1].truth_value is False:
-                    self.set_truth_value(formula, False)
+                    return False
                 elif child.truth_value is True and formula.children[1].truth_value is True:
-                    self.set_truth_value(formula, True)
+                    return True
         elif isinstance(formula.formula, Iff):
             if child.truth_value is not None and child.truth_value == formula.children[other_idx].truth_value:
-                self.set_truth_value(formula, True)
-            elif child.truth_value is not None and formula.children[other_idx] is not None \
+                return True
+            elif child.truth_value is not None and formula.children[other_idx].truth_value is not None \
                     and child.truth_value != formula.children[other_idx].truth_value:
-                self.set_truth_value(formula, False)
+                return False
+        return None
 
-    def update_symbol(self, formula, symbol):
+    def queue_formula(self, formula):
         """
-
+        Queue a formula to be evaluated by the worklist engine. Formulas behind the one currently being evaluated
+        wait for the next pass, mirroring when a sweep of every formula tree would get back around to them
         :param formula:
         :type formula: ShortTruthTableFormula
-        :param symbol:
-        :type symbol: ShortTruthTableSymbol
         :return:
         """
-        if formula.formula == symbol.symbol:
-            self.set_truth_value(formula, symbol.truth_value)
+        if formula.queued or self.cursor is None:
+            return
+        formula.queued = True
+        if formula.index > self.cursor:
+            heapq.heappush(self.queue, formula.index)
         else:
-            for child in formula.children:
-                self.update_symbol(child, symbol)
+            heapq.heappush(self.next_queue, formula.index)
 
     def evaluate_table(self):
+        if self.engine == "sweep":
+            self.evaluate_sweep()
+        else:
+            self.evaluate_worklist()
+
+    def evaluate_sweep(self):
         can_evaluate = True
         while can_evaluate:
             can_evaluate = False
-            for formula in self.formulas:
-                evaluate = self.evaluate_formula(formula)
+            self.passes += 1
+            # self.nodes walks every formula tree in order, visiting shared subformulas only the once
+            for formula in self.nodes:
+                evaluate = self.evaluate_node(formula)
                 can_evaluate = evaluate or can_evaluate
 
-    def evaluate_formula(self, formula):
+    def evaluate_worklist(self):
+        """
+        Evaluate only the formulas queued since they were last evaluated, in the same order (and with the same
+        passes) as evaluate_sweep so that the step numbering is identical
+        :return:
         """
+        for formula in self.nodes:
+            formula.queued = True
+        self.queue = list(range(len(self.nodes)))
+        self.next_queue = []
+        self.cursor = -1
+        self.passes += 1
+        can_evaluate = False
+        try:
+            while True:
+                if len(self.queue) == 0:
+                    if not can_evaluate or len(self.next_queue) == 0:
+                        break
+                    self.queue, self.next_queue = self.next_queue, []
+                    self.cursor = -1
+                    self.passes += 1
+                    can_evaluate = False
+                self.cursor = heapq.heappop(self.queue)
+                formula = self.nodes[self.cursor]
+                formula.queued = False
+                evaluate = self.evaluate_node(formula)
+                can_evaluate = evaluate or can_evaluate
+        finally:
+            self.cursor = None
 
+    def evaluate_node(self, formula):
+        """
+        Apply the rules for the formula's connective, setting the formula from its children or its children
+        from the formula
         :param formula:
         :type formula: ShortTruthTableFormula
-        :return:
+        :return: whether anything was set
         """
         change = False
 
         if is_atomic(formula.formula):
-            if formula.truth_value is None:
-                for symbol in self.symbols:
-                    if symbol == formula.formula:
-                        if symbol.truth_value is not None:
-                            self.set_truth_value(formula, symbol.truth_value)
-                            change = True
-                        break
+            if formula.truth_value is None and formula.symbol.truth_value is not None:
+                self.set_truth_value(formula, formula.symbol.truth_value, formula.symbol)
+                change = True
             return change
 
         if formula.truth_value is None:
             if isinstance(formula.formula, Not):
                 if formula.children[0].truth_value is not None:
-                    self.set_truth_value(formula, not formula.children[0].truth_value)
+                    self.set_truth_value(formula, not formula.children[0].truth_value, formula)
                     change = True
             elif isinstance(formula.formula, And):
-                if formula.children[0].truth_value is False or formula.children[1].truth_value is False:
-                    self.set_truth_value(formula, False)
+                if formula.false_children > 0:
+                    self.set_truth_value(formula, False, formula)
                     change = True
-                elif formula.children[0].truth_value is True and formula.children[1].truth_value is True:
-                    self.set_truth_value(formula, True)
+                elif formula.true_children == len(formula.children):
+                    self.set_truth_value(formula, True, formula)
                     change = True
             elif isinstance(formula.formula, Or):
-                if formula.children[0].truth_value is True or formula.children[1].truth_value is True:
-                    self.set_truth_value(formula, True)
+                if formula.true_children > 0:
+                    self.set_truth_value(formula, True, formula)
                     change = True
-                elif formula.children[0].truth_value is False and formula.children[1].truth_value is False:
-                    self.set_truth_value(formula, False)
+                elif formula.false_children == len(formula.children):
+                    self.set_truth_value(formula, False, formula)
                     change = True
             elif isinstance(formula.formula, If):
                 if formula.children[0].truth_value is True and formula.children[1].truth_value is False:
-                    self.set_truth_value(formula, False)
+                    self.set_truth_value(formula, False, formula)
                     change = True
                 elif formula.children[0].truth_value is False or formula.children[1].truth_value is True:
-                    self.set_truth_value(formula, True)
+                    self.set_truth_value(formula, True, formula)
                     change = True
             elif isinstance(formula.formula, Iff):
                 if (formula.children[0].truth_value is True and formula.children[1].truth_value is True) or \
                         (formula.children[0].truth_value is False and formula.children[1].truth_value is False):
-                    self.set_truth_value(formula, True)
+                    self.set_truth_value(formula, True, formula)
                     change = True
                 elif formula.children[0].truth_value is not None and formula.children[1].truth_value is not None and \
                         formula.children[0].truth_value is not formula.children[1].truth_value:
-                    self.set_truth_value(formula, False)
+                    self.set_truth_value(formula, False, formula)
                     change = True
 
-        not_done = True
-        for child in formula.children:
-            if child.truth_value is None:
-                not_done = False
-                break
-
-        if not not_done and formula.truth_value is not None:
+        unset_children = len(formula.children) - formula.true_children - formula.false_children
+        if unset_children > 0 and formula.truth_value is not None:
             if isinstance(formula.formula, Not):
-                self.set_truth_value(formula.children[0], not formula.truth_value)
+                self.set_truth_value(formula.children[0], not formula.truth_value, formula)
                 change = True
             elif isinstance(formula.formula, And):
                 if formula.truth_value is True:
-                    self.set_truth_value(formula.children[0], True)
-                    self.set_truth_value(formula.children[1], True)
+                    for child in formula.children:
+                        self.set_truth_value(child, True, formula)
+                    change = True
+                elif formula.true_children == len(formula.children) - 1:
+                    # every other child is True, so the one left has to be False
+                    self.set_truth_value(self.get_unset_child(formula), False, formula)
                     change = True
-                else:
-                    if formula.children[0].truth_value is True:
-                        self.set_truth_value(formula.children[1], False)
-                        change = True
-                    elif formula.children[1].truth_value is True:
-                        self.set_truth_value(formula.children[0], False)
-                        change = True
             elif isinstance(formula.formula, Or):
                 if formula.truth_value is False:
-                    self.set_truth_value(formula.children[0], False)
-                    self.set_truth_value(formula.children[1], False)
+                    for child in formula.children:
+                        self.set_truth_value(child, False, formula)
+                    change = True
+                elif formula.false_children == len(formula.children) - 1:
+                    self.set_truth_value(self.get_unset_child(formula), True, formula)
                     change = True
-                else:
-                    if formula.children[0] is False:
-                        self.set_truth_value(formula.children[1], True)
-                        change = True
-                    elif formula.children[1] is False:
-                        self.set_truth_value(formula.children[0], True)
-                        change = True
             elif isinstance(formula.formula, If):
                 if formula.truth_value is False:
-                    self.set_truth_value(formula.children[0], True)
-                    self.set_truth_value(formula.children[1], False)
+                    self.set_truth_value(formula.children[0], True, formula)
+                    self.set_truth_value(formula.children[1], False, formula)
                     change = True
                 else:
                     if formula.children[0].truth_value is True:
-                        self.set_truth_value(formula.children[1], True)
+                        self.set_truth_value(formula.children[1], True, formula)
+                        change = True
                     elif formula.children[1].truth_value is False:
-                        self.set_truth_value(formula.children[0], False)
+                        self.set_truth_value(formula.children[0], False, formula)
+                        change = True
             elif isinstance(formula.formula, Iff):
                 if formula.truth_value is True:
                     if formula.children[0].truth_value is not None:
-                        self.set_truth_value(formula.children[1], formula.children[0].truth_value)
+                        self.set_truth_value(formula.children[1], formula.children[0].truth_value, formula)
                         change = True
                     elif formula.children[1].truth_value is not None:
-                        self.set_truth_value(formula.children[0], formula.children[1].truth_value)
+                        self.set_truth_value(formula.children[0], formula.children[1].truth_value, formula)
                         change = True
                 elif formula.truth_value is False:
                     if formula.children[0].truth_value is not None:
-                        self.set_truth_value(formula.children[1], not formula.children[0].truth_value)
+                        self.set_truth_value(formula.children[1], not formula.children[0].truth_value, formula)
                         change = True
                     elif formula.children[1].truth_value is not None:
-                        self.set_truth_value(formula.children[0], not formula.children[1].truth_value)
+                        self.set_truth_value(formula.children[0], not formula.children[1].truth_value, formula)
                         change = True
 
+        return change
+
+    @staticmethod
+    def get_unset_child(formula):
         for child in formula.children:
-            change_child = self.evaluate_formula(child)
-            change = change_child or change
+            if child.truth_value is None:
+                return child
+        return None
+
+    def get_antecedents(self, formula, reason):
+        """
+        Get the formulas whose truth values were used to force the truth value of the formula
+        :param formula:
+        :type formula: ShortTruthTableFormula
+        :param reason: see ShortTruthTableFormula.reason
+        :return:
+        :rtype: List[ShortTruthTableFormula]
+        """
+        if reason is None or reason is DECISION:
+            return []
+        elif isinstance(reason, ShortTruthTableSymbol):
+            return [reason.formula]
+        elif reason is formula:
+            return list(formula.children)
+        elif isinstance(reason, ShortTruthTableFormula):
+            return [reason] + [child for child in reason.children if child is not formula]
+        return list(reason)
+
+    def search(self):
+        """
+        Branch on the symbols that propagation could not work out. A contradiction learns a clause of the
+        guesses that caused it, and we jump back to the earliest guess where that clause forces a symbol. Stops
+        on a countermodel (every symbol set) or once a contradiction no longer depends on any guess
+        :return:
+        """
+        self.score_symbols()
+        # the trail length, count and symbol for each guess we've made
+        levels = []
+        conflict = None
+        self.clear_queue()
+        try:
+            try:
+                self.propagate()
+            except FormulaException as e:
+                conflict = e
+
+            while True:
+                if conflict is None:
+                    symbol = self.choose_symbol()
+                    if symbol is None:
+                        return
+                    levels.append((len(self.trail), self.count, symbol))
+                    self.search_stats["decisions"] += 1
+                    self.search_stats["max_depth"] = max(self.search_stats["max_depth"], len(levels))
+                    try:
+                        self.set_truth_value(symbol.occurrences[0], self.phases.get(symbol, False), DECISION)
+                        self.propagate()
+                    except FormulaException as e:
+                        conflict = e
+                    continue
+
+                self.search_stats["conflicts"] += 1
+                clause = self.analyze(conflict.antecedents)
+                if len(levels) == 0 or len(clause) == 0:
+                    self.set_contradiction(conflict)
+                    return
+
+                level_of = {}
+                for i in range(len(levels)):
+                    level_of[levels[i][2]] = i + 1
+                clause.sort(key=lambda literal: level_of[literal[0]])
+                self.add_clause(clause)
+                self.search_stats["learnt_clauses"] += 1
+                for symbol, _ in clause:
+                    self.activity[symbol] += self.activity_bump
+                    self.push_symbol(symbol)
+                self.activity_bump /= ACTIVITY_DECAY
 
+                level = level_of[clause[-2][0]] if len(clause) > 1 else 0
+                if level < len(levels) - 1:
+                    self.search_stats["backjumps"] += 1
+                trail_length, count, _ = levels[level]
+                del levels[level:]
+                self.undo(trail_length, count)
+                self.clear_queue()
+
+                symbol, boolean = clause[-1]
+                conflict = None
+                try:
+                    reason = [literal[0].formula for literal in clause[:-1]]
+                    self.set_truth_value(symbol.occurrences[0], not boolean, reason)
+                    self.propagate()
+                except FormulaException as e:
+                    conflict = e
+        finally:
+            self.clear_queue()
+            self.cursor = None
+
+    def score_symbols(self):
+        """
+        Start the activity of each symbol at how many formulas it appears in
+        :return:
+        """
+        for symbol in self.symbols:
+            activity = 0.0
+            for formula in symbol.occurrences:
+                activity += len(formula.parents)
+            self.activity[symbol] = activity
+        self.activity_heap = []
+        for symbol in self.symbols:
+            self.push_symbol(symbol)
+
+    def push_symbol(self, symbol):
+        # the push number keeps two entries for the same symbol from ever comparing the symbols themselves
+        self.activity_pushes += 1
+        heapq.heappush(self.activity_heap, (-self.activity[symbol], symbol.id, self.activity_pushes, symbol))
+
+    def iterate_countermodels(self):
+        """
+        Lazily go through every countermodel of the argument, branching only on the symbols that propagation could
+        not work out. Each countermodel found is blocked by the clause of the guesses that led to it, so the last
+        guess is flipped, and guesses are undone in the order they were made. A clause is dropped once its guesses
+        are undone, as the order of the guesses already stops anything before it coming up again, so the memory
+        used doesn't grow however many countermodels there are. Any guesses searching made are undone first, and
+        the table is left with only what propagation set
+        :return: each countermodel, see get_countermodel
+        """
+        if not self.built:
+            raise ValueError("Cannot search a table that ran out of budget before it was built")
+        if self.contradiction:
+            return
+
+        # everything set before the first guess follows from the argument alone
+        self.compact_trail()
+        start = len(self.trail)
+        start_count = self.count
+        for i in range(len(self.trail)):
+            if self.trail[i].reason is DECISION:
+                start = i
+                start_count = self.trail[i].number
+                break
+        self.undo(start, start_count)
+        self.score_symbols()
+        # the trail length, count and symbol for each guess, and whether it has been flipped
+        levels = []
+        self.clear_queue()
+        try:
+            try:
+                self.propagate()
+                blocked = False
+            except FormulaException:
+                blocked = True
+
+            while True:
+                if not blocked:
+                    symbol = self.choose_symbol()
+                    if symbol is None:
+                        yield self.get_countermodel()
+                        blocked = True
+                        continue
+                    levels.append((len(self.trail), self.count, symbol, False))
+                    try:
+                        self.set_truth_value(symbol.occurrences[0], False, DECISION)
+                        self.propagate()
+                    except FormulaException:
+                        blocked = True
+                    continue
+
+                while len(levels) > 0 and levels[-1][3]:
+                    levels.pop()
+                if len(levels) == 0:
+                    return
+                trail_length, count, symbol, _ = levels.pop()
+                self.undo(trail_length, count)
+                self.clear_queue()
+                levels.append((trail_length, count, symbol, True))
+                blocked = False
+                try:
+                    # the blocking clause, all the earlier guesses together with this one cannot hold again
+                    reason = [level[2].formula for level in levels[:-1]]
+                    self.set_truth_value(symbol.occurrences[0], True, reason)
+                    self.propagate()
+                except FormulaException:
+                    blocked = True
+        finally:
+            self.undo(start, start_count)
+            self.clear_queue()
+            self.cursor = None
+            self.unfulled_symbols = [symbol for symbol in self.symbols if symbol.truth_value is None]
+
+    def propagate(self):
+        """
+        Evaluate queued formulas and learnt clauses until nothing more can be set
+        :return:
+        """
+        while True:
+            while len(self.queue) > 0 or len(self.next_queue) > 0:
+                if len(self.queue) == 0:
+                    self.queue, self.next_queue = self.next_queue, []
+                    self.cursor = -1
+                    self.passes += 1
+                self.cursor = heapq.heappop(self.queue)
+                formula = self.nodes[self.cursor]
+                formula.queued = False
+                self.evaluate_node(formula)
+            if not self.check_clauses():
+                break
+
+    def add_clause(self, clause):
+        """
+        Learn a clause, watching its last two guesses: the one it is about to force and the latest of the rest
+        :param clause: (symbol, truth value) guesses that cannot all hold together, in the order they were made
+        :return:
+        """
+        index = len(self.learnt_clauses)
+        clause = list(clause)
+        self.learnt_clauses.append(clause)
+        if len(clause) == 1:
+            self.unit_clauses.append(clause)
+            return
+        clause[0], clause[-1] = clause[-1], clause[0]
+        clause[1], clause[-2] = clause[-2], clause[1]
+        self.watches[clause[0][0]].append(index)
+        self.watches[clause[1][0]].append(index)
+
+    def check_clauses(self):
+        """
+        Check the learnt clauses, each of which is a list of (symbol, truth value) guesses that cannot all hold
+        together. If all but one of them hold, the last symbol is set to the opposite value. Only the clauses
+        watching a symbol set since the last check are looked at
+        :return: whether anything was set
+        """
+        change = False
+        if self.units_undone:
+            self.units_undone = False
+            for clause in self.unit_clauses:
+                symbol, boolean = clause[0]
+                if symbol.truth_value is boolean:
+                    exception = FormulaException(symbol.formula)
+                    exception.antecedents = [symbol.formula]
+                    raise exception
+                if symbol.truth_value is None:
+                    self.set_truth_value(symbol.occurrences[0], not boolean, [])
+                    change = True
+        while self.clause_head < len(self.trail):
+            formula = self.trail[self.clause_head]
+            self.clause_head += 1
+            if formula is None or formula.symbol is None or formula.symbol.formula is not formula:
+                continue
+            symbol = formula.symbol
+            watching = self.watches.get(symbol)
+            if not watching:
+                continue
+            # clauses still watching the symbol once this is done
+            kept = []
+            i = 0
+            try:
+                while i < len(watching):
+                    index = watching[i]
+                    i += 1
+                    clause = self.learnt_clauses[index]
+                    if clause[0][0] is symbol:
+                        clause[0], clause[1] = clause[1], clause[0]
+                    other, boolean = clause[0]
+                    if clause[1][1] is not symbol.truth_value or \
+                            (other.truth_value is not None and other.truth_value is not boolean):
+                        # one of the guesses can't hold any more
+                        kept.append(index)
+                        continue
+                    for j in range(2, len(clause)):
+                        if clause[j][0].truth_value is not clause[j][1]:
+                            clause[1], clause[j] = clause[j], clause[1]
+                            self.watches[clause[1][0]].append(index)
+                            break
+                    else:
+                        kept.append(index)
+                        reason = [literal[0].formula for literal in clause[1:]]
+                        if other.truth_value is None:
+                            self.set_truth_value(other.occurrences[0], not boolean, reason)
+                            change = True
+                        else:
+                            reason.append(other.formula)
+                            exception = FormulaException(reason[-1])
+                            exception.antecedents = reason
+                            raise exception
+            finally:
+                self.watches[symbol] = kept + watching[i:]
         return change
 
+    def analyze(self, antecedents):
+        """
+        Follow the reasons of the given formulas back to the guesses they depend on
+        :param antecedents:
+        :type antecedents: List[ShortTruthTableFormula]
+        :return: the (symbol, truth value) guesses
+        """
+        clause = []
+        seen = set()
+        stack = list(antecedents)
+        while len(stack) > 0:
+            formula = stack.pop()
+            if formula.truth_value is None or formula.index in seen:
+                continue
+            seen.add(formula.index)
+            if formula.reason is DECISION:
+                clause.append((formula.symbol, formula.truth_value))
+                continue
+            for antecedent in self.get_antecedents(formula, formula.reason):
+                if antecedent.truth_value is not None and antecedent.trail_index < formula.trail_index:
+                    stack.append(antecedent)
+        return clause
 
-if __name__ == "__main__":
-    PARSER = argparse.ArgumentParser(description="Generate Truth Table for a logical formula")
-    PARSER.add_argument('formulas', metavar='formula', type=str, nargs="*", help='Logical formula')
-    PARSER.add_argument('goal', metavar='goal', type=str, help='Goal Formula')
-    PARSER_ARGS = PARSER.parse_args()
-    SHORT_TRUTH_TABLE = runner(PARSER_ARGS.formulas, PARSER_ARGS.goal)
-    if SHORT_TRUTH_TABLE.contradiction:
-        print("Contradiction trying to set " + str(SHORT_TRUTH_TABLE.contradiction_formula) + " as " +
-              str(not SHORT_TRUTH_TABLE.contradiction_formula.truth_value) + " on step " +
-              str(SHORT_TRUTH_TABLE.count))
+    def choose_symbol(self):
+        """
+        Get the unset symbol with the most activity, None if every symbol is set
+        :return:
+        :rtype: ShortTruthTableSymbol
+        """
+        while len(self.activity_heap) > 0:
+            activity, _, _, symbol = self.activity_heap[0]
+            if symbol.truth_value is None and -activity == self.activity[symbol] and len(symbol.occurrences) > 0:
+                return symbol
+            heapq.heappop(self.activity_heap)
+        return None
+
+    def undo(self, trail_length, count):
+        """
+        Unset everything set after the trail was the given length
+        :param trail_length:
+        :param count: the step count to go back to
+        :return:
+        """
+        while len(self.trail) > trail_length:
+            formula = self.trail.pop()
+            symbol = formula.symbol
+            if symbol is not None and symbol.formula is formula:
+                self.phases[symbol] = symbol.truth_value
+                symbol.formula = None
+                symbol.truth_value = None
+                symbol.number = None
+                if symbol in self.activity:
+                    self.push_symbol(symbol)
+            formula.unset_truth_value()
+        self.count = count
+        self.clause_head = min(self.clause_head, trail_length)
+        self.units_undone = len(self.unit_clauses) > 0
+
+    def clear_queue(self):
+        for index in self.queue:
+            self.nodes[index].queued = False
+        for index in self.next_queue:
+            self.nodes[index].queued = False
+        self.queue = []
+        self.next_queue = []
+        self.cursor = -1
+
+    def get_countermodel(self):
+        """
+        Get the truth value of every symbol, checking that it makes every premise true and the goal false
+        :return:
+        :rtype: collections.OrderedDict
+        """
+        values = {}
+        for key in self.symbol_map:
+            values[key] = self.symbol_map[key].truth_value
+        for formula in self.basic_formulas:
+            if not evaluate(formula, values):
+                raise RuntimeError("Countermodel does not satisfy premise " + str(formula))
+        if evaluate(self.goal, values):
+            raise RuntimeError("Countermodel does not falsify goal " + str(self.goal))
+
+        countermodel = OrderedDict()
+        for symbol in self.symbols:
+            countermodel[str(symbol.symbol)] = symbol.truth_value
+        return countermodel
+
+    def add_premise(self, formula):
+        """
+        Add a premise to the end of the premises, building and propagating only from it
+        :param formula:
+        :type formula: Formula
+        :return:
+        """
+        self.start_edit()
+        self.basic_formulas = list(self.basic_formulas) + [formula]
+        size = len(self.nodes)
+        root = self.attach_formula(ShortTruthTableFormula(self.prepare_formula(formula)))
+        self.formulas.insert(len(self.formulas) - 1, root)
+        self.finish_edit([], self.nodes[size:], False)
+
+    def remove_premise(self, index):
+        """
+        Remove a premise, unsetting only the truth values that depended on it
+        :param index: which premise
+        :type index: int
+        :return:
+        """
+        if index < 0 or index >= len(self.formulas) - 1:
+            raise IndexError("No premise " + str(index))
+        self.start_edit()
+        self.basic_formulas = list(self.basic_formulas[:index]) + list(self.basic_formulas[index + 1:])
+        self.finish_edit(self.detach_formula(self.formulas.pop(index)), [])
+
+    def replace_goal(self, goal):
+        """
+        Replace the goal, unsetting only the truth values that depended on the old one
+        :param goal:
+        :type goal: Formula
+        :return:
+        """
+        self.start_edit()
+        self.goal = goal
+        removed = self.detach_formula(self.formulas.pop())
+        size = len(self.nodes)
+        self.formulas.append(self.attach_formula(ShortTruthTableFormula(Not(self.prepare_formula(goal)))))
+        self.finish_edit(removed, self.nodes[size:])
+
+    def renumber(self):
+        """
+        Solve the table again from scratch, so that after edits the step numbers and the contradiction found are
+        those of a fresh table rather than following the order the edits were made in. Every step number depends
+        on where each formula is, so this takes as long as the first solve. Edits leave it until the steps are
+        reported (see get_result), the verdict and the symbols left unset are already those of a fresh table
+        :return:
+        """
+        table = ShortTruthTable(self.basic_formulas, self.goal, self.engine, self.share_subformulas,
+                                self.search_enabled, self.hooks, self.budget, self.flatten)
+        self.__dict__.update(table.__dict__)
+
+    def start_edit(self):
+        if getattr(self, "preprocessing", None) is not None:
+            raise ValueError("Cannot edit a table solved for a preprocessed argument")
+        if not self.built:
+            raise ValueError("Cannot edit a table that ran out of budget before it was built")
+        self.clear_queue()
+
+    def attach_formula(self, root):
+        """
+        Build and index a new formula tree
+        :param root:
+        :type root: ShortTruthTableFormula
+        :return: the root node
+        :rtype: ShortTruthTableFormula
+        """
+        root = self.build_formula(root)
+        self.index_formula(root)
+        return root
+
+    def detach_formula(self, root):
+        """
+        Take the nodes of a formula that was removed out of the table, leaving any that are still shared with
+        another formula
+        :param root:
+        :type root: ShortTruthTableFormula
+        :return: the nodes taken out, along with the root if it was set as a premise but is still in use
+        :rtype: List[ShortTruthTableFormula]
+        """
+        removed = []
+        stack = [root]
+        while len(stack) > 0:
+            formula = stack.pop()
+            if formula.index is None or len(formula.parents) > 0 or any(other is formula for other in self.formulas):
+                # already taken out through another parent, or still in use
+                continue
+            removed.append(formula)
+            # move the last node into its slot, the order only matters again once the table is renumbered
+            last = self.nodes.pop()
+            if last is not formula:
+                last.index = formula.index
+                self.nodes[last.index] = last
+            formula.index = None
+            if self.share_subformulas:
+                del self.shared_formulas[self.get_shared_key(formula)]
+            symbol = formula.symbol
+            if symbol is not None:
+                symbol.occurrences.remove(formula)
+                if len(symbol.occurrences) == 0:
+                    self.symbols.remove(symbol)
+                    del self.symbol_map[symbol_key(symbol.symbol)]
+                    # rarely needed, so rather than finding the atoms interned to the symbol start again
+                    self.interned.clear()
+            for child in formula.children:
+                child.parents.remove(formula)
+                if child.parent is formula:
+                    child.parent = child.parents[0] if len(child.parents) > 0 else None
+                stack.append(child)
+        if root.index is not None and root.truth_value is not None and root.reason is None:
+            removed.append(root)
+        return removed
+
+    def get_shared_key(self, formula):
+        if is_atomic(formula.formula):
+            return formula.symbol.id
+        return (type(formula.formula).__name__,) + tuple(id(child) for child in formula.children)
+
+    def finish_edit(self, removed, added, shrunk=True):
+        """
+        Unset what depended on the removed formulas (and with search, every guess), then propagate from whatever
+        was unset or added until the table is back at a fixed point
+        :param removed: see detach_formula
+        :param added: the nodes added
+        :param shrunk: whether a formula was taken out, even if nothing had to be unset for it
+        :return:
+        """
+        self.stale = True
+        self.countermodel = None
+        self.partial_assignment = None
+        self.budget_exceeded = None
+        if self.contradiction and not shrunk:
+            # more premises can't get rid of a contradiction, the new formulas are propagated if it ever goes
+            self.cursor = None
+            return
+
+        if self.search_enabled:
+            self.learnt_clauses = []
+            self.watches = defaultdict(list)
+            self.unit_clauses = []
+        if self.contradiction:
+            # propagating stopped part way through when the contradiction was found, so start again from the
+            # premises, without building anything again
+            self.contradiction = False
+            self.contradiction_formula = None
+            self.contradiction_parent = None
+            self.compact_trail()
+            self.undo(0, self.count)
+            unset = []
+            symbols = []
+            added = self.nodes
+        else:
+            unset, symbols = self.retract(removed)
+        for formula in unset:
+            if formula.index is not None:
+                self.queue_formula(formula)
+                for parent in formula.parents:
+                    self.queue_formula(parent)
+        for formula in added:
+            self.queue_formula(formula)
+
+        try:
+            try:
+                # anything still set forces the same truth values onto what was unset as it did before, which
+                # has to happen before anything else can set them the other way without it being noticed
+                for symbol in symbols:
+                    self.restore_symbol(symbol)
+                for formula in unset:
+                    if formula.index is not None:
+                        self.evaluate_node(formula)
+                # and so do the formulas that new ones were built on top of, children first
+                for formula in reversed(added):
+                    self.evaluate_node(formula)
+                for formula in self.formulas:
+                    self.set_truth_value(formula, True)
+                self.propagate()
+            except FormulaException as e:
+                self.set_contradiction(e)
+            if self.search_enabled and not self.contradiction:
+                self.compact_trail()
+                self.search()
+        except BudgetExceeded as e:
+            self.budget_exceeded = e.reason
+        finally:
+            self.clear_queue()
+            self.cursor = None
+
+        self.unfulled_symbols = []
+        if not self.contradiction:
+            for symbol in self.symbols:
+                if symbol.truth_value is None:
+                    self.unfulled_symbols.append(symbol)
+            if self.search_enabled and self.budget_exceeded is None and len(self.unfulled_symbols) == 0:
+                self.countermodel = self.get_countermodel()
+        if self.budget_exceeded is not None:
+            self.partial_assignment = OrderedDict()
+            for symbol in self.symbols:
+                if symbol.truth_value is not None:
+                    self.partial_assignment[str(symbol.symbol)] = symbol.truth_value
+
+    def retract(self, removed):
+        """
+        Unset the removed formulas and everything whose truth value was forced using one of them, along with
+        every guess made while searching and what followed from them
+        :param removed:
+        :type removed: List[ShortTruthTableFormula]
+        :return: the formulas unset, in the order they had been set, and the symbols unset
+        :rtype: (List[ShortTruthTableFormula], List[ShortTruthTableSymbol])
+        """
+        dead = []
+        seen = set()
+        stack = []
+        for formula in removed:
+            if formula.truth_value is not None and id(formula) not in seen:
+                seen.add(id(formula))
+                stack.append(formula)
+        if self.search_enabled:
+            for formula in self.trail:
+                if formula is not None and id(formula) not in seen and \
+                        (formula.reason is DECISION or isinstance(formula.reason, list)):
+                    seen.add(id(formula))
+                    stack.append(formula)
+
+        # only the neighbours of a formula can have used it, so follow them rather than the whole trail
+        while len(stack) > 0:
+            formula = stack.pop()
+            dead.append(formula)
+            candidates = list(formula.children) + list(formula.parents)
+            for parent in formula.parents:
+                candidates.extend(parent.children)
+            if formula.symbol is not None and formula.symbol.formula is formula:
+                candidates.extend(formula.symbol.occurrences)
+            for candidate in candidates:
+                if candidate.truth_value is None or id(candidate) in seen or \
+                        candidate.trail_index < formula.trail_index:
+                    continue
+                antecedents = self.get_antecedents(candidate, candidate.reason)
+                if any(antecedent is formula for antecedent in antecedents):
+                    seen.add(id(candidate))
+                    stack.append(candidate)
+
+        dead.sort(key=lambda formula: formula.trail_index)
+        symbols = []
+        for formula in dead:
+            symbol = formula.symbol
+            if symbol is not None and symbol.formula is formula:
+                symbol.formula = None
+                symbol.truth_value = None
+                symbol.number = None
+                symbols.append(symbol)
+            self.trail[formula.trail_index] = None
+            self.trail_holes += 1
+            formula.unset_truth_value()
+        if self.trail_holes * 2 > len(self.trail):
+            self.compact_trail()
+        return dead, symbols
+
+    def restore_symbol(self, symbol):
+        """
+        Set a symbol that was unset again from the first of its occurrences that is still set, if there is one
+        :param symbol:
+        :type symbol: ShortTruthTableSymbol
+        :return:
+        """
+        first = None
+        for formula in symbol.occurrences:
+            if formula.truth_value is not None and (first is None or formula.trail_index < first.trail_index):
+                first = formula
+        if first is None or symbol.truth_value is not None:
+            return
+        symbol.set_truth_value(first, first.number)
+        for formula in symbol.occurrences:
+            self.set_truth_value(formula, symbol.truth_value, symbol)
+
+    def compact_trail(self):
+        """
+        Close up the entries of the trail that were unset by edits
+        :return:
+        """
+        self.trail = [formula for formula in self.trail if formula is not None]
+        for i in range(len(self.trail)):
+            self.trail[i].trail_index = i
+        self.trail_holes = 0
+        # the watches are brought up to date from the start again, which finds nothing new for what they've seen
+        self.clause_head = 0
+
+
+def main(argv=None):
+    """
+    Run the command line, solving the argument given (or the --jsonl lines) and printing the outcome
+    :param argv: the arguments, by default sys.argv
+    :return: the exit status
+    """
+    parser = argparse.ArgumentParser(prog="shorttruthtables.py",
+                                     description="Generate Truth Table for a logical formula")
+    # the goal is the last formula, it can't be a positional of its own as it is left out with --jsonl
+    parser.add_argument('formulas', metavar='formula', type=str, nargs="*",
+                        help='Logical formulas, followed by the goal formula')
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE, help='Propagation engine')
+    parser.add_argument('--share', action='store_true', help='Solve repeated subformulas only once')
+    parser.add_argument('--search', action='store_true', help='Branch on symbols if the table gets stuck')
+    parser.add_argument('--compact', action='store_true', help='Store the table in flat arrays (worklist only)')
+    parser.add_argument('--preprocess', action='store_true', help='Simplify the argument before solving it')
+    parser.add_argument('--no-flatten', action='store_true',
+                        help='Solve and/or nested inside another and/or as they are, rather than merging them')
+    parser.add_argument('--jsonl', metavar='FILE', nargs="?", const="-",
+                        help='Solve {"premises": [...], "goal": "..."} lines from FILE (default stdin) instead, '
+                             'writing a line of JSON for each result')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for --jsonl or --verify (default one per core, 0 for none)')
+    parser.add_argument('--timeout', type=float, default=None, help='Seconds each --jsonl argument may take')
+    parser.add_argument('--unordered', action='store_true',
+                        help='Write --jsonl results as they finish instead of in input order')
+    parser.add_argument('--verify', action='store_true',
+                        help='Check the verdict against the full truth table (needs numpy)')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Have the solver daemon solve it, starting one if none is running (not for --jsonl)')
+    parser.add_argument('--serve-daemon', action='store_true',
+                        help='Run the solver daemon, answering --daemon runs until it has been idle a while')
+    parser.add_argument('--socket', default=None,
+                        help='Unix socket of the solver daemon (default $STT_SOCKET, or one in the temp directory)')
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help='Seconds the solver daemon may go without a run before it stops (default 600)')
+    parser.add_argument('--daemon-workers', type=int, default=None,
+                        help='Solver processes of the daemon (default one per core)')
+    args = parser.parse_args(argv)
+    if args.serve_daemon:
+        import solverdaemon
+        # solve something first so the forked solver processes start out warm
+        runner(["if(A, B)", "A"], "B")
+        solverdaemon.serve(main, args.socket, args.daemon_workers, args.idle_timeout)
+        return 0
+    if args.jsonl is not None:
+        if len(args.formulas) > 0:
+            parser.error("formulas cannot be given with --jsonl")
+        if args.compact:
+            options = {"compact": True}
+        else:
+            options = {"engine": args.engine, "share_subformulas": args.share, "search": args.search}
+        options["preprocess"] = args.preprocess
+        options["flatten"] = not args.no_flatten
+        if args.jsonl == "-":
+            source = sys.stdin
+        else:
+            source = io.open(args.jsonl, encoding="utf-8")
+        with source:
+            solve_stream(source, sys.stdout, workers=args.workers, timeout=args.timeout,
+                         ordered=not args.unordered, **options)
+        return 0
+    if len(args.formulas) == 0:
+        parser.error("the following arguments are required: goal")
+    args.goal = args.formulas.pop()
+    if args.compact:
+        table = runner(args.formulas, args.goal, compact=True, preprocess=args.preprocess,
+                       flatten=not args.no_flatten)
+    else:
+        table = runner(args.formulas, args.goal, engine=args.engine, share_subformulas=args.share,
+                       search=args.search, preprocess=args.preprocess, flatten=not args.no_flatten)
+    if table.contradiction:
+        print("Contradiction trying to set " + str(table.contradiction_formula) + " as " +
+              str(not table.contradiction_formula.truth_value) + " on step " + str(table.count))
     else:
-        print("No contradiction found. Invalid argument.")
\ No newline at end of file
+        print("No contradiction found. Invalid argument.")
+    if table.countermodel is not None:
+        print("Countermodel: " + ", ".join(symbol + " = " + str(table.countermodel[symbol])
+                                           for symbol in table.countermodel))
+    if args.preprocess:
+        print("Preprocessing: " + ", ".join(stat + " = " + str(getattr(table.preprocessing, stat))
+                                            for stat in ("removed_nodes", "dropped_premises", "seconds")))
+    if args.search and not args.compact:
+        print("Search: " + ", ".join(stat + " = " + str(table.search_stats[stat])
+                                     for stat in sorted(table.search_stats)))
+    if args.verify:
+        from verify import verify_table
+        verified = verify_table(table, workers=args.workers)
+        print("Full truth table (" + str(verified["rows"]) + " rows): " +
+              ("valid" if verified["valid"] else "invalid"))
+        if verified["countermodel"] is not None:
+            print("First countermodel: " + ", ".join(symbol + " = " + str(verified["countermodel"][symbol])
+                                                    for symbol in verified["countermodel"]))
+        if verified["disagrees"]:
+            print("The short truth table disagrees with the full truth table" +
+                  (", it was left with symbols unset" if verified["undecided"] else ""))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
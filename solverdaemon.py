@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Solver daemon, for running the command line many times without paying for starting python and importing the
+solver every time. The daemon keeps solver processes forked from one warm process listening on a Unix socket,
+each keeping its own parse cache between runs, and stops once no run has come in for its idle timeout:
+
+    python shorttruthtables.py --serve-daemon --idle-timeout 60
+    python shorttruthtables.py --daemon "if(A, B)" "A" "B"
+
+The client (--daemon) only imports the standard library. It sends the rest of its arguments to the daemon and
+prints what the run printed, exiting with its status, and starts a daemon in the background if none is running
+"""
+
+from __future__ import unicode_literals
+import io
+import json
+import os
+import socket
+import sys
+import time
+
+# seconds the daemon goes on after its last run, unless told otherwise
+IDLE_TIMEOUT = 600.0
+# seconds a client waits for a daemon it started to start listening, before running here instead
+START_TIMEOUT = 10.0
+# options of the client itself, with whether they take a value, which aren't passed on to the daemon
+CLIENT_OPTIONS = {"--daemon": False, "--socket": True, "--idle-timeout": True, "--daemon-workers": True}
+# options that are run by the client itself rather than the daemon, --jsonl streams from the client's stdin
+LOCAL_OPTIONS = ("--jsonl", "--serve-daemon")
+
+
+def get_socket_path(path=None):
+    """
+    Get the socket to use, the one given, $STT_SOCKET or one for this user in the temp directory
+    :param path:
+    :return:
+    """
+    if path is not None:
+        return path
+    if "STT_SOCKET" in os.environ:
+        return os.environ["STT_SOCKET"]
+    return os.path.join(os.environ.get("TMPDIR", "/tmp"), "stt-" + str(os.getuid()) + ".sock")
+
+
+def split_arguments(argv):
+    """
+    Separate the client's own options from the arguments of the run
+    :param argv:
+    :return: the client's options (name: value, True for flags) and the arguments for the daemon
+    """
+    options = {}
+    forwarded = []
+    i = 0
+    while i < len(argv):
+        name, _, value = argv[i].partition("=")
+        if name in CLIENT_OPTIONS and CLIENT_OPTIONS[name] and "=" not in argv[i] and i + 1 < len(argv):
+            options[name] = argv[i + 1]
+            i += 1
+        elif name in CLIENT_OPTIONS:
+            options[name] = value if CLIENT_OPTIONS[name] else True
+        else:
+            forwarded.append(argv[i])
+        i += 1
+    return options, forwarded
+
+
+def connect(path):
+    """
+    Connect to the daemon listening on the given socket
+    :param path:
+    :return: the connection, None if no daemon is listening there
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except (IOError, OSError):
+        connection.close()
+        return None
+    return connection
+
+
+def start_daemon(path, options):
+    """
+    Start a daemon in the background for the client, and wait for it to start listening
+    :param path:
+    :param options: the client's options, their --idle-timeout and --daemon-workers are passed on
+    :return: a connection to it, None if it didn't start in time
+    """
+    import subprocess
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "shorttruthtables.py"),
+               "--serve-daemon", "--socket", path]
+    for name in ("--idle-timeout", "--daemon-workers"):
+        if name in options:
+            command.extend([name, options[name]])
+    with io.open(os.devnull, "r+b") as devnull:
+        daemon = subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True,
+                                  start_new_session=True)
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        connection = connect(path)
+        if connection is not None:
+            return connection
+        # it exits cleanly when another client's daemon got the socket first, which is still to be waited for
+        if daemon.poll() not in (None, 0):
+            return None
+        time.sleep(0.02)
+    return None
+
+
+def run_client(argv):
+    """
+    Have the daemon do a run of the command line, printing what it printed
+    :param argv: the command line arguments, with the client's own options
+    :return: the run's exit status, None if it has to be run here instead (for --jsonl, or no daemon could be
+             started)
+    """
+    options, forwarded = split_arguments(argv)
+    if any(argument.partition("=")[0] in LOCAL_OPTIONS for argument in forwarded):
+        return None
+    path = get_socket_path(options.get("--socket"))
+    connection = connect(path)
+    if connection is None:
+        connection = start_daemon(path, options)
+        if connection is None:
+            return None
+    with connection:
+        connection.sendall(json.dumps({"argv": forwarded}).encode("utf-8") + b"\n")
+        connection.shutdown(socket.SHUT_WR)
+        reply = receive(connection)
+    if reply is None:
+        # the daemon went away mid run, most likely stopping as it had been idle
+        return None
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    return reply["status"]
+
+
+def receive(connection):
+    """
+    Read everything sent on a connection, a single JSON object
+    :param connection:
+    :return: the object, None if the connection closed before it was complete
+    """
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if len(chunk) == 0:
+            break
+        chunks.append(chunk)
+    try:
+        return json.loads(b"".join(chunks).decode("utf-8"))
+    except ValueError:
+        return None
+
+
+def run_captured(handler, argv):
+    """
+    Do a run of the command line, capturing what it prints
+    :param handler: the command line's main, taking the arguments and giving the exit status
+    :param argv:
+    :return: {"status": ..., "stdout": ..., "stderr": ...}
+    """
+    from contextlib import redirect_stdout, redirect_stderr
+    import traceback
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            status = handler(argv)
+        except SystemExit as exception:
+            # argparse exits on bad arguments and --help
+            status = exception.code
+            if status is not None and not isinstance(status, int):
+                stderr.write(str(status) + "\n")
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+    return {"status": status or 0, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+def serve_connections(listener, handler, last_run, running):
+    """
+    Answer runs from the listening socket one at a time, in one of the daemon's solver processes
+    :param listener:
+    :param handler: see run_captured
+    :param last_run: shared time the last run finished
+    :param running: shared count of runs going on
+    """
+    import signal
+    # the daemon's own SIGTERM handler exits by raising SystemExit, which a run would catch
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        while True:
+            connection, _ = listener.accept()
+            with running.get_lock():
+                running.value += 1
+            try:
+                with connection:
+                    request = receive(connection)
+                    if request is not None:
+                        connection.sendall(json.dumps(run_captured(handler, request["argv"])).encode("utf-8"))
+            except (IOError, OSError):
+                # the client went away
+                pass
+            finally:
+                last_run.value = time.time()
+                with running.get_lock():
+                    running.value -= 1
+    except KeyboardInterrupt:
+        pass
+
+
+def serve(handler, path=None, workers=None, idle_timeout=None):
+    """
+    Run the daemon until it has been idle for idle_timeout seconds (or is stopped with SIGTERM). Only one daemon
+    runs on a socket, this returns straight away if there already is one
+    :param handler: the command line's main, see run_captured. It is called in processes forked from this one,
+                    so whatever has already been imported and cached here is there from the first run
+    :param path: socket to listen on, see get_socket_path
+    :param workers: solver processes, by default one per core
+    :param idle_timeout: seconds without a run before stopping, by default IDLE_TIMEOUT
+    """
+    import fcntl
+    import multiprocessing
+    import signal
+    path = get_socket_path(path)
+    workers = workers or os.cpu_count() or 1
+    idle_timeout = IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+
+    # held for as long as the daemon runs, so that two started at once can't both take the socket. Opened without
+    # truncating or following a symlink, so that it can't be used to clobber another file
+    lock = os.open(path + ".lock", os.O_WRONLY | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        os.close(lock)
+        return
+    context = multiprocessing.get_context("fork")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    processes = []
+    try:
+        if os.path.exists(path):
+            # left over from a daemon that didn't get to clean up
+            os.unlink(path)
+        # the socket is created only usable by this user, rather than changed to be after it is bound
+        umask = os.umask(0o077)
+        try:
+            listener.bind(path)
+        finally:
+            os.umask(umask)
+        listener.listen(128)
+        last_run = context.Value("d", time.time(), lock=False)
+        running = context.Value("i", 0)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        while True:
+            # replace solver processes that died
+            processes = [process for process in processes if process.is_alive()]
+            while len(processes) < workers:
+                process = context.Process(target=serve_connections, args=(listener, handler, last_run, running))
+                process.start()
+                processes.append(process)
+            if running.value == 0 and time.time() - last_run.value > idle_timeout:
+                break
+            time.sleep(min(1.0, idle_timeout / 2))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # stop taking connections before the solver processes go, so clients start a new daemon instead
+        if os.path.exists(path):
+            os.unlink(path)
+        listener.close()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        os.close(lock)
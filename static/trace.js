@@ -0,0 +1,130 @@
+/*
+ * Draws a Short Truth Table from the trace the server sends (see shorttruthtables.get_trace), with controls to
+ * step through the order the truth values were set in without going back to the server.
+ */
+
+function escapeHtml(text) {
+    return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}
+
+function truthSpan(value, step) {
+    if (value) {
+        return "<span class='truth' style='color: green;' id='" + step + "'>T</span>";
+    }
+    return "<span class='truth' style='color: red;' id='" + step + "'>F</span>";
+}
+
+// the pretty printed formula, with the nodes in the path from the contradiction up to the formula highlighted
+function renderFormula(formula, path) {
+    var highlighted = {};
+    for (var i = 0; i < formula.columns.length; i++) {
+        if (path !== null && path.indexOf(formula.nodes[i]) !== -1) {
+            highlighted[formula.columns[i]] = true;
+        }
+    }
+    var parts = [];
+    for (var column = 0; column < formula.text.length; column++) {
+        var character = escapeHtml(formula.text.charAt(column));
+        if (character === ' ') {
+            character = '&nbsp;';
+        }
+        if (highlighted[column]) {
+            parts.push("<span class='path' style='background-color: #ffd54f;'>" + character + "</span>");
+        }
+        else {
+            parts.push(character);
+        }
+    }
+    return parts.join('');
+}
+
+// the truth values set by the given step, each under its connective or atom
+function renderTruths(formula, step) {
+    var parts = [];
+    var last = 0;
+    for (var i = 0; i < formula.columns.length; i++) {
+        parts.push(new Array(formula.columns[i] - last + 1).join('&nbsp;'));
+        var value = formula.values === null ? [null, null] : formula.values[i];
+        if (value[0] !== null && value[1] <= step) {
+            parts.push(truthSpan(value[0], value[1]));
+        }
+        else {
+            parts.push('&nbsp;');
+        }
+        last = formula.columns[i] + 1;
+    }
+    parts.push(new Array(Math.max(formula.text.length - last, 0) + 1).join('&nbsp;'));
+    return parts.join('');
+}
+
+function renderOutcome(trace) {
+    if (trace.contradiction) {
+        var path = trace.contradiction_path;
+        var tried = path.truth_value ? "<span style='color: red;'>False</span>" :
+            "<span style='color: green;'>True</span>";
+        var already = path.truth_value ? "<span style='color: green;'>True</span>" :
+            "<span style='color: red;'>False</span>";
+        return 'Contradiction found on trying step ' + trace.step + ' for ' +
+            escapeHtml(trace.formulas[path.root].text) + ' when trying to set ' + escapeHtml(path.formula) +
+            ' to ' + tried + ' as it was already ' + already;
+    }
+    if (trace.unassigned.length === 0) {
+        return 'No contradiction was found. Argument is invalid!';
+    }
+    var symbols = [];
+    for (var i = 0; i < trace.unassigned.length; i++) {
+        symbols.push(escapeHtml(trace.unassigned[i]) + '<br />');
+    }
+    return 'Short Truth Table method has gotten stuck! Cannot proceed forward. Use a truth tree or guess values ' +
+        'for:<br />' + symbols.join('');
+}
+
+function renderTrace(container, trace) {
+    var last = 0;
+    for (var i = 0; i < trace.formulas.length; i++) {
+        var values = trace.formulas[i].values || [];
+        for (var j = 0; j < values.length; j++) {
+            if (values[j][1] !== null && values[j][1] > last) {
+                last = values[j][1];
+            }
+        }
+    }
+
+    var outcome = $('<div>').html(renderOutcome(trace));
+    var slider = $("<input type='range' min='0' style='width: 300px; vertical-align: middle;'>")
+        .attr('max', last).val(last);
+    var label = $('<span>');
+    var controls = $('<div>').append('Step: ', $("<button type='button'>&lt;</button>"), ' ', slider, ' ',
+        $("<button type='button'>&gt;</button>"), ' ', label);
+    var rows = [];
+    container.empty().append(outcome, '<br />', controls, '<br />');
+    for (i = 0; i < trace.formulas.length; i++) {
+        var text = $('<span>');
+        var truths = $('<span>');
+        rows.push([text, truths]);
+        container.append($("<div class='formula'>").append(text, '<br />', truths), '<br />');
+    }
+
+    function show(step) {
+        slider.val(step);
+        label.text(step + ' of ' + last);
+        // the contradiction is only reached once every step before it has been taken
+        var path = trace.contradiction && step === last ? trace.contradiction_path : null;
+        for (var i = 0; i < trace.formulas.length; i++) {
+            var highlight = path !== null && path.root === i ? path.nodes : null;
+            rows[i][0].html(renderFormula(trace.formulas[i], highlight));
+            rows[i][1].html(renderTruths(trace.formulas[i], step));
+        }
+    }
+
+    slider.on('input change', function() {
+        show(parseInt(slider.val(), 10));
+    });
+    controls.find('button').first().on('click', function() {
+        show(Math.max(parseInt(slider.val(), 10) - 1, 0));
+    });
+    controls.find('button').last().on('click', function() {
+        show(Math.min(parseInt(slider.val(), 10) + 1, last));
+    });
+    show(last);
+}
@@ -0,0 +1,552 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for shorttruthtables, run with python -m unittest
+"""
+
+from __future__ import unicode_literals
+import io
+import itertools
+import json
+import os
+import random
+import re
+import unittest
+import shorttruthtables
+
+
+# arguments that each go through one of the iff upward, or downward and if downward rules, with the steps, verdict
+# and truth values their tables are solved with
+PROPAGATION_TABLES = [
+    # iff upward once both children are set, rather than as soon as one is
+    ((["iff(A, B)"], "A"), 6, False, [[[False, 4], [True, 1], [False, 5]], [[True, 2], [False, 3]]]),
+    ((["C"], "iff(A, C)"), 6, False, [[[True, 1]], [[True, 3], [False, 5], [False, 4], [True, 2]]]),
+    # or downward, a true or with a false child
+    ((["or(B, C)"], "B"), 6, False, [[[False, 4], [True, 1], [True, 5]], [[True, 2], [False, 3]]]),
+    # if downward, which the sweep engine has to count as a change to sweep again
+    ((["and(if(A, C), if(C, B))"], "B"), 10, False,
+     [[[False, 9], [True, 3], [False, 8], [True, 1], [False, 7], [True, 4], [False, 6]], [[True, 2], [False, 5]]]),
+]
+
+
+# arguments with and/or nested in and/or, with the steps, verdict and truth values a table gave for them before
+# and/or were flattened
+UNFLATTENED_TABLES = [
+    ((["and(and(A, B), C)"], "C"), 6, True,
+     [[[None, None], [True, 3], [None, None], [True, 1], [True, 4]], [[True, 2], [True, 5]]]),
+    ((["or(or(A, B), C)", "not(A)", "not(B)"], "C"), 12, True,
+     [[[False, 6], [False, 9], [False, 8], [True, 1], [False, 11]], [[True, 2], [False, 5]], [[True, 3], [False, 7]],
+      [[True, 4], [False, 10]]]),
+    ((["if(and(A, and(B, C)), D)", "A", "B", "C"], "D"), 13, True,
+     [[[True, 3], [True, 9], [True, 5], [True, 8], [True, 7], [True, 1], [True, 11]], [[True, 2]], [[True, 4]],
+      [[True, 6]], [[True, 10], [True, 12]]]),
+    ((["or(A, or(B, C))"], "A"), 6, False,
+     [[[False, 4], [True, 1], [None, None], [True, 5], [None, None]], [[True, 2], [False, 3]]]),
+]
+
+
+def random_formula(generator, depth):
+    if depth == 0 or generator.random() < 0.25:
+        return generator.choice("ABCD")
+    connective = generator.choice(["not", "and", "or", "if", "iff"])
+    if connective == "not":
+        return "not(" + random_formula(generator, depth - 1) + ")"
+    return connective + "(" + random_formula(generator, depth - 1) + ", " + random_formula(generator, depth - 1) + ")"
+
+
+def random_arguments(count, seed=0):
+    """
+    Small random arguments over A, B, C and D, as (premises, goal) in the functional format
+    """
+    generator = random.Random(seed)
+    arguments = []
+    for _ in range(count):
+        premises = [random_formula(generator, 3) for _ in range(generator.randint(1, 3))]
+        arguments.append((premises, random_formula(generator, 2)))
+    return arguments
+
+
+def brute_force_countermodels(premises, goal):
+    """
+    Every assignment of the argument's symbols that makes the premises true and the goal false, found by going
+    through the whole truth table
+    :return: list of {symbol: truth value}
+    """
+    formulas, goal = shorttruthtables.parse_argument(premises, goal)
+    symbols = []
+    stack = formulas + [goal]
+    while len(stack) > 0:
+        formula = stack.pop()
+        if shorttruthtables.is_atomic(formula):
+            if formula not in symbols:
+                symbols.append(formula)
+        else:
+            stack.extend(formula.args)
+    countermodels = []
+    for row in itertools.product([True, False], repeat=len(symbols)):
+        values = dict((shorttruthtables.symbol_key(symbols[i]), row[i]) for i in range(len(symbols)))
+        if all(shorttruthtables.evaluate(formula, values) for formula in formulas) and \
+                not shorttruthtables.evaluate(goal, values):
+            countermodels.append(dict((str(symbols[i]), row[i]) for i in range(len(symbols))))
+    return countermodels
+
+
+def get_values(table):
+    return table.count, table.contradiction, [formula.get_connective_values() for formula in table.formulas]
+
+
+def if_chain(size):
+    """
+    if(A0, A1), ..., if(An-1, An), A0 |- An
+    """
+    return ["if(A%d, A%d)" % (i, i + 1) for i in range(size)] + ["A0"], "A%d" % size
+
+
+class PropagationTest(unittest.TestCase):
+    def test_rules_set_the_expected_steps(self):
+        for argument, count, contradiction, values in PROPAGATION_TABLES:
+            for engine in shorttruthtables.ENGINES:
+                table = shorttruthtables.runner(*argument, engine=engine)
+                self.assertEqual(table.count, count)
+                self.assertEqual(table.contradiction, contradiction)
+                self.assertEqual([formula.get_connective_values() for formula in table.formulas], values)
+                self.assertEqual(table.unfulled_symbols, [])
+
+
+class SearchTest(unittest.TestCase):
+    def test_search_agrees_with_brute_force(self):
+        for premises, goal in random_arguments(300):
+            countermodels = brute_force_countermodels(premises, goal)
+            for engine in shorttruthtables.ENGINES:
+                table = shorttruthtables.runner(premises, goal, engine=engine, search=True)
+                self.assertEqual(table.contradiction, len(countermodels) == 0)
+                if not table.contradiction:
+                    self.assertIn(dict(table.countermodel), countermodels)
+
+    def test_search_keeps_what_propagation_decides(self):
+        for premises, goal in random_arguments(300, seed=1):
+            for engine in shorttruthtables.ENGINES:
+                table = shorttruthtables.runner(premises, goal, engine=engine)
+                if table.contradiction or len(table.unfulled_symbols) == 0:
+                    self.assertEqual(get_values(shorttruthtables.runner(premises, goal, engine=engine, search=True)),
+                                     get_values(table))
+
+
+def get_symbol_values(table):
+    return dict((str(symbol.symbol), symbol.truth_value) for symbol in table.symbols)
+
+
+class TableStoreTest(unittest.TestCase):
+    def test_compact_tables_match_object_tables(self):
+        for premises, goal in random_arguments(300, seed=2):
+            table = shorttruthtables.runner(premises, goal)
+            compact = shorttruthtables.runner(premises, goal, compact=True)
+            self.assertEqual(get_values(compact), get_values(table))
+            self.assertEqual(get_symbol_values(compact), get_symbol_values(table))
+            self.assertEqual(shorttruthtables.get_result(compact), shorttruthtables.get_result(table))
+
+    def test_shared_tables_match_object_tables(self):
+        for premises, goal in random_arguments(1000, seed=3):
+            table = shorttruthtables.runner(premises, goal)
+            for engine in shorttruthtables.ENGINES:
+                shared = shorttruthtables.runner(premises, goal, engine=engine, share_subformulas=True)
+                # a shared node gets the truth values of every occurrence, so it can work out more than the
+                # object table but never anything else
+                if table.contradiction:
+                    self.assertTrue(shared.contradiction)
+                elif shared.contradiction:
+                    self.assertEqual(brute_force_countermodels(premises, goal), [])
+                else:
+                    values = get_symbol_values(shared)
+                    for symbol, value in get_symbol_values(table).items():
+                        if value is not None:
+                            self.assertEqual(values[symbol], value)
+
+    def test_compact_views_are_made_once(self):
+        table = shorttruthtables.runner(["if(A, B)", "A"], "B", compact=True)
+        self.assertIs(table.formulas, table.formulas)
+        self.assertIs(table.symbols, table.symbols)
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_cached_results_match_direct_solves(self):
+        import resultcache
+        import server
+        cache = server.RESULT_CACHE
+        server.RESULT_CACHE = resultcache.LRUCache(1000)
+        # the same arguments again with other symbol names, which are answered from the cache
+        renames = {"A": "Q", "B": "P", "C": "A", "D": "R"}
+        try:
+            for premises, goal in random_arguments(300, seed=4):
+                for names in (None, renames):
+                    if names is not None:
+                        premises = ["".join(names.get(char, char) for char in premise) for premise in premises]
+                        goal = "".join(names.get(char, char) for char in goal)
+                    formulas, parsed_goal = shorttruthtables.parse_argument(premises, goal)
+                    self.assertEqual(server.solve_argument(formulas, parsed_goal),
+                                     shorttruthtables.get_result(shorttruthtables.solve(formulas, parsed_goal)))
+            self.assertGreater(server.RESULT_CACHE.hits, 0)
+        finally:
+            server.RESULT_CACHE = cache
+
+
+class BatchTest(unittest.TestCase):
+    def test_batches_share_a_process_pool(self):
+        import server
+        workers = server.FLASK_APP.config["BATCH_WORKERS"]
+        server.FLASK_APP.config["BATCH_WORKERS"] = 2
+        arguments = [{"premises": premises, "goal": goal} for premises, goal in random_arguments(20, seed=5)]
+        arguments.insert(3, {"premises": [1], "goal": "A"})
+        try:
+            client = server.FLASK_APP.test_client()
+            response = client.post("/api/batch", json={"arguments": arguments})
+            pool = server.BATCH_POOL
+            self.assertIsNotNone(pool)
+            self.assertEqual(client.post("/api/batch", json={"arguments": arguments[:2]}).status_code, 200)
+            self.assertIs(server.BATCH_POOL, pool)
+        finally:
+            server.FLASK_APP.config["BATCH_WORKERS"] = workers
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()["results"]
+        self.assertEqual([result["index"] for result in results], list(range(len(arguments))))
+        self.assertIn("error", results[3])
+        for i in range(len(arguments)):
+            if i != 3:
+                expected = shorttruthtables.solve_report(arguments[i]["premises"], arguments[i]["goal"])
+                self.assertEqual(results[i]["valid"], expected["valid"])
+                self.assertEqual(results[i]["step"], expected["step"])
+
+
+class StreamTest(unittest.TestCase):
+    def test_bad_lines_only_fail_themselves(self):
+        lines = ['{"premises": [5], "goal": "A"}', '{"premises": ["if(A, B)", "A"], "goal": "B"}', "5",
+                 '{"premises": "and(A", "goal": "A"}', '{"premises": ["A"], "goal": "A"}']
+        destination = io.StringIO()
+        self.assertEqual(shorttruthtables.solve_stream(io.StringIO("\n".join(lines) + "\n"), destination,
+                                                       workers=0), len(lines))
+        reports = [json.loads(line) for line in destination.getvalue().splitlines()]
+        self.assertEqual([report["index"] for report in reports], list(range(len(lines))))
+        self.assertEqual(["error" in report for report in reports], [True, False, True, True, False])
+        self.assertTrue(reports[1]["valid"])
+
+
+class BudgetTest(unittest.TestCase):
+    OPTIONS = ({}, {"engine": "sweep"}, {"search": True}, {"compact": True})
+
+    def test_step_budget_keeps_what_was_set(self):
+        premises, goal = if_chain(2000)
+        for options in self.OPTIONS:
+            table = shorttruthtables.runner(premises, goal, budget=shorttruthtables.Budget(max_steps=3000),
+                                            **options)
+            self.assertEqual(table.budget_exceeded, "steps")
+            self.assertFalse(table.contradiction)
+            self.assertLessEqual(table.count, 3002)
+            # everything set before giving up is what the whole solve sets it to
+            self.assertGreater(len(table.partial_assignment), 0)
+            self.assertTrue(all(table.partial_assignment.values()))
+            result = shorttruthtables.get_result(table)
+            self.assertEqual(result["budget_exceeded"], "steps")
+            self.assertIsNone(shorttruthtables.get_verdict(result))
+
+    def test_node_budget_stops_building(self):
+        premises, goal = if_chain(100)
+        for options in self.OPTIONS:
+            table = shorttruthtables.runner(premises, goal, budget=shorttruthtables.Budget(max_nodes=50), **options)
+            self.assertEqual(table.budget_exceeded, "nodes")
+            self.assertFalse(table.built)
+            self.assertIsNone(shorttruthtables.get_result(table)["formulas"])
+
+    def test_cancelled_and_timed_out(self):
+        premises, goal = if_chain(2000)
+        token = shorttruthtables.CancelToken()
+        token.cancel()
+        for budget, reason in ((shorttruthtables.Budget(token=token), "cancelled"),
+                               (shorttruthtables.Budget(timeout=0), "time")):
+            for options in self.OPTIONS:
+                table = shorttruthtables.runner(premises, goal, budget=budget, **options)
+                self.assertEqual(table.budget_exceeded, reason)
+                self.assertFalse(table.contradiction)
+
+    def test_search_counts_undone_steps(self):
+        # pigeonhole(3) is valid, but only found to be by searching through many conflicts
+        premises = []
+        for pigeon in range(4):
+            premises.append("or(%s)" % ", ".join("P%d%d" % (pigeon, hole) for hole in range(3)))
+        for hole in range(3):
+            for first in range(4):
+                for second in range(first + 1, 4):
+                    premises.append("not(and(P%d%d, P%d%d))" % (first, hole, second, hole))
+        self.assertTrue(shorttruthtables.runner(premises, "Z", search=True).contradiction)
+        table = shorttruthtables.runner(premises, "Z", search=True, budget=shorttruthtables.Budget(max_steps=100))
+        self.assertEqual(table.budget_exceeded, "steps")
+
+
+class EditTest(unittest.TestCase):
+    OPTIONS = ({}, {"engine": "sweep"}, {"share_subformulas": True}, {"search": True})
+
+    def test_edited_tables_match_fresh_tables(self):
+        generator = random.Random(7)
+        for premises, goal in random_arguments(100, seed=8):
+            for options in self.OPTIONS:
+                table = shorttruthtables.runner(premises, goal, **options)
+                premises = list(premises)
+                for _ in range(4):
+                    edit = generator.random()
+                    if edit < 0.4:
+                        premises.append(random_formula(generator, 3))
+                        table.add_premise(shorttruthtables.parse_cached(premises[-1]))
+                    elif edit < 0.7 and len(premises) > 0:
+                        index = generator.randrange(len(premises))
+                        del premises[index]
+                        table.remove_premise(index)
+                    else:
+                        goal = random_formula(generator, 2)
+                        table.replace_goal(shorttruthtables.parse_cached(goal))
+                    fresh = shorttruthtables.runner(premises, goal, **options)
+                    # what the edits work out is right straight away, only the steps wait to be renumbered
+                    self.assertEqual(table.contradiction, fresh.contradiction)
+                    self.assertEqual(sorted(str(symbol.symbol) for symbol in table.unfulled_symbols),
+                                     sorted(str(symbol.symbol) for symbol in fresh.unfulled_symbols))
+                    if not fresh.contradiction and options.get("search"):
+                        # searching from where the edit left off can find another countermodel
+                        self.assertIn(dict(table.countermodel), brute_force_countermodels(premises, goal))
+                    elif not fresh.contradiction:
+                        self.assertEqual(get_symbol_values(table), get_symbol_values(fresh))
+                    if generator.random() < 0.5:
+                        self.assertEqual(shorttruthtables.get_result(table), shorttruthtables.get_result(fresh))
+                        self.assertEqual(get_values(table), get_values(fresh))
+                        self.assertFalse(table.stale)
+
+    def test_edits_are_renumbered_once(self):
+        premises, goal = if_chain(100)
+        table = shorttruthtables.runner(premises[:-1], goal)
+        table.add_premise(shorttruthtables.parse_cached(premises[-1]))
+        table.remove_premise(0)
+        table.add_premise(shorttruthtables.parse_cached(premises[0]))
+        self.assertTrue(table.stale)
+        result = shorttruthtables.get_result(table)
+        self.assertEqual(result, shorttruthtables.get_result(shorttruthtables.runner(premises[1:] + premises[:1],
+                                                                                     goal)))
+        formulas = table.formulas
+        self.assertEqual(shorttruthtables.get_result(table), result)
+        self.assertIs(table.formulas, formulas)
+
+
+class FlattenTest(unittest.TestCase):
+    def test_unflattened_tables_solve_as_before(self):
+        for argument, count, contradiction, values in UNFLATTENED_TABLES:
+            for options in ({}, {"engine": "sweep"}):
+                table = shorttruthtables.runner(*argument, flatten=False, **options)
+                self.assertEqual(table.count, count)
+                self.assertEqual(table.contradiction, contradiction)
+                self.assertEqual([formula.get_connective_values() for formula in table.formulas], values)
+            table = shorttruthtables.runner(*argument, flatten=False, compact=True)
+            self.assertEqual((table.count, table.contradiction), (count, contradiction))
+
+    def test_flattening_merges_nested_and(self):
+        table = shorttruthtables.runner(["and(and(A, B), C)"], "C")
+        self.assertEqual(len(table.formulas[0].children), 3)
+        table = shorttruthtables.runner(["and(and(A, B), C)"], "C", flatten=False)
+        self.assertEqual(len(table.formulas[0].children), 2)
+
+    def test_unflattened_edits_stay_unflattened(self):
+        table = shorttruthtables.runner(["A"], "A", flatten=False)
+        table.add_premise(shorttruthtables.parse_cached("and(and(A, B), C)", False))
+        self.assertEqual(len(table.formulas[1].children), 2)
+        table.renumber()
+        self.assertEqual(len(table.formulas[1].children), 2)
+
+    def test_preprocessing_needs_flattening(self):
+        with self.assertRaises(ValueError):
+            shorttruthtables.runner(["A"], "A", flatten=False, preprocess=True)
+
+
+class ParseCacheTest(unittest.TestCase):
+    def test_big_argument_stays_cached(self):
+        # more formulas and atoms than there used to be room for
+        premises = ["and(A%d, B%d)" % (i, i) for i in range(5000)]
+        shorttruthtables.PARSE_CACHE.clear()
+        evictions = shorttruthtables.PARSE_CACHE.evictions
+        first = shorttruthtables.parse_argument(premises, "not(A8)")
+        second = shorttruthtables.parse_argument(premises, "not(A8)")
+        self.assertTrue(all(a is b for a, b in zip(first[0], second[0])))
+        self.assertEqual(shorttruthtables.PARSE_CACHE.evictions, evictions)
+
+
+class VerifyTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.skipTest("verify needs numpy")
+
+    def test_verify_agrees_with_brute_force(self):
+        from verify import verify_argument
+        for premises, goal in random_arguments(300, seed=5):
+            countermodels = brute_force_countermodels(premises, goal)
+            result = verify_argument(*shorttruthtables.parse_argument(premises, goal))
+            self.assertEqual(result["valid"], len(countermodels) == 0, (premises, goal))
+            if countermodels:
+                self.assertIn(dict(result["countermodel"]), countermodels, (premises, goal))
+
+    def test_tables_agree_with_verify(self):
+        from verify import verify_table
+        for premises, goal in random_arguments(100, seed=6):
+            for options in ({}, {"search": True}, {"compact": True}):
+                result = verify_table(shorttruthtables.runner(premises, goal, **options))
+                # without search, a table left undecided only says invalid for want of a contradiction
+                self.assertFalse(result["disagrees"] and not result["undecided"], (premises, goal, options))
+                if "search" in options:
+                    self.assertFalse(result["undecided"], (premises, goal))
+
+    def test_chunks_find_the_first_row(self):
+        from verify import verify_argument
+        # nine atoms, so more than one word, with the only countermodel (every atom true) in the last row
+        premises = ["if(A%d, A%d)" % (i, i + 1) for i in range(8)] + ["A0"]
+        argument = shorttruthtables.parse_argument(premises, "not(A8)")
+        result = verify_argument(*argument)
+        self.assertEqual(verify_argument(*argument, chunk_words=1), result)
+        self.assertEqual(verify_argument(*argument, workers=2, chunk_words=1), result)
+        self.assertEqual([dict(result["countermodel"])], brute_force_countermodels(premises, "not(A8)"))
+
+
+class CountermodelsTest(unittest.TestCase):
+    def test_countermodels_with_server_options(self):
+        import server
+        solver_options = server.FLASK_APP.config["SOLVER_OPTIONS"]
+        server.FLASK_APP.config["SOLVER_OPTIONS"] = {"preprocess": True, "search": True, "compact": True}
+        try:
+            with server.FLASK_APP.test_request_context():
+                options = server.get_solver_options()
+            countermodels = list(shorttruthtables.countermodels(["or(A, B)"], "A", **options))
+            response = server.FLASK_APP.test_client().post("/api/countermodels",
+                                                           json={"premises": ["or(A, B)"], "goal": "A"})
+        finally:
+            server.FLASK_APP.config["SOLVER_OPTIONS"] = solver_options
+        self.assertEqual(countermodels, [{"A": False, "B": True}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([json.loads(line) for line in response.get_data(as_text=True).splitlines()],
+                         [{"index": 0, "countermodel": {"A": False, "B": True}}])
+
+
+class TraceTest(unittest.TestCase):
+    def test_traces_match_results(self):
+        from forseti.formula import Not
+        for premises, goal in random_arguments(300, seed=7):
+            formulas, parsed_goal = shorttruthtables.parse_argument(premises, goal)
+            result = shorttruthtables.get_result(shorttruthtables.solve(formulas, parsed_goal))
+            trace = shorttruthtables.get_trace(formulas + [Not(parsed_goal)], result)
+            self.assertEqual((trace["step"], trace["contradiction"]), (result["count"], result["contradiction"]))
+            self.assertEqual([formula["values"] for formula in trace["formulas"]], result["formulas"])
+            for formula in trace["formulas"]:
+                self.assertEqual(len(formula["nodes"]), len(formula["values"]))
+                self.assertEqual(formula["parents"].count(None), 1)
+            if trace["valid"] is not None:
+                self.assertEqual(trace["valid"], len(brute_force_countermodels(premises, goal)) == 0)
+            if result["contradiction_formula"] is not None:
+                path = trace["contradiction_path"]
+                formula = trace["formulas"][path["root"]]
+                self.assertEqual(path["nodes"][0], formula["nodes"][result["contradiction_formula"]["position"]])
+                self.assertIsNone(formula["parents"][path["nodes"][-1]])
+
+    def test_trace_api_matches_a_direct_solve(self):
+        import server
+        client = server.FLASK_APP.test_client()
+        query = "/api/trace?premise=if(A,%20B)&premise=A&goal=B"
+        response = client.get(query)
+        self.assertEqual(response.status_code, 200)
+        formulas, goal = server.parse_argument(["if(A, B)", "A"], "B")
+        result = shorttruthtables.get_result(shorttruthtables.solve(formulas, goal, **server.get_solver_options()))
+        expected = server.get_argument_trace(["if(A, B)", "A"], "B", formulas, goal, result)
+        self.assertEqual(response.get_json(), json.loads(json.dumps(expected)))
+        etag = response.headers["ETag"]
+        # the ETag holds however the argument is spaced, and a client that has the trace isn't sent it again
+        self.assertEqual(client.get("/api/trace?premise=if(A,B)&premise=%20A&goal=B").headers["ETag"], etag)
+        self.assertEqual(client.get(query, headers={"If-None-Match": etag}).status_code, 304)
+        self.assertNotEqual(client.get("/api/trace?premise=if(A,%20B)&premise=B&goal=A").headers["ETag"], etag)
+        self.assertNotEqual(client.get("/api/trace?premise=if(P,%20Q)&premise=P&goal=Q").headers["ETag"], etag)
+
+
+class PreprocessTest(unittest.TestCase):
+    def test_preprocessed_results_match_brute_force(self):
+        from forseti.formula import Not
+        for premises, goal in random_arguments(300, seed=8):
+            countermodels = brute_force_countermodels(premises, goal)
+            table = shorttruthtables.runner(premises, goal, preprocess=True, search=True)
+            result = shorttruthtables.get_result(table)
+            self.assertEqual(shorttruthtables.get_verdict(result), len(countermodels) == 0, (premises, goal))
+            # mapped back onto the argument as it was given, position for position
+            table = shorttruthtables.runner(premises, goal)
+            self.assertEqual([len(values) for values in result["formulas"]],
+                             [len(formula.get_connective_values()) for formula in table.formulas])
+            if result["contradiction_formula"] is not None:
+                # the contradiction is at a node of the original that the table set
+                contradiction = result["contradiction_formula"]
+                self.assertIsNotNone(result["formulas"][contradiction["root"]][contradiction["position"]][0])
+                continue
+            self.assertIn(dict(result["countermodel"]), countermodels, (premises, goal))
+            # and whatever the table set holds in the countermodel
+            roots = list(table.basic_formulas) + [Not(table.goal)]
+            values = {}
+            for root in roots:
+                stack = [root]
+                while len(stack) > 0:
+                    formula = stack.pop()
+                    if shorttruthtables.is_atomic(formula):
+                        values[shorttruthtables.symbol_key(formula)] = result["countermodel"][str(formula)]
+                    else:
+                        stack.extend(formula.args)
+            for i in range(len(roots)):
+                for position in range(len(result["formulas"][i])):
+                    truth_value = result["formulas"][i][position][0]
+                    if truth_value is not None:
+                        subformula = shorttruthtables.get_subformula(roots[i], position)
+                        self.assertEqual(shorttruthtables.evaluate(subformula, values), truth_value, (premises, goal))
+
+
+class DaemonTest(unittest.TestCase):
+    def test_daemon_runs_match_local_runs(self):
+        import multiprocessing
+        import shutil
+        import tempfile
+        import time
+        from contextlib import redirect_stdout, redirect_stderr
+        import solverdaemon
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "stt.sock")
+        daemon = multiprocessing.get_context("fork").Process(target=solverdaemon.serve,
+                                                             args=(shorttruthtables.main, path, 1, 60.0))
+        daemon.start()
+        try:
+            deadline = time.time() + solverdaemon.START_TIMEOUT
+            connection = None
+            while connection is None and time.time() < deadline:
+                time.sleep(0.02)
+                connection = solverdaemon.connect(path)
+            self.assertIsNotNone(connection)
+            connection.close()
+            self.assertEqual(os.stat(path).st_mode & 0o077, 0)
+            # a second daemon on the same socket leaves it to the first
+            solverdaemon.serve(shorttruthtables.main, path, 1, 60.0)
+            self.assertIsNotNone(solverdaemon.connect(path))
+            for argv in (["if(A, B)", "A", "B"], ["or(A, B)", "A"], ["--compact", "and(A, not(A))", "B"],
+                         ["if(A, B"]):
+                stdout = io.StringIO()
+                stderr = io.StringIO()
+                with redirect_stdout(stdout), redirect_stderr(stderr):
+                    status = solverdaemon.run_client(["--socket", path] + argv)
+                client = {"status": status, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+                local = solverdaemon.run_captured(shorttruthtables.main, argv)
+                # the contradiction is printed as the object it is, which is at another address in the daemon
+                for run in (client, local):
+                    run["stdout"] = re.sub(" at 0x[0-9a-f]+", "", run["stdout"])
+                self.assertEqual(client, local, argv)
+                self.assertNotEqual(client["stdout"] + client["stderr"], "")
+        finally:
+            daemon.terminate()
+            daemon.join()
+            shutil.rmtree(directory)
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Full truth table check of an argument, to audit the verdict of a Short Truth Table against brute force. Every
+assignment of the atoms is evaluated, 64 rows to a machine word with NumPy, a chunk of words at a time so that the
+memory used stays bounded however many atoms there are. Needs numpy, which the solver itself does not
+"""
+
+from __future__ import unicode_literals
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy
+from compacttables import get_tag, ATOM, NOT, AND, OR, IF, IFF
+from shorttruthtables import is_atomic, symbol_key, evaluate
+
+# most atoms an argument may have, past this there are too many rows to check them all
+MAX_ATOMS = 34
+# bytes the word arrays of one chunk may take up, which decides how many words each chunk is
+CHUNK_MEMORY = 64 * 1024 * 1024
+ALL_ROWS = numpy.uint64(0xFFFFFFFFFFFFFFFF)
+# row r of the table gives atom i the value of bit i of r, so the first six atoms change within each word
+WORD_PATTERNS = [numpy.uint64(pattern) for pattern in (0xAAAAAAAAAAAAAAAA, 0xCCCCCCCCCCCCCCCC, 0xF0F0F0F0F0F0F0F0,
+                                                       0xFF00FF00FF00FF00, 0xFFFF0000FFFF0000, 0xFFFFFFFF00000000)]
+
+
+class CompiledArgument(object):
+    def __init__(self, formulas, goal):
+        """
+        The argument as a list of instructions, one per distinct subformula object, each working on the results
+        of earlier instructions
+        :param formulas:
+        :type formulas: List[Formula]
+        :param goal:
+        :type goal: Formula
+        """
+        # atom i is bit i of the row number
+        self.symbols = []
+        # (tag, operands), the operands of an ATOM being the atom's number
+        self.instructions = []
+        # instruction after which each result is no longer needed, so its words can be dropped
+        self.last_use = []
+        symbol_ids = {}
+        # id of each formula compiled: its instruction
+        compiled = {}
+        roots = []
+        for formula in list(formulas) + [goal]:
+            stack = [(formula, False)]
+            while len(stack) > 0:
+                formula, visited = stack.pop()
+                if id(formula) in compiled:
+                    continue
+                if is_atomic(formula):
+                    key = symbol_key(formula)
+                    if key not in symbol_ids:
+                        symbol_ids[key] = len(self.symbols)
+                        self.symbols.append(formula)
+                    compiled[id(formula)] = self.add_instruction(ATOM, (symbol_ids[key],))
+                elif not visited:
+                    stack.append((formula, True))
+                    for i in range(len(formula.args) - 1, -1, -1):
+                        stack.append((formula.args[i], False))
+                else:
+                    operands = tuple(compiled[id(arg)] for arg in formula.args)
+                    compiled[id(formula)] = self.add_instruction(get_tag(formula), operands)
+            roots.append(compiled[id(formula)])
+        # the premises and goal are needed until the end
+        for root in roots:
+            self.last_use[root] = len(self.instructions)
+        self.premises = roots[:-1]
+        self.goal = roots[-1]
+
+    def add_instruction(self, tag, operands):
+        index = len(self.instructions)
+        self.instructions.append((tag, operands))
+        self.last_use.append(index)
+        if tag != ATOM:
+            for operand in operands:
+                self.last_use[operand] = index
+        return index
+
+
+def evaluate_words(argument, first_word, words):
+    """
+    Evaluate the rows of the given words of the table
+    :param argument:
+    :type argument: CompiledArgument
+    :param first_word:
+    :param words:
+    :return: a word array with the bit of every row where all the premises are true and the goal false set
+    """
+    word_numbers = numpy.arange(first_word, first_word + words, dtype=numpy.uint64)
+    results = [None] * len(argument.instructions)
+    for index in range(len(argument.instructions)):
+        tag, operands = argument.instructions[index]
+        if tag == ATOM:
+            atom = operands[0]
+            if atom < len(WORD_PATTERNS):
+                result = numpy.full(words, WORD_PATTERNS[atom], dtype=numpy.uint64)
+            else:
+                result = ((word_numbers >> numpy.uint64(atom - len(WORD_PATTERNS))) & numpy.uint64(1)) * ALL_ROWS
+        elif tag == NOT:
+            result = ~results[operands[0]]
+        elif tag == AND:
+            result = results[operands[0]].copy()
+            for operand in operands[1:]:
+                result &= results[operand]
+        elif tag == OR:
+            result = results[operands[0]].copy()
+            for operand in operands[1:]:
+                result |= results[operand]
+        elif tag == IF:
+            result = ~results[operands[0]] | results[operands[1]]
+        else:
+            result = ~(results[operands[0]] ^ results[operands[1]])
+        results[index] = result
+        for operand in operands if tag != ATOM else ():
+            if argument.last_use[operand] == index:
+                results[operand] = None
+
+    rows = ~results[argument.goal]
+    for premise in argument.premises:
+        rows &= results[premise]
+    if len(argument.symbols) < len(WORD_PATTERNS):
+        # fewer than 64 rows, the rest of the only word isn't part of the table
+        rows &= numpy.uint64((1 << (1 << len(argument.symbols))) - 1)
+    return rows
+
+
+def find_row(argument, first_word, words):
+    """
+    Find the first row in the given words where all the premises are true and the goal false
+    :param argument:
+    :type argument: CompiledArgument
+    :param first_word:
+    :param words:
+    :return: the row number, None if there isn't one
+    """
+    rows = evaluate_words(argument, first_word, words)
+    found = numpy.flatnonzero(rows)
+    if len(found) == 0:
+        return None
+    word = int(rows[found[0]])
+    return (first_word + int(found[0])) * 64 + (word & -word).bit_length() - 1
+
+
+def verify_argument(formulas, goal, workers=0, chunk_words=None):
+    """
+    Check every row of the full truth table of the argument
+    :param formulas:
+    :type formulas: List[Formula]
+    :param goal:
+    :type goal: Formula
+    :param workers: worker processes to check chunks of rows in, None for one per core, 0 to check them here
+    :param chunk_words: words (of 64 rows) to evaluate at a time, by default as many as fit in CHUNK_MEMORY
+    :return: whether it is valid, the first countermodel (in row order) if not, and how many atoms and rows
+    :rtype: collections.OrderedDict
+    """
+    argument = CompiledArgument(formulas, goal)
+    if len(argument.symbols) > MAX_ATOMS:
+        raise ValueError("Too many atoms to check every row: " + str(len(argument.symbols)))
+    total_words = max(1, (1 << len(argument.symbols)) // 64)
+    if chunk_words is None:
+        chunk_words = max(1, CHUNK_MEMORY // (8 * (len(argument.instructions) + 2)))
+    chunks = [(start, min(chunk_words, total_words - start)) for start in range(0, total_words, chunk_words)]
+
+    row = None
+    if workers == 0 or len(chunks) == 1:
+        for first_word, words in chunks:
+            row = find_row(argument, first_word, words)
+            if row is not None:
+                break
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # chunks are started in order, and a row found in one only counts once every earlier chunk has none
+            window = 2 * workers
+            running = {}
+            finished = {}
+            next_chunk = 0
+            checked = 0
+            while checked < len(chunks):
+                while next_chunk < len(chunks) and len(running) + len(finished) < window:
+                    running[executor.submit(find_row, argument, *chunks[next_chunk])] = next_chunk
+                    next_chunk += 1
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished[running.pop(future)] = future.result()
+                while checked in finished:
+                    row = finished.pop(checked)
+                    checked += 1
+                    if row is not None:
+                        break
+                if row is not None:
+                    for future in running:
+                        future.cancel()
+                    break
+
+    result = OrderedDict()
+    result["valid"] = row is None
+    result["countermodel"] = None
+    if row is not None:
+        result["countermodel"] = OrderedDict()
+        for i in range(len(argument.symbols)):
+            result["countermodel"][str(argument.symbols[i])] = (row >> i) & 1 == 1
+    result["atoms"] = len(argument.symbols)
+    result["rows"] = 1 << len(argument.symbols)
+    return result
+
+
+def verify_table(table, workers=0, chunk_words=None):
+    """
+    Check a solved table's verdict against the full truth table. The table says the argument is valid when it
+    runs into a contradiction, and otherwise that it is invalid, which is only certain once every symbol is set
+    (or search found a countermodel)
+    :param table:
+    :type table: shorttruthtables.ShortTruthTable
+    :param workers: see verify_argument
+    :param chunk_words: see verify_argument
+    :return: verify_argument's result, with whether the table was undecided (no contradiction, but symbols left
+             unset) and whether it disagrees with the full truth table
+    :rtype: collections.OrderedDict
+    """
+    result = verify_argument(table.basic_formulas, table.goal, workers, chunk_words)
+    result["table_valid"] = table.contradiction
+    result["undecided"] = not table.contradiction and len(table.unfulled_symbols) > 0
+    result["disagrees"] = table.contradiction != result["valid"]
+    if table.countermodel is not None:
+        # the countermodel the table found has to actually be one
+        values = {}
+        for formula in [table.goal] + list(table.basic_formulas):
+            stack = [formula]
+            while len(stack) > 0:
+                formula = stack.pop()
+                if is_atomic(formula):
+                    values[symbol_key(formula)] = table.countermodel.get(str(formula), False)
+                else:
+                    stack.extend(formula.args)
+        if not all(evaluate(formula, values) for formula in table.basic_formulas) or evaluate(table.goal, values):
+            result["disagrees"] = True
+    return result